@@ -0,0 +1,256 @@
+# ============================================================================
+# borrowing/bulk.py
+# ============================================================================
+#
+# Bulk actions on borrow requests (BulkActionForm).
+#
+# A selection is processed in one transaction with a fixed number of
+# queries, whatever its size: the requests and their lines are loaded once,
+# stock moves in one UPDATE (inventory.stock.bulk_reserve/bulk_release),
+# status fields are written with bulk_update() and the InventoryTransaction
+# and BorrowRequestHistory rows with bulk_create().  Every selected id gets
+# an entry in the report, whether it succeeded or not.  send_reminder only
+# queues the emails (borrowing.notifications); requests the outbox skips
+# (no email, already reminded today) are reported as failed.
+#
+# mark_returned only takes back the lines a partial return (borrowing.returns)
+# hasn't already handled, and records them as returned in RETURNED_CONDITION.
+
+from collections import defaultdict
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from inventory import holds, stock
+from inventory.models import InventoryTransaction
+from . import notifications, stats
+from .models import BorrowRecord, BorrowRequest, BorrowRequestHistory
+
+# Most requests one bulk action may select
+MAX_BULK_REQUESTS = 500
+
+# action: (statuses it applies to, new status or None, history action)
+BULK_ACTIONS = {
+    'approve': (['submitted', 'pending'], 'approved', 'approved'),
+    'reject': (['submitted', 'pending'], 'rejected', 'rejected'),
+    'mark_borrowed': (['approved'], 'borrowed', 'borrowed'),
+    'mark_returned': (['approved', 'borrowed', 'overdue'], 'returned', 'returned'),
+    'send_reminder': (['approved', 'borrowed', 'overdue'], None, 'reminder_sent'),
+}
+
+DEFAULT_REJECTION_REASON = 'لم يتم تحديد سبب'
+
+# Report messages for reminders the outbox skipped
+REMINDER_SKIPPED = {
+    notifications.NO_EMAIL: 'لا يوجد بريد إلكتروني للطالب.',
+    notifications.ALREADY_QUEUED: 'تم إرسال تذكير لهذا الطلب اليوم.',
+}
+
+# condition_returned of the lines mark_returned puts back on the shelf
+RETURNED_CONDITION = 'good'
+
+
+def result(borrow_request, ok, message=''):
+    return {
+        'id': borrow_request.pk,
+        'ok': ok,
+        'status': borrow_request.status,
+        'message': message,
+    }
+
+
+def inventory_lines(borrow_request):
+    """The request's records that are linked to an inventory part"""
+    return [record for record in borrow_request.records.all() if record.inventory_part_id]
+
+
+def unreturned_lines(borrow_request):
+    """inventory_lines() not yet taken back by a return"""
+    return [record for record in inventory_lines(borrow_request) if not record.condition_returned]
+
+
+def run_bulk_action(action, request_ids, user, notes=''):
+    """Apply action to every request in request_ids, in one transaction
+
+    Returns one {'id', 'ok', 'status', 'message'} entry per requested id, in
+    the order given.
+    """
+    statuses, new_status, history_action = BULK_ACTIONS[action]
+    request_ids = list(dict.fromkeys(request_ids))
+    now = timezone.now()
+
+    with transaction.atomic():
+        requests = BorrowRequest.objects.filter(pk__in=request_ids).order_by('pk')
+        if connections[requests.db].features.has_select_for_update:
+            # Another bulk action or approval on the same rows waits for us
+            requests = requests.select_for_update()
+        requests = {
+            borrow_request.pk: borrow_request
+            for borrow_request in requests.prefetch_related('records')
+        }
+
+        report = {}
+        eligible = []
+        for request_id in request_ids:
+            borrow_request = requests.get(request_id)
+            if borrow_request is None:
+                report[request_id] = {'id': request_id, 'ok': False, 'status': None, 'message': 'الطلب غير موجود.'}
+            elif borrow_request.status not in statuses:
+                report[request_id] = result(borrow_request, False, 'لا يمكن تطبيق هذا الإجراء على حالة الطلب الحالية.')
+            else:
+                eligible.append(borrow_request)
+
+        # Oldest requests get the stock first
+        eligible.sort(key=lambda r: (r.created_at, r.pk))
+        if action == 'approve':
+            done, inventory_transactions = approve_all(eligible, user, report)
+        elif action == 'mark_returned':
+            done, inventory_transactions = return_all(eligible, user, now)
+        elif action == 'send_reminder':
+            done, inventory_transactions = remind_all(eligible, report), []
+        else:
+            done, inventory_transactions = eligible, []
+
+        if new_status:
+            stats.transition([(r.student_id, r.status, new_status) for r in done], now)
+
+        update_fields = ['updated_at']
+        for borrow_request in done:
+            borrow_request.updated_at = now
+            if new_status:
+                borrow_request.status = new_status
+            if action == 'approve':
+                borrow_request.approved_by = user
+                borrow_request.approval_date = now
+            elif action == 'reject':
+                borrow_request.rejection_reason = notes or DEFAULT_REJECTION_REASON
+            elif action == 'mark_borrowed':
+                borrow_request.borrowed_date = now
+            elif action == 'mark_returned':
+                borrow_request.actual_return_date = now
+            report[borrow_request.pk] = result(borrow_request, True)
+
+        update_fields += {
+            'approve': ['status', 'approved_by', 'approval_date'],
+            'reject': ['status', 'rejection_reason'],
+            'mark_borrowed': ['status', 'borrowed_date'],
+            'mark_returned': ['status', 'actual_return_date'],
+            'send_reminder': [],
+        }[action]
+
+        # Approval turns the holds into stock decrements; rejection gives them back
+        if action in ('approve', 'reject'):
+            holds.release([borrow_request.pk for borrow_request in done])
+
+        BorrowRequest.objects.bulk_update(done, update_fields)
+        InventoryTransaction.objects.bulk_create(inventory_transactions)
+        BorrowRequestHistory.objects.bulk_create([
+            BorrowRequestHistory(request=borrow_request, action=history_action, notes=notes, performed_by=user)
+            for borrow_request in done
+        ])
+
+    return [report[request_id] for request_id in request_ids]
+
+
+def approve_all(eligible, user, report):
+    """Allocate stock to requests in order; returns (approved, transactions)
+
+    A request is approved only if every one of its lines fits in what is
+    left once other students' holds are set aside; the stock for all
+    approved requests is then taken in one UPDATE.
+    """
+    part_ids = {record.inventory_part_id for r in eligible for record in inventory_lines(r)}
+    references = [str(borrow_request.pk) for borrow_request in eligible]
+    on_shelf = stock.locked_quantities(part_ids)
+    held = holds.held_quantities(part_ids, reference_ids=references)
+    left = {part_id: quantity - held.get(part_id, 0) for part_id, quantity in on_shelf.items()}
+
+    approved, taken = [], defaultdict(int)
+    for borrow_request in eligible:
+        wanted = defaultdict(int)
+        for record in inventory_lines(borrow_request):
+            wanted[record.inventory_part_id] += record.quantity
+
+        short = next(
+            (record for record in inventory_lines(borrow_request)
+             if left.get(record.inventory_part_id, 0) < wanted[record.inventory_part_id]),
+            None
+        )
+        if short is not None:
+            report[borrow_request.pk] = result(
+                borrow_request, False, f'عذراً، الكمية المطلوبة من {short.part_name} غير متوفرة حالياً'
+            )
+            continue
+
+        for part_id, quantity in wanted.items():
+            left[part_id] -= quantity
+            taken[part_id] += quantity
+        approved.append(borrow_request)
+
+    stock.bulk_reserve(taken, reference_ids=references)
+    return approved, stock_transactions(approved, on_shelf, 'borrow', user, -1)
+
+
+def remind_all(eligible, report):
+    """Queue reminders through the outbox; returns the requests one was queued for
+
+    Delivery sets reminder_sent.  Requests the outbox skipped are reported
+    as failed, with the reason.
+    """
+    outcome = notifications.enqueue([borrow_request.pk for borrow_request in eligible], 'reminder')
+    reminded = []
+    for borrow_request in eligible:
+        skipped = outcome.get(borrow_request.pk)
+        if skipped:
+            report[borrow_request.pk] = result(borrow_request, False, REMINDER_SKIPPED[skipped])
+        else:
+            reminded.append(borrow_request)
+    return reminded
+
+
+def return_all(eligible, user, now):
+    """Put the lines still out back on the shelf; returns (returned, transactions)
+
+    Lines already handled by a partial return (condition_returned set) were
+    restocked or written off then and are left alone.
+    """
+    part_ids = {record.inventory_part_id for r in eligible for record in unreturned_lines(r)}
+    on_shelf = stock.locked_quantities(part_ids, borrowable_only=False)
+
+    returned = defaultdict(int)
+    for borrow_request in eligible:
+        for record in unreturned_lines(borrow_request):
+            returned[record.inventory_part_id] += record.quantity
+
+    stock.bulk_release(returned)
+    inventory_transactions = stock_transactions(eligible, on_shelf, 'return', user, 1)
+
+    records = [record for r in eligible for record in r.records.all() if not record.condition_returned]
+    for record in records:
+        record.condition_returned = RETURNED_CONDITION
+        record.updated_at = now
+    BorrowRecord.objects.bulk_update(records, ['condition_returned', 'updated_at'])
+    return eligible, inventory_transactions
+
+
+def stock_transactions(requests, on_shelf, transaction_type, user, sign):
+    """InventoryTransaction rows for every line still out, with running quantities per part"""
+    on_shelf = dict(on_shelf)
+    rows = []
+    for borrow_request in requests:
+        for record in unreturned_lines(borrow_request):
+            if record.inventory_part_id not in on_shelf:
+                continue  # Part deleted meanwhile
+            previous_quantity = on_shelf[record.inventory_part_id]
+            on_shelf[record.inventory_part_id] = previous_quantity + sign * record.quantity
+            rows.append(InventoryTransaction(
+                part_id=record.inventory_part_id,
+                transaction_type=transaction_type,
+                quantity=sign * record.quantity,
+                previous_quantity=previous_quantity,
+                new_quantity=previous_quantity + sign * record.quantity,
+                performed_by=user,
+                reason=f'Bulk {transaction_type} for borrow request #{borrow_request.id}',
+                reference_id=str(borrow_request.id)
+            ))
+    return rows
@@ -216,19 +216,51 @@ class ReturnItemsForm(forms.Form):
         required=False
     )
 
-    def __init__(self, *args, borrow_request=None, **kwargs):
+    def __init__(self, *args, borrow_request=None, records=None, **kwargs):
         super().__init__(*args, **kwargs)
 
+        # One request's records, or any records across requests (batched returns)
         if borrow_request:
-            # Add condition fields for each record
-            for record in borrow_request.records.all():
-                field_name = f'condition_{record.id}'
-                self.fields[field_name] = forms.ChoiceField(
-                    label=f'{record.part_name} - {_("الحالة")}',
-                    choices=BorrowRecord.CONDITION_CHOICES,
-                    initial='excellent',
-                    widget=forms.Select(attrs={'class': 'form-select'})
-                )
+            records = borrow_request.records.all()
+        self.records = list(records or [])
+
+        # Add condition and damage fields for each record
+        for record in self.records:
+            field_name = f'condition_{record.id}'
+            self.fields[field_name] = forms.ChoiceField(
+                label=f'{record.part_name} - {_("الحالة")}',
+                choices=BorrowRecord.CONDITION_CHOICES,
+                initial='excellent',
+                widget=forms.Select(attrs={'class': 'form-select'})
+            )
+            self.fields[f'damage_{record.id}'] = forms.CharField(
+                label=f'{record.part_name} - {_("وصف الضرر")}',
+                widget=forms.TextInput(attrs={'class': 'form-control'}),
+                required=False
+            )
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        if not self.records:
+            raise ValidationError(_('يرجى تحديد عنصر واحد على الأقل.'))
+
+        for record in self.records:
+            condition = cleaned_data.get(f'condition_{record.id}')
+            if condition in ('damaged', 'missing') and not cleaned_data.get(f'damage_{record.id}'):
+                self.add_error(f'damage_{record.id}', _('يرجى وصف الضرر أو الفقد.'))
+
+        return cleaned_data
+
+    def returned_lines(self):
+        """{record_id: (condition, damage_description)} for borrowing.returns"""
+        return {
+            record.id: (
+                self.cleaned_data[f'condition_{record.id}'],
+                self.cleaned_data[f'damage_{record.id}'],
+            )
+            for record in self.records
+        }
 
 
 class BulkActionForm(forms.Form):
@@ -261,6 +293,26 @@ class BulkActionForm(forms.Form):
         required=False
     )
 
+    def clean_selected_requests(self):
+        """Comma separated request ids -> list of ints"""
+        from .bulk import MAX_BULK_REQUESTS
+
+        value = self.cleaned_data.get('selected_requests', '')
+        try:
+            request_ids = [int(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise ValidationError(_('قائمة الطلبات المحددة غير صالحة.'))
+
+        if not request_ids:
+            raise ValidationError(_('يرجى تحديد طلب واحد على الأقل.'))
+
+        if len(request_ids) > MAX_BULK_REQUESTS:
+            raise ValidationError(
+                _('لا يمكن تحديد أكثر من {} طلب في العملية الواحدة.').format(MAX_BULK_REQUESTS)
+            )
+
+        return request_ids
+
 
 class SearchFilterForm(forms.Form):
     """Form for searching and filtering requests"""
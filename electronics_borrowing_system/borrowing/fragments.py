@@ -0,0 +1,108 @@
+# ============================================================================
+# borrowing/fragments.py
+# ============================================================================
+#
+# Cached dashboard fragments.
+#
+# The data-driven part of the student dashboard is cached per student, and
+# that of the admin dashboard once for all staff, with Django's {% cache %}
+# tag.  Each fragment varies on fragment_version(): the current versions of
+# the cache tags it depends on,
+#
+#     student:<id>   that student's requests   (student dashboard)
+#     staff          any request               (admin dashboard)
+#
+# plus the inventory generation (inventory.catalog) where part counts are
+# shown, and the language.  invalidate() bumps tag versions, which makes
+# every fragment rendered under the old ones unreachable (they expire after
+# FRAGMENT_TIMEOUT), so a change to one student's request re-renders that
+# student's fragment and the staff one, and nobody else's.
+#
+# Tags are bumped on commit by the BorrowRequest/BorrowRecord save and delete
+# handlers in borrowing/models.py, and by stats.transition(), which every
+# set-based status change already calls.  Versions are read before the
+# fragment's data, so a change committed while it renders leaves it under
+# a version that is already out of date.
+#
+# The views pass the fragment data through lazy_context(), so a cached
+# fragment costs no queries at all.
+
+import time
+from functools import partial
+from operator import getitem
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import get_language
+
+FRAGMENT_TIMEOUT = 60 * 60
+
+STAFF_TAG = 'staff'
+
+
+def student_tag(student_id):
+    return f'student:{student_id}'
+
+
+def _tag_key(tag):
+    return f'fragments:tag:{tag}'
+
+
+# Highest tag version this process has read or written
+_last_seen = 0
+
+
+def _initial_version():
+    # From the clock rather than 1, so a version that was evicted never
+    # comes back at a value that old fragments are still cached under
+    return max(int(time.time() * 1000), _last_seen + 1)
+
+
+def _seen(version):
+    global _last_seen
+    _last_seen = max(_last_seen, version)
+    return version
+
+
+def tag_versions(tags):
+    """{tag: current version}, in one cache round trip when all are set"""
+    keys = {_tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, _initial_version(), timeout=None)
+        versions[key] = cache.get(key)
+    return {tag: _seen(versions[key]) for key, tag in keys.items()}
+
+
+def fragment_version(tags, *vary_on):
+    """{% cache %} vary_on value for a fragment depending on tags"""
+    versions = tag_versions(tags)
+    return ':'.join([get_language() or '', *(f'{tag}={versions[tag]}' for tag in tags), *map(str, vary_on)])
+
+
+def invalidate(tags):
+    """Bump the tags' versions, making fragments depending on them stale"""
+    for tag in tags:
+        try:
+            _seen(cache.incr(_tag_key(tag)))
+        except ValueError:
+            # Not set (or evicted): start above anything seen before
+            cache.add(_tag_key(tag), _initial_version(), timeout=None)
+
+
+def invalidate_on_commit(tags):
+    tags = list(tags)
+    # Robust: the change has committed, a cache error is only logged
+    transaction.on_commit(lambda: invalidate(tags), robust=True)
+
+
+def requests_changed(student_ids):
+    """After requests of these students changed: bust their fragments and the staff one"""
+    invalidate_on_commit([STAFF_TAG, *(student_tag(student_id) for student_id in set(student_ids))])
+
+
+def lazy_context(build, names):
+    """{name: lazy value}, all from one build() call made when a value is first used"""
+    data = SimpleLazyObject(build)
+    return {name: SimpleLazyObject(partial(getitem, data, name)) for name in names}
@@ -0,0 +1,113 @@
+# ============================================================================
+# borrowing/idempotency.py
+# ============================================================================
+#
+# Idempotent form POSTs.
+#
+# Forms that change stock (create_request, approve_request) post a client
+# token (TOKEN_FIELD) rendered into the page.  The view claims the token by
+# inserting an IdempotencyKey row at the start of its transaction and stores
+# the outcome in it at the end; a double-click or a mobile retry of the same
+# POST then finds the row and gets the original message and redirect back
+# via replay(), without running the transaction again.
+#
+# Two copies of a POST arriving together both miss replay(); the second
+# one's claim() fails on the (user, scope, key) unique constraint (blocking
+# until the first commits on PostgreSQL) and its transaction rolls back
+# before it touches stock, after which replay() answers it.  Outcomes that
+# roll back (e.g. not enough stock) are not stored, so retrying those runs
+# them again.
+#
+# create_request also uses the token as the new BorrowRequest.uuid.
+#
+# A key only has to outlive the retries of its POST: keys older than KEY_TTL
+# are deleted in batches by the sweep_idempotency_keys command, through the
+# created_at index, so the table stays the size of a few days' traffic.
+
+import logging
+import uuid
+from datetime import timedelta
+
+from django.contrib import messages
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+TOKEN_FIELD = 'idempotency_key'
+
+# How long a spent token is replayed before its key is swept
+KEY_TTL = timedelta(days=7)
+
+# Expired keys deleted per sweeper statement
+SWEEP_BATCH_SIZE = 1000
+
+
+def new_token():
+    """A token to render into a form"""
+    return uuid.uuid4()
+
+
+def client_token(request):
+    """The token posted with the request, or None"""
+    try:
+        return uuid.UUID(request.POST.get(TOKEN_FIELD, ''))
+    except ValueError:
+        return None
+
+
+def replay(request, scope, token, redirect_to):
+    """Redirect with the stored outcome if this token was already spent, else None"""
+    if token is None:
+        return None
+
+    key = (
+        IdempotencyKey.objects.filter(user=request.user, scope=scope, key=token)
+        .exclude(outcome='').first()
+    )
+    if key is None:
+        return None
+
+    logger.info(f"Replaying {scope} for {request.user.username} (key {token})")
+    getattr(messages, key.outcome)(request, key.message)
+    return redirect(redirect_to)
+
+
+def claim(request, scope, token):
+    """Spend the token inside the caller's transaction; IntegrityError if already spent"""
+    if token is None:
+        return None
+    return IdempotencyKey.objects.create(user=request.user, scope=scope, key=token)
+
+
+def respond(request, key, outcome, message, redirect_to, borrow_request=None):
+    """Show message, store it against the claimed key (if any) and redirect"""
+    getattr(messages, outcome)(request, message)
+    if key is not None:
+        key.outcome = outcome
+        key.message = message
+        key.borrow_request = borrow_request
+        key.save(update_fields=['outcome', 'message', 'borrow_request', 'updated_at'])
+    return redirect(redirect_to)
+
+
+def expired(now=None):
+    """Ids of keys older than KEY_TTL, oldest first (the sweeper's batches)"""
+    return (
+        IdempotencyKey.objects.filter(created_at__lte=(now or timezone.now()) - KEY_TTL)
+        .order_by('created_at')
+        .values_list('pk', flat=True)
+    )
+
+
+def sweep(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """Delete expired keys in batches; returns how many were deleted"""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        batch = list(expired(now)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,282 @@
+from dataclasses import dataclass
+from typing import Callable
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from borrowing import overdue, stats, views
+from borrowing.models import BorrowRequest
+from borrowing.seed import seed_requests
+from inventory import holds
+from inventory.autocomplete import AutocompleteIndex
+from inventory.models import Category, ElectronicPart, StockHold
+from inventory.search import facet_rows, rank_by_relevance
+from inventory.seed import seed_catalog
+
+FULL_SCAN = 'full scan'
+TEMP_SORT = 'temp sort'
+
+
+@dataclass
+class AuditQuery:
+    """A hot-path queryset, the index it should use and the plan flags it may show"""
+    name: str
+    build: Callable
+    index: tuple = None
+    allow: tuple = ()
+    reason: str = ''
+
+
+def autocomplete_delta(ctx):
+    index = AutocompleteIndex()
+    index.watermark = timezone.now()
+    return index.changed_queryset()
+
+
+class ExecutedQuery:
+    """Explains the last statement run() executes, for calls like aggregate() that don't return a queryset"""
+
+    def __init__(self, run):
+        self.run = run
+
+    def explain(self):
+        executed = []
+
+        def record(execute, sql, params, many, context):
+            executed.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            self.run()
+        sql, params = executed[-1]
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            # Same flattening as QuerySet.explain()
+            return '\n'.join(
+                ' '.join(map(str, row)) if len(row) > 1 else str(row[0]) for row in cursor.fetchall()
+            )
+
+
+def request_list_stats(ctx):
+    return ExecutedQuery(lambda: views.get_request_list_summary(
+        BorrowRequest.objects.filter(student_id=ctx['student_id'])
+    ))
+
+
+# The querysets behind get_available_parts, inventory_search, parts_catalog, admin_dashboard,
+# request_list, the overdue sweeper, the student counters, the low stock report, stock holds and the
+# autocomplete index
+AUDITED_QUERIES = [
+    AuditQuery(
+        'get_available_parts',
+        lambda ctx: views.get_available_parts(),
+        index=(ElectronicPart, ['status', 'is_active', 'condition', 'available_quantity']),
+        allow=(TEMP_SORT,), reason='ordered by the joined category name',
+    ),
+    AuditQuery(
+        'inventory_search: text page',
+        lambda ctx: rank_by_relevance(views.filter_inventory_parts('ard'), 'ard')[:51],
+        allow=(TEMP_SORT,), reason='relevance is computed per matching row',
+    ),
+    AuditQuery(
+        'inventory_search: category page',
+        lambda ctx: views.filter_inventory_parts('', category_id=ctx['category_id']).order_by(
+            *views.INVENTORY_SEARCH_ORDERING)[:51],
+        index=(ElectronicPart, ['category']),
+        allow=(TEMP_SORT,), reason='ordered by the joined category name',
+    ),
+    AuditQuery(
+        'inventory_search: facets',
+        lambda ctx: facet_rows(views.filter_inventory_parts('ard')),
+        allow=(TEMP_SORT,), reason='GROUP BY over the matching rows',
+    ),
+    AuditQuery(
+        'parts_catalog: category page',
+        lambda ctx: views.get_available_parts().filter(category_id=ctx['category_id']).order_by(
+            *views.INVENTORY_SEARCH_ORDERING)[:views.CATALOG_PAGE_SIZE + 1],
+        index=(ElectronicPart, ['category']),
+        allow=(TEMP_SORT,), reason='ordered by the joined category name',
+    ),
+    AuditQuery(
+        'request_list: page',
+        lambda ctx: BorrowRequest.objects.filter(student_id=ctx['student_id']).order_by(
+            *views.REQUEST_LIST_ORDERING)[:views.REQUESTS_PAGE_SIZE + 1],
+        index=(BorrowRequest, ['student', 'created_at']),
+    ),
+    AuditQuery(
+        'request_list: summary counts',
+        request_list_stats,
+        index=(BorrowRequest, ['student', 'status']),
+    ),
+    AuditQuery(
+        'admin_dashboard: recent requests',
+        lambda ctx: views.get_admin_request_querysets()['all'][:10],
+        index=(BorrowRequest, ['created_at']),
+    ),
+    AuditQuery(
+        'admin_dashboard: pending requests',
+        lambda ctx: views.get_admin_request_querysets()['pending'][:10],
+        index=(BorrowRequest, ['status', 'created_at']),
+        allow=(TEMP_SORT,), reason='newest first across an IN list of statuses',
+    ),
+    AuditQuery(
+        'admin_dashboard: overdue requests',
+        lambda ctx: views.get_admin_request_querysets()['overdue'][:10],
+        index=(BorrowRequest, ['status', 'created_at']),
+    ),
+    AuditQuery(
+        'admin_dashboard: overdue count',
+        lambda ctx: views.get_admin_request_querysets()['overdue'].order_by().values('id'),
+        index=(BorrowRequest, ['status']),
+    ),
+    AuditQuery(
+        'admin_dashboard: counters',
+        lambda ctx: ExecutedQuery(views.get_admin_dashboard_counters),
+        index=(BorrowRequest, ['status']),
+    ),
+    AuditQuery(
+        'mark_overdue: due batch',
+        lambda ctx: overdue.due_requests().order_by('pk').values('pk')[:overdue.BATCH_SIZE],
+        index=(BorrowRequest, ['status', 'expected_return_date']),
+        allow=(TEMP_SORT,), reason='id order across an IN list of statuses',
+    ),
+    AuditQuery(
+        'rebuild_borrow_stats: student batch',
+        lambda ctx: stats.counted_rows([ctx['student_id']]),
+        index=(BorrowRequest, ['student']),
+    ),
+    AuditQuery(
+        'low_stock_report',
+        lambda ctx: ElectronicPart.objects.low_stock(),
+        allow=(FULL_SCAN, TEMP_SORT), reason='compares two columns of the same row',
+    ),
+    AuditQuery(
+        'stock holds: held quantities',
+        lambda ctx: holds.held_rows(ctx['part_ids'], reference_ids=['1']),
+        index=(StockHold, ['part', 'expires_at']),
+    ),
+    AuditQuery(
+        'stock holds: sweep batch',
+        lambda ctx: holds.expired()[:holds.SWEEP_BATCH_SIZE],
+        index=(StockHold, ['expires_at']),
+    ),
+    AuditQuery(
+        'autocomplete: index build',
+        lambda ctx: AutocompleteIndex().queryset(),
+        allow=(FULL_SCAN,), reason='loads the whole active catalog once per worker',
+    ),
+    AuditQuery(
+        'autocomplete: delta refresh',
+        autocomplete_delta,
+        index=(ElectronicPart, ['updated_at']),
+    ),
+]
+
+
+def plan_flags(plan, vendor):
+    """Problems found in an EXPLAIN output, as (flag, detail) pairs"""
+    flags = []
+    for line in plan.splitlines():
+        if vendor == 'sqlite':
+            # "<id> <parent> <notused> <detail>" rows of EXPLAIN QUERY PLAN;
+            # "SCAN t USING INDEX i" walks an index in order and is fine
+            detail = line.split(' ', 3)[-1]
+            if detail.startswith('SCAN ') and ' USING ' not in detail and 'VIRTUAL TABLE' not in detail:
+                flags.append((FULL_SCAN, detail))
+            elif detail.startswith('USE TEMP B-TREE'):
+                flags.append((TEMP_SORT, detail))
+        elif vendor == 'postgresql':
+            detail = line.strip().lstrip('->').strip()
+            if detail.startswith('Seq Scan'):
+                flags.append((FULL_SCAN, detail))
+            elif detail.startswith(('Sort ', 'Incremental Sort ')):
+                flags.append((TEMP_SORT, detail))
+    return flags
+
+
+def has_index(model, fields):
+    """Whether some index on model starts with exactly these fields"""
+    columns = [model._meta.get_field(name).column for name in fields]
+    candidates = [
+        [model._meta.get_field(name.lstrip('-')).column for name in index.fields]
+        for index in model._meta.indexes
+    ]
+    candidates += [
+        [model._meta.get_field(name).column for name in together]
+        for together in model._meta.unique_together
+    ]
+    candidates += [
+        [field.column] for field in model._meta.concrete_fields
+        if field.db_index or field.unique or field.primary_key
+    ]
+    return any(candidate[:len(columns)] == columns for candidate in candidates)
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN the hot-path querysets against a seeded dataset, flag full scans and '
+            'temp sorts, list missing indexes and exit non-zero on problems')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parts', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--no-seed', action='store_true',
+                            help='Audit the current database as it is')
+        parser.add_argument('--plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        # Everything happens in a transaction that is rolled back at the end
+        with transaction.atomic():
+            if not options['no_seed']:
+                seed_catalog(parts=options['parts'])
+                seed_requests(students=options['students'], requests=options['requests'])
+
+            student = BorrowRequest.objects.values_list('student_id', flat=True).first()
+            category = Category.objects.values_list('id', flat=True).first()
+            part_ids = list(ElectronicPart.objects.values_list('id', flat=True)[:20])
+            ctx = {'student_id': student or 0, 'category_id': category or 0, 'part_ids': part_ids}
+
+            problems, missing = self.audit(ctx, options['plans'])
+            transaction.set_rollback(True)
+
+        if missing:
+            self.stdout.write('\nMissing indexes:')
+            for model, fields in missing:
+                self.stdout.write(f'  {model.__name__}: models.Index(fields={fields!r})')
+
+        if problems:
+            raise CommandError(f'{problems} query plan problem(s) found')
+        self.stdout.write(self.style.SUCCESS(f'{len(AUDITED_QUERIES)} queries audited, no problems'))
+
+    def audit(self, ctx, show_plans):
+        problems = 0
+        missing = []
+
+        for audit in AUDITED_QUERIES:
+            plan = audit.build(ctx).explain()
+            issues = []
+
+            for flag, detail in plan_flags(plan, connection.vendor):
+                if flag not in audit.allow:
+                    issues.append(f'{flag}: {detail}')
+
+            if audit.index and not has_index(*audit.index):
+                model, fields = audit.index
+                issues.append(f'missing index {model.__name__}({", ".join(fields)})')
+                if audit.index not in missing:
+                    missing.append(audit.index)
+
+            if issues:
+                problems += len(issues)
+                self.stdout.write(self.style.ERROR(f'FAIL {audit.name}'))
+                for issue in issues:
+                    self.stdout.write(f'     {issue}')
+            else:
+                allowed = f' (allowed: {", ".join(audit.allow)}; {audit.reason})' if audit.allow else ''
+                self.stdout.write(f'ok   {audit.name}{allowed}')
+
+            if show_plans:
+                self.stdout.write('\n'.join(f'       {line}' for line in plan.splitlines()))
+
+        return problems, missing
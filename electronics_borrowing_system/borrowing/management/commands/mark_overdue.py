@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from borrowing import overdue
+
+
+class Command(BaseCommand):
+    help = 'Move requests past their expected return date to overdue (run from cron, or with --interval as a loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=overdue.BATCH_SIZE)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep sweeping every INTERVAL seconds instead of exiting')
+
+    def handle(self, *args, **options):
+        while True:
+            marked = overdue.mark_overdue(batch_size=options['batch_size'])
+            self.stdout.write(f'Marked {marked} request(s) overdue')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from borrowing import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-student request counters (StudentBorrowStats) to repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=stats.REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = stats.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt counters of {written} student(s)')
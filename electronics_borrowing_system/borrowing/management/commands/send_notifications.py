@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from borrowing import notifications
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification emails in batches (run from cron, or with --interval as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=notifications.BATCH_SIZE)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep draining the outbox every INTERVAL seconds instead of exiting')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, attempted = notifications.drain(batch_size=options['batch_size'])
+            self.stdout.write(f'Sent {sent} of {attempted} notification(s)')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
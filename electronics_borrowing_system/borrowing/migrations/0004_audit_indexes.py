@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0003_borrowrequesthistory_borrowrecord_part_number_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['student', 'created_at'], name='borrowing_request_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['status', 'created_at'], name='borrowing_request_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['status', 'expected_return_date'], name='borrowing_request_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['created_at'], name='borrowing_request_created_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0004_audit_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('key', models.UUIDField(verbose_name='Key')),
+                ('scope', models.CharField(max_length=100, verbose_name='Scope')),
+                ('outcome', models.CharField(blank=True, choices=[('success', 'Success'), ('warning', 'Warning'), ('error', 'Error')], max_length=10, verbose_name='Outcome')),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('borrow_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='idempotency_keys', to='borrowing.borrowrequest', verbose_name='Borrow Request')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Idempotency Key',
+                'verbose_name_plural': 'Idempotency Keys',
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'key'), name='borrowing_idempotency_unique')],
+            },
+        ),
+    ]
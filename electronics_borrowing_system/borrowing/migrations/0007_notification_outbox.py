@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0006_system_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('kind', models.CharField(choices=[('reminder', 'Return Reminder'), ('overdue', 'Overdue Notice')], max_length=20, verbose_name='Kind')),
+                ('to_email', models.EmailField(max_length=254, verbose_name='To')),
+                ('subject', models.CharField(max_length=200, verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next Attempt At')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent At')),
+                ('dedup_key', models.CharField(max_length=100, unique=True, verbose_name='Deduplication Key')),
+                ('borrow_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='borrowing.borrowrequest', verbose_name='Borrow Request')),
+            ],
+            options={
+                'verbose_name': 'Notification',
+                'verbose_name_plural': 'Notifications',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='borrowing_notification_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+COUNTED_STATUSES = {
+    'pending': ['submitted', 'pending'],
+    'active': ['approved', 'borrowed', 'overdue'],
+    'overdue': ['overdue'],
+}
+
+
+def fill_stats(apps, schema_editor):
+    """Count the existing requests of every student"""
+    BorrowRequest = apps.get_model('borrowing', 'BorrowRequest')
+    StudentBorrowStats = apps.get_model('borrowing', 'StudentBorrowStats')
+
+    rows = BorrowRequest.objects.order_by().values('student_id').annotate(
+        total=Count('id'),
+        last_request_at=Max('created_at'),
+        **{field: Count('id', filter=Q(status__in=statuses)) for field, statuses in COUNTED_STATUSES.items()}
+    )
+    StudentBorrowStats.objects.bulk_create(
+        [StudentBorrowStats(student_id=row.pop('student_id'), **row) for row in rows], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('borrowing', '0007_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentBorrowStats',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Student')),
+                ('active', models.IntegerField(default=0, verbose_name='Active Borrows')),
+                ('pending', models.IntegerField(default=0, verbose_name='Pending Requests')),
+                ('overdue', models.IntegerField(default=0, verbose_name='Overdue Requests')),
+                ('total', models.IntegerField(default=0, verbose_name='Total Requests')),
+                ('last_request_at', models.DateTimeField(blank=True, null=True, verbose_name='Last Request At')),
+            ],
+            options={
+                'verbose_name': 'Student Borrow Stats',
+                'verbose_name_plural': 'Student Borrow Stats',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0008_student_borrow_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='idempotencykey',
+            index=models.Index(fields=['created_at'], name='borrowing_idempotency_age_idx'),
+        ),
+    ]
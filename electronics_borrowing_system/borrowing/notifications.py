@@ -0,0 +1,191 @@
+# ============================================================================
+# borrowing/notifications.py
+# ============================================================================
+#
+# Notification outbox.
+#
+# Nothing is emailed from the request cycle.  State changes that should
+# notify a student (the send_reminder bulk action, the overdue sweeper)
+# enqueue Notification rows in the same transaction, so a rolled back change
+# sends nothing.  The send_notifications command drains the outbox in
+# batches over one backend connection (one SMTP session per batch):
+#
+#   * a batch is claimed by pushing its next_attempt_at forward by LEASE, so
+#     several workers don't send the same rows; a worker that dies leaves
+#     them to be picked up again once the lease runs out
+#   * a failed send is retried after RETRY_BASE, doubling up to RETRY_MAX,
+#     and given up on (status 'failed') after MAX_ATTEMPTS
+#   * dedup_key (kind, request, day) is unique and enqueue() ignores
+#     conflicts, so a request gets at most one notification of a kind a day
+#
+# Delivery sets reminder_sent/overdue_notified on the request.  Any email
+# backend works; tests use Django's locmem backend.
+
+from datetime import timedelta
+
+from django.core import mail
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import BorrowRequest, Notification
+
+# Notifications sent per batch (and backend connection)
+BATCH_SIZE = 100
+
+# How long a claimed batch is hidden from other workers
+LEASE = timedelta(minutes=5)
+
+# Retry backoff and the number of attempts before giving up
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=6)
+MAX_ATTEMPTS = 6
+
+MESSAGES = {
+    'reminder': (
+        'تذكير بإرجاع القطع المستعارة - الطلب #{id}',
+        'مرحباً {name}،\n\n'
+        'نذكرك بأن موعد إرجاع القطع المستعارة في الطلب #{id} هو {due}.\n'
+        'يرجى إعادتها إلى المعمل في الموعد المحدد.\n',
+    ),
+    'overdue': (
+        'تأخر إرجاع القطع المستعارة - الطلب #{id}',
+        'مرحباً {name}،\n\n'
+        'انتهى موعد إرجاع القطع المستعارة في الطلب #{id} بتاريخ {due}.\n'
+        'يرجى إعادتها إلى المعمل في أقرب وقت.\n',
+    ),
+}
+
+# Why enqueue() skipped a request
+NO_EMAIL = 'no_email'
+ALREADY_QUEUED = 'already_queued'
+
+# Request flag set once a notification of the kind is delivered
+DELIVERED_FLAGS = {
+    'reminder': 'reminder_sent',
+    'overdue': 'overdue_notified',
+}
+
+
+def dedup_key(kind, request_id, day):
+    return f'{kind}:{request_id}:{day:%Y-%m-%d}'
+
+
+def enqueue(request_ids, kind):
+    """Queue one kind notification per request; returns {request_id: skip reason or None}
+
+    Call inside the transaction making the state change.  Students without
+    email (NO_EMAIL) and requests already notified of this kind today
+    (ALREADY_QUEUED) are skipped; None means a notification was queued.
+    """
+    subject, body = MESSAGES[kind]
+    today = timezone.localdate()
+    rows = BorrowRequest.objects.filter(pk__in=list(request_ids)).values(
+        'pk', 'expected_return_date', 'student__email', 'student__first_name', 'student__username'
+    )
+    outcome = {row['pk']: None if row['student__email'] else NO_EMAIL for row in rows}
+    context = [
+        {
+            'id': row['pk'],
+            'name': row['student__first_name'] or row['student__username'],
+            'due': row['expected_return_date'],
+            'email': row['student__email'],
+            'dedup_key': dedup_key(kind, row['pk'], today),
+        }
+        for row in rows if row['student__email']
+    ]
+    queued = set(
+        Notification.objects.filter(dedup_key__in=[item['dedup_key'] for item in context])
+        .values_list('dedup_key', flat=True)
+    )
+    for item in context:
+        if item['dedup_key'] in queued:
+            outcome[item['id']] = ALREADY_QUEUED
+    Notification.objects.bulk_create([
+        Notification(
+            borrow_request_id=item['id'],
+            kind=kind,
+            to_email=item['email'],
+            subject=subject.format(**item),
+            body=body.format(**item),
+            dedup_key=item['dedup_key'],
+        )
+        for item in context if item['dedup_key'] not in queued
+    ], ignore_conflicts=True)
+    return outcome
+
+
+def claim(batch_size=BATCH_SIZE, now=None):
+    """Take up to batch_size due notifications for this worker"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = Notification.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'pk')
+        if connections[due.db].features.has_select_for_update:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due[:batch_size])
+        Notification.objects.filter(pk__in=[n.pk for n in batch]).update(next_attempt_at=now + LEASE)
+    return batch
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def failed(notification, error, now):
+    notification.attempts += 1
+    notification.last_error = str(error) or error.__class__.__name__
+    if notification.attempts >= MAX_ATTEMPTS:
+        notification.status = 'failed'
+    else:
+        notification.next_attempt_at = now + retry_delay(notification.attempts)
+
+
+def deliver(batch, now=None):
+    """Send a claimed batch over one connection and record the outcomes"""
+    now = now or timezone.now()
+    connection = mail.get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for notification in batch:
+            failed(notification, e, now)
+    else:
+        try:
+            for notification in batch:
+                try:
+                    mail.EmailMessage(
+                        notification.subject, notification.body, to=[notification.to_email],
+                        connection=connection,
+                    ).send()
+                except Exception as e:
+                    failed(notification, e, now)
+                else:
+                    notification.status = 'sent'
+                    notification.attempts += 1
+                    notification.sent_at = now
+                    notification.last_error = ''
+        finally:
+            connection.close()
+
+    for notification in batch:
+        notification.updated_at = now
+    with transaction.atomic():
+        Notification.objects.bulk_update(
+            batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'updated_at']
+        )
+        for kind, flag in DELIVERED_FLAGS.items():
+            delivered = [n.borrow_request_id for n in batch if n.status == 'sent' and n.kind == kind]
+            if delivered:
+                BorrowRequest.objects.filter(pk__in=delivered).update(**{flag: True}, updated_at=now)
+
+    return sum(1 for notification in batch if notification.status == 'sent')
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Send batches until nothing is due; returns (sent, attempted)"""
+    sent = attempted = 0
+    while True:
+        batch = claim(batch_size)
+        if not batch:
+            return sent, attempted
+        sent += deliver(batch)
+        attempted += len(batch)
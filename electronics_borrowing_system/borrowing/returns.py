@@ -0,0 +1,168 @@
+# ============================================================================
+# borrowing/returns.py
+# ============================================================================
+#
+# Batched returns (ReturnItemsForm).
+#
+# One call takes back any number of records across any number of requests,
+# e.g. a whole class handing its kits in, in one transaction and a fixed
+# number of queries: the requests and their records are loaded once,
+# condition_returned/damage_description are written with bulk_update(),
+# everything that goes back on the shelf moves in one UPDATE
+# (inventory.stock.bulk_release) and the InventoryTransaction and
+# BorrowRequestHistory rows are written with bulk_create().
+#
+# Units returned damaged or missing don't go back on the shelf; they are
+# written off the part's total_quantity (inventory.stock.bulk_write_off, in
+# one UPDATE too) with a 'damaged' transaction of -quantity, and the record
+# gets a replacement cost.  A request is closed
+# once every one of its records is back: 'returned', or 'damaged' if any
+# record came back damaged or missing.
+
+from collections import defaultdict
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from inventory import stock
+from inventory.models import InventoryTransaction
+from . import stats
+from .models import BorrowRecord, BorrowRequest, BorrowRequestHistory
+
+# Most records one return may cover
+MAX_RETURN_RECORDS = 2000
+
+# Requests whose records can be returned
+RETURNABLE_STATUSES = ['approved', 'borrowed', 'overdue']
+
+# Conditions that put the units back on the shelf
+RESTOCK_CONDITIONS = ['excellent', 'good', 'fair']
+
+
+def result(record_id, ok, request_id=None, message=''):
+    return {'id': record_id, 'request_id': request_id, 'ok': ok, 'message': message}
+
+
+def process_returns(lines, user, notes=''):
+    """Return {record_id: (condition, damage_description)} in one transaction
+
+    Returns (results, closed): one {'id', 'request_id', 'ok', 'message'}
+    entry per record id, in the order given, and the ids of the requests
+    that are now fully returned.
+    """
+    record_ids = list(lines)
+    now = timezone.now()
+
+    with transaction.atomic():
+        request_ids = set(
+            BorrowRecord.objects.filter(pk__in=record_ids).values_list('request_id', flat=True)
+        )
+        requests = BorrowRequest.objects.filter(pk__in=request_ids).order_by('pk')
+        if connections[requests.db].features.has_select_for_update:
+            # Another return or bulk action on the same requests waits for us
+            requests = requests.select_for_update()
+        requests = list(requests.prefetch_related('records'))
+        records = {record.pk: record for r in requests for record in r.records.all()}
+        requests = {borrow_request.pk: borrow_request for borrow_request in requests}
+
+        report = {}
+        returned = []
+        for record_id in record_ids:
+            record = records.get(record_id)
+            if record is None:
+                report[record_id] = result(record_id, False, message='العنصر غير موجود.')
+            elif requests[record.request_id].status not in RETURNABLE_STATUSES:
+                report[record_id] = result(
+                    record_id, False, record.request_id, 'لا يمكن إرجاع عناصر طلب بهذه الحالة.'
+                )
+            elif record.condition_returned:
+                report[record_id] = result(record_id, False, record.request_id, 'تم إرجاع هذا العنصر مسبقاً.')
+            else:
+                record.condition_returned, record.damage_description = lines[record_id]
+                if record.condition_returned not in RESTOCK_CONDITIONS and record.unit_cost is not None:
+                    record.replacement_cost = record.unit_cost * record.quantity
+                record.updated_at = now
+                returned.append(record)
+                report[record_id] = result(record_id, True, record.request_id)
+
+        BorrowRecord.objects.bulk_update(
+            returned, ['condition_returned', 'damage_description', 'replacement_cost', 'updated_at']
+        )
+        InventoryTransaction.objects.bulk_create(restock(returned, user))
+
+        closed = close_requests({record.request_id for record in returned}, requests, now)
+        BorrowRequestHistory.objects.bulk_create([
+            BorrowRequestHistory(request=borrow_request, action='returned', notes=notes, performed_by=user)
+            for borrow_request in closed
+        ])
+
+    return [report[record_id] for record_id in record_ids], [r.pk for r in closed]
+
+
+def restock(returned, user):
+    """Put the good units back and write the rest off, one UPDATE each
+
+    Returns the InventoryTransaction rows.
+    """
+    returned = sorted(
+        (record for record in returned if record.inventory_part_id), key=lambda record: record.pk
+    )
+    on_shelf = stock.locked_quantities({record.inventory_part_id for record in returned}, borrowable_only=False)
+
+    given_back = defaultdict(int)
+    written_off = defaultdict(int)
+    rows = []
+    for record in returned:
+        part_id = record.inventory_part_id
+        if part_id not in on_shelf:
+            continue  # Part deleted meanwhile
+        previous_quantity = on_shelf[part_id]
+        if record.condition_returned in RESTOCK_CONDITIONS:
+            given_back[part_id] += record.quantity
+            on_shelf[part_id] += record.quantity
+            transaction_type, quantity = 'return', record.quantity
+            reason = f'Returned ({record.condition_returned}) for borrow request #{record.request_id}'
+        else:
+            # Lost to the inventory; the shelf count (previous/new) doesn't move
+            written_off[part_id] += record.quantity
+            transaction_type, quantity = 'damaged', -record.quantity
+            reason = (f'{record.quantity} unit(s) returned {record.condition_returned} '
+                      f'for borrow request #{record.request_id}')
+            if record.damage_description:
+                reason += f': {record.damage_description}'
+        rows.append(InventoryTransaction(
+            part_id=part_id,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            previous_quantity=previous_quantity,
+            new_quantity=on_shelf[part_id],
+            performed_by=user,
+            reason=reason,
+            reference_id=str(record.request_id)
+        ))
+
+    stock.bulk_release(given_back)
+    stock.bulk_write_off(written_off)
+    return rows
+
+
+def close_requests(request_ids, requests, now):
+    """Mark requests with every record back as returned (or damaged); returns them"""
+    closed = []
+    changes = []
+    for request_id in sorted(request_ids):
+        borrow_request = requests[request_id]
+        records = borrow_request.records.all()
+        if not all(record.condition_returned for record in records):
+            continue
+        damaged = any(record.condition_returned not in RESTOCK_CONDITIONS for record in records)
+        status = 'damaged' if damaged else 'returned'
+        changes.append((borrow_request.student_id, borrow_request.status, status))
+        borrow_request.status = status
+        borrow_request.actual_return_date = now
+        borrow_request.updated_at = now
+        closed.append(borrow_request)
+
+    BorrowRequest.objects.bulk_update(closed, ['status', 'actual_return_date', 'updated_at'])
+    stats.transition(changes, now)
+    return closed
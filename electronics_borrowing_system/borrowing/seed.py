@@ -0,0 +1,46 @@
+# ============================================================================
+# borrowing/seed.py
+# ============================================================================
+#
+# Synthetic students and borrow requests for the audit/benchmark management
+# commands, on top of inventory.seed.seed_catalog().  Always call it inside a
+# transaction that gets rolled back.
+
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+
+from . import stats
+from .models import BorrowRequest
+
+STATUSES = [
+    'submitted', 'submitted', 'approved', 'borrowed', 'borrowed', 'overdue',
+    'returned', 'returned', 'returned', 'rejected', 'cancelled',
+]
+
+
+def seed_requests(students=200, requests=20000, seed=1, batch_size=5000):
+    """Bulk-create students and requests spread over the last year"""
+    rng = random.Random(seed)
+
+    users = User.objects.bulk_create([
+        User(username=f'seed_student_{i}', password='!') for i in range(students)
+    ])
+
+    today = date.today()
+    batch = []
+    for i in range(requests):
+        batch.append(BorrowRequest(
+            student=rng.choice(users),
+            purpose=f'Seeded project {i}',
+            expected_return_date=today + timedelta(days=rng.randint(-180, 60)),
+            status=rng.choice(STATUSES),
+        ))
+        if len(batch) >= batch_size:
+            BorrowRequest.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BorrowRequest.objects.bulk_create(batch)
+    stats.rebuild()
+    return users
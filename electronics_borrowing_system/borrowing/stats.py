@@ -0,0 +1,114 @@
+# ============================================================================
+# borrowing/stats.py
+# ============================================================================
+#
+# Materialized per-student counters (StudentBorrowStats).
+#
+# The student dashboard reads one StudentBorrowStats row by primary key
+# instead of counting the student's requests on every page view.  Code that
+# creates a request or changes its status calls transition() in the same
+# transaction with (student_id, old_status, new_status) triples; the deltas
+# are applied with F() expressions, so concurrent transitions of the same
+# student add up instead of overwriting each other.  Students with the same
+# delta share one UPDATE, so a bulk action costs a few statements whatever
+# its size.
+#
+# transition() also invalidates the students' and the staff dashboard
+# fragments (borrowing.fragments).
+#
+# Changes made outside those paths (the Django admin, deleting requests,
+# raw SQL) are not tracked; the rebuild_borrow_stats command recomputes
+# every row from borrow_requests to repair drift.
+
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from . import fragments
+from .models import BorrowRequest, StudentBorrowStats
+
+# Counter -> statuses it counts ('total' counts every request)
+COUNTED_STATUSES = {
+    'pending': ['submitted', 'pending'],
+    'active': ['approved', 'borrowed', 'overdue'],
+    'overdue': ['overdue'],
+}
+
+# Students recomputed per rebuild statement
+REBUILD_BATCH_SIZE = 1000
+
+
+def for_student(student):
+    """The student's counters; an unsaved all-zero row if they never requested"""
+    return StudentBorrowStats.objects.filter(pk=student.pk).first() or StudentBorrowStats(student=student)
+
+
+def transition(changes, now=None):
+    """Apply (student_id, old_status, new_status) changes; old_status None is a new request"""
+    now = now or timezone.now()
+    deltas = defaultdict(lambda: defaultdict(int))
+    for student_id, old_status, new_status in changes:
+        delta = deltas[student_id]
+        if old_status is None:
+            delta['total'] += 1
+        for field, statuses in COUNTED_STATUSES.items():
+            delta[field] += (new_status in statuses) - (old_status in statuses)
+
+    fragments.requests_changed(deltas)
+
+    students = defaultdict(list)
+    for student_id, delta in deltas.items():
+        students[tuple(sorted((field, n) for field, n in delta.items() if n))].append(student_id)
+    students.pop((), None)
+    if not students:
+        return
+
+    StudentBorrowStats.objects.bulk_create(
+        [StudentBorrowStats(student_id=student_id) for group in students.values() for student_id in group],
+        ignore_conflicts=True
+    )
+    for delta, student_ids in students.items():
+        values = {field: F(field) + n for field, n in delta}
+        if dict(delta).get('total', 0) > 0:
+            values['last_request_at'] = now
+        StudentBorrowStats.objects.filter(pk__in=student_ids).update(**values, updated_at=now)
+
+
+def counted_rows(student_ids):
+    """The GROUP BY rebuild() recomputes the counters from"""
+    return (
+        BorrowRequest.objects.filter(student_id__in=student_ids)
+        .order_by()
+        .values('student_id')
+        .annotate(
+            total=Count('id'),
+            last_request_at=Max('created_at'),
+            **{field: Count('id', filter=Q(status__in=statuses)) for field, statuses in COUNTED_STATUSES.items()}
+        )
+    )
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Recompute every student's counters; returns how many rows were written"""
+    fields = ['total', 'last_request_at', *COUNTED_STATUSES, 'updated_at']
+    written = 0
+    student_ids = User.objects.filter(borrow_requests__isnull=False).distinct().order_by('pk').values_list('pk', flat=True)
+    last_id = 0
+    while True:
+        batch = list(student_ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+        StudentBorrowStats.objects.bulk_create(
+            [StudentBorrowStats(student_id=row.pop('student_id'), **row) for row in counted_rows(batch)],
+            update_conflicts=True, unique_fields=['student'], update_fields=fields
+        )
+        written += len(batch)
+
+    # Students whose requests were all deleted
+    StudentBorrowStats.objects.exclude(
+        student__in=BorrowRequest.objects.values('student_id')
+    ).delete()
+    return written
@@ -1,3 +1,916 @@
-from django.test import TestCase
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory import autocomplete, holds
+from inventory.models import Category, ElectronicPart, InventoryTransaction, StockHold
+from . import fragments, idempotency, notifications, overdue, stats, views
+from .bulk import run_bulk_action
+from .models import (
+    BorrowRecord, BorrowRequest, BorrowRequestHistory, IdempotencyKey, Notification, StudentBorrowStats,
+)
+
+
+# The tests clear the cache; never the development one
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryPlanAuditTests(TestCase):
+    """The hot-path querysets keep using their indexes"""
+
+    def test_audit_queries_passes(self):
+        out = StringIO()
+        # Raises CommandError (non-zero exit) on any unexpected scan, sort or missing index
+        call_command('audit_queries', parts=300, requests=300, students=10, stdout=out)
+        self.assertIn('no problems', out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PartsCatalogTests(TestCase):
+    """The create_request form carries the first screen; the rest is paged from parts_catalog"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('student', password='x'))
+        self.category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        other = Category.objects.create(name_ar='المقاومات', name_en='Resistors')
+        for i in range(5):
+            ElectronicPart.objects.create(
+                name_ar=f'حساس {i}', name_en=f'Sensor {i}', part_number=f'SNS-{i}',
+                category=self.category, total_quantity=3, available_quantity=3,
+            )
+        ElectronicPart.objects.create(
+            name_ar='مقاومة', name_en='Resistor', part_number='RES-1',
+            category=other, total_quantity=9, available_quantity=9,
+        )
+
+    def test_category_pages(self):
+        url = reverse('borrowing:parts_catalog')
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(url, {'category': self.category.id, 'limit': 2, 'cursor': cursor or ''})
+            data = response.json()
+            ids += [part['id'] for part in data['results']]
+            cursor = data['next_cursor']
+            if not data['has_next']:
+                break
+        expected = ElectronicPart.objects.filter(category=self.category).order_by('name_ar', 'id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_follows_inventory_generation(self):
+        url = reverse('borrowing:parts_catalog')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ElectronicPart.objects.get(part_number='RES-1').borrow(1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][-1]['quantity'], 8)
+
+    def test_form_renders_first_screen(self):
+        with mock.patch.object(views, 'FORM_FIRST_SCREEN', 4):
+            response = self.client.get(reverse('borrowing:create_request'))
+        self.assertEqual(len(response.context['available_parts']), 4)
+        self.assertIsNotNone(response.context['available_parts_next'])
+        self.assertEqual(
+            {category['id']: category['count'] for category in response.context['categories']},
+            {self.category.id: 5, ElectronicPart.objects.get(part_number='RES-1').category_id: 1},
+        )
+        self.assertEqual(response.context['total_parts_count'], 6)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ApproveRequestTests(TestCase):
+    """Approval reserves stock for every line or for none"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.sensor, self.board = [
+            ElectronicPart.objects.create(
+                name_ar=name, name_en=name, part_number=name.upper(),
+                category=category, total_quantity=5, available_quantity=quantity,
+            )
+            for name, quantity in [('sensor', 5), ('board', 1)]
+        ]
+        self.borrow_request = BorrowRequest.objects.create(
+            student=User.objects.create_user('student', password='x'),
+            purpose='Project', expected_return_date=date.today() + timedelta(days=7),
+        )
+
+    def add_line(self, part, quantity):
+        BorrowRecord.objects.create(
+            request=self.borrow_request, inventory_part=part, part_name=part.name_en, quantity=quantity,
+        )
+
+    def approve(self):
+        self.client.post(reverse('borrowing:approve_request', args=[self.borrow_request.pk]))
+        self.borrow_request.refresh_from_db()
+        self.sensor.refresh_from_db()
+        self.board.refresh_from_db()
+
+    def test_approves_and_reserves(self):
+        self.add_line(self.sensor, 2)
+        self.add_line(self.board, 1)
+        self.approve()
+        self.assertEqual(self.borrow_request.status, 'approved')
+        self.assertEqual((self.sensor.available_quantity, self.board.available_quantity), (3, 0))
+        self.assertEqual(
+            InventoryTransaction.objects.filter(transaction_type='borrow').count(), 2
+        )
+
+        # A second approval finds the request already claimed
+        self.approve()
+        self.assertEqual(self.sensor.available_quantity, 3)
+
+    def test_short_line_rolls_back_the_others(self):
+        self.add_line(self.sensor, 2)
+        self.add_line(self.board, 2)
+        self.approve()
+        self.assertEqual(self.borrow_request.status, 'submitted')
+        self.assertEqual((self.sensor.available_quantity, self.board.available_quantity), (5, 1))
+        self.assertFalse(InventoryTransaction.objects.filter(transaction_type='borrow').exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkActionTests(TestCase):
+    """Bulk actions process a whole selection in a fixed number of queries"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.student = User.objects.create_user('student', password='x')
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Sensor', part_number='SNS-1',
+            category=category, total_quantity=5, available_quantity=5,
+        )
+
+    def make_requests(self, count, quantity=2):
+        requests = []
+        for i in range(count):
+            borrow_request = BorrowRequest.objects.create(
+                student=self.student, purpose=f'Project {i}',
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            BorrowRecord.objects.create(
+                request=borrow_request, inventory_part=self.part, part_name='Sensor', quantity=quantity,
+            )
+            requests.append(borrow_request)
+        return requests
+
+    def post(self, action, request_ids, notes=''):
+        return self.client.post(reverse('borrowing:bulk_action'), {
+            'action': action,
+            'selected_requests': ','.join(str(request_id) for request_id in request_ids),
+            'notes': notes,
+        })
+
+    def test_approve_report(self):
+        first, second, third = self.make_requests(3)
+        data = self.post('approve', [third.pk, first.pk, second.pk, 999]).json()
+
+        # Oldest first: the third request is the one left without stock
+        self.assertEqual([item['ok'] for item in data['results']], [False, True, True, False])
+        self.assertEqual((data['succeeded'], data['failed']), (2, 2))
+        self.assertEqual(data['results'][0]['status'], 'submitted')
+
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.available_quantity, 1)
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='borrow').count(), 2)
+        self.assertEqual(BorrowRequestHistory.objects.filter(action='approved').count(), 2)
+
+        # Already approved requests are reported, not approved twice
+        data = self.post('approve', [first.pk]).json()
+        self.assertFalse(data['results'][0]['ok'])
+
+    def test_return_puts_stock_back(self):
+        requests = self.make_requests(2, quantity=1)
+        self.post('approve', [r.pk for r in requests])
+        data = self.post('mark_returned', [r.pk for r in requests]).json()
+        self.assertEqual(data['succeeded'], 2)
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.available_quantity, 5)
+
+    def test_query_count_does_not_grow(self):
+        ElectronicPart.objects.filter(pk=self.part.pk).update(total_quantity=100, available_quantity=100)
+
+        def queries(action, count):
+            ids = [r.pk for r in self.make_requests(count, quantity=1)]
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.post(action, ids).json()['succeeded'], count)
+            return len(captured)
+
+        self.assertEqual(queries('approve', 2), queries('approve', 20))
+        self.assertEqual(queries('reject', 2), queries('reject', 20))
+
+    def test_invalid_selection(self):
+        self.assertEqual(self.post('approve', []).status_code, 400)
+        self.assertEqual(self.post('approve', ['x']).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LineResolutionTests(TestCase):
+    """Submitted lines are resolved in a batch, not one query per line"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('student', password='x'))
+        category = Category.objects.create(name_ar='المقاومات', name_en='Resistors')
+        self.parts = [
+            ElectronicPart.objects.create(
+                name_ar=f'مقاومة {i}', name_en=f'Resistor {i}', part_number=f'RES-{i}',
+                category=category, total_quantity=5, available_quantity=5,
+            )
+            for i in range(20)
+        ]
+        self.sensor = ElectronicPart.objects.create(
+            name_ar='حساس المسافة', name_en='Ultrasonic Distance Sensor', part_number='US-HC-SR04',
+            category=category, total_quantity=5, available_quantity=5,
+        )
+        autocomplete.index.build()
+
+    def test_exact_lines_in_one_query(self):
+        lines = [(part.pk, part.name_en) for part in self.parts[:10]]
+        lines += [(None, part.part_number.lower()) for part in self.parts[10:15]]
+        lines += [(None, part.name_ar) for part in self.parts[15:]]
+        with self.assertNumQueries(1):
+            resolved = views.find_inventory_parts(lines)
+        self.assertEqual(resolved, self.parts)
+
+    def test_other_names_through_the_index(self):
+        with self.assertNumQueries(2):
+            resolved = views.find_inventory_parts([(None, 'RES-1'), (None, 'ultrasonic')])
+        self.assertEqual(resolved, [self.parts[1], self.sensor])
+
+    def test_only_close_part_numbers_are_linked(self):
+        self.assertEqual(views.find_inventory_part('USHCSRO4'), self.sensor)
+        self.assertIsNone(views.find_inventory_part('HCSR04'))
+
+    def test_weak_index_hits_are_not_linked(self):
+        # An infix hit in the index, but too far from the part number
+        self.assertEqual(views.find_inventory_parts([(None, 'HCSR04'), (None, 'US-HC-SR4')]), [None, self.sensor])
+
+    def post_lines(self, lines):
+        data = {'purpose': 'Lab kit', 'expected_return_date': str(date.today() + timedelta(days=7))}
+        for i, (name, quantity) in enumerate(lines):
+            data[f'part_name_{i}'] = name
+            data[f'quantity_{i}'] = quantity
+        return self.client.post(reverse('borrowing:create_request'), data)
+
+    def test_create_request_links_every_line(self):
+        self.post_lines([(part.name_en, 1) for part in self.parts])
+        records = BorrowRecord.objects.filter(request__purpose='Lab kit')
+        self.assertEqual(
+            sorted(records.values_list('inventory_part_id', flat=True)), [part.pk for part in self.parts]
+        )
+
+    def test_records_written_in_one_insert(self):
+        ElectronicPart.objects.filter(pk=self.sensor.pk).update(purchase_price='12.50')
+        lines = [(part.name_en, 1) for part in self.parts] + [('US-HC-SR04', 1), ('US-HC-SR04', 2)]
+        with CaptureQueriesContext(connection) as captured:
+            self.post_lines(lines)
+        inserts = [q for q in captured if q['sql'].startswith('INSERT INTO "borrowing_borrowrecord"')]
+        self.assertEqual(len(inserts), 1)
+
+        # Duplicate lines are merged; catalog details are copied
+        record = BorrowRecord.objects.get(part_name='US-HC-SR04')
+        self.assertEqual(
+            (record.inventory_part_id, record.part_number, record.quantity, str(record.unit_cost)),
+            (self.sensor.pk, 'US-HC-SR04', 3, '12.50'),
+        )
+        self.assertEqual(BorrowRecord.objects.count(), 21)
+
+    def test_quantities_are_summed_per_part(self):
+        response = self.post_lines([('Resistor 0', 3), ('RES-0', 3)])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(BorrowRequest.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockHoldFlowTests(TestCase):
+    """Validation and submission hold stock until approval, rejection or expiry"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Sensor', part_number='SNS-1',
+            category=category, total_quantity=4, available_quantity=4,
+        )
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+
+    def validate(self, user, quantity):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse('borrowing:validate_parts_availability'),
+            {'parts': [{'part_id': self.part.pk, 'name': 'Sensor', 'quantity': quantity}]},
+            content_type='application/json',
+        ).json()
+
+    def submit(self, user, quantity):
+        self.client.force_login(user)
+        self.client.post(reverse('borrowing:create_request'), {
+            'purpose': 'Project', 'expected_return_date': str(date.today() + timedelta(days=7)),
+            'part_name_0': 'Sensor', 'part_id_0': self.part.pk, 'quantity_0': quantity,
+        })
+        return BorrowRequest.objects.filter(student=user).first()
+
+    def test_validation_holds_stock(self):
+        self.assertTrue(self.validate(self.alice, 3)['valid'])
+        self.assertFalse(self.validate(self.bob, 2)['valid'])
+        self.assertIsNone(self.submit(self.bob, 2))
+
+        # Alice's own hold doesn't count against her submission
+        borrow_request = self.submit(self.alice, 3)
+        self.assertEqual(
+            list(StockHold.objects.values_list('holder', 'reference_id', 'quantity')),
+            [(self.alice.pk, str(borrow_request.pk), 3)],
+        )
+
+    def test_holds_are_rechecked_when_placed(self):
+        self.assertTrue(self.validate(self.alice, 3)['valid'])
+
+        # Bob's availability read raced Alice's hold; placing his must still refuse
+        with mock.patch.object(holds, 'net_available', return_value={self.part.pk: 4}):
+            self.assertFalse(self.validate(self.bob, 2)['valid'])
+
+            # The form is rendered again after the rollback, with a cold catalog snapshot
+            cache.clear()
+            stored = len(views.TEMP_REQUESTS_STORAGE)
+            with redirect_stdout(StringIO()) as out:
+                response = self.client.post(reverse('borrowing:create_request'), {
+                    'purpose': 'Project', 'expected_return_date': str(date.today() + timedelta(days=7)),
+                    'part_name_0': 'Sensor', 'part_id_0': self.part.pk, 'quantity_0': 2,
+                })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['عذراً، الكمية المطلوبة من Sensor غير متوفرة حالياً'],
+        )
+        self.assertNotIn('Database error', out.getvalue())
+        self.assertEqual(len(views.TEMP_REQUESTS_STORAGE), stored)
+        self.assertFalse(BorrowRequest.objects.exists())
+        self.assertFalse(StockHold.objects.filter(holder=self.bob).exists())
+
+    def test_rejection_loses_to_a_concurrent_approval(self):
+        borrow_request = self.submit(self.alice, 3)
+        stale = BorrowRequest.objects.get(pk=borrow_request.pk)
+        self.client.force_login(self.admin)
+        self.client.post(reverse('borrowing:approve_request', args=[borrow_request.pk]))
+
+        # The rejecting admin loaded the request before it was approved
+        with mock.patch.object(views, 'get_object_or_404', return_value=stale):
+            self.client.post(reverse('borrowing:reject_request', args=[borrow_request.pk]), {'reason': 'No'})
+
+        borrow_request.refresh_from_db()
+        self.assertEqual(borrow_request.status, 'approved')
+        self.assertEqual(borrow_request.rejection_reason, '')
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.available_quantity, 1)
+
+    def test_validation_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.alice)
+        response = client.post(
+            reverse('borrowing:validate_parts_availability'),
+            {'parts': [{'part_id': self.part.pk, 'name': 'Sensor', 'quantity': 1}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_approval_converts_and_rejection_releases(self):
+        first = self.submit(self.alice, 3)
+        second = self.submit(self.bob, 1)
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('borrowing:approve_request', args=[first.pk]))
+        self.client.post(reverse('borrowing:reject_request', args=[second.pk]), {'rejection_reason': 'No'})
+
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.available_quantity, 1)
+        self.assertFalse(StockHold.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReturnItemsTests(TestCase):
+    """Returns across many requests run in one transaction and a fixed number of queries"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.student = User.objects.create_user('student', password='x')
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.sensor, self.board = [
+            ElectronicPart.objects.create(
+                name_ar=name, name_en=name, part_number=name.upper(), category=category,
+                total_quantity=100, available_quantity=50, purchase_price='4.00',
+            )
+            for name in ('sensor', 'board')
+        ]
+
+    def make_requests(self, count):
+        """Borrowed requests with one sensor and two boards each"""
+        requests = []
+        for i in range(count):
+            borrow_request = BorrowRequest.objects.create(
+                student=self.student, purpose=f'Kit {i}', status='borrowed',
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            for part, quantity in [(self.sensor, 1), (self.board, 2)]:
+                BorrowRecord.objects.create(
+                    request=borrow_request, inventory_part=part, part_name=part.name_en,
+                    quantity=quantity, unit_cost=part.purchase_price,
+                )
+            requests.append(borrow_request)
+        return requests
+
+    def post(self, conditions, notes=''):
+        data = {'condition_notes': notes}
+        for record, condition, damage in conditions:
+            data[f'condition_{record.pk}'] = condition
+            data[f'damage_{record.pk}'] = damage
+        return self.client.post(reverse('borrowing:return_items'), data)
+
+    def test_whole_class_returns(self):
+        first, second = self.make_requests(2)
+        (sensor_1, board_1), (sensor_2, board_2) = [r.records.order_by('pk') for r in (first, second)]
+        data = self.post([
+            (sensor_1, 'good', ''), (board_1, 'excellent', ''),
+            (sensor_2, 'damaged', 'Cracked housing'),
+        ], notes='Lab 3').json()
+        self.assertEqual((data['succeeded'], data['closed_requests']), (3, [first.pk]))
+
+        self.sensor.refresh_from_db()
+        self.board.refresh_from_db()
+        self.assertEqual((self.sensor.available_quantity, self.board.available_quantity), (51, 52))
+        self.assertEqual(
+            sorted(InventoryTransaction.objects.exclude(transaction_type='add')
+                   .values_list('transaction_type', 'quantity')),
+            [('damaged', -1), ('return', 1), ('return', 2)],
+        )
+        # The damaged sensor is written off the inventory
+        self.assertEqual((self.sensor.total_quantity, self.board.total_quantity), (99, 100))
+        sensor_2.refresh_from_db()
+        self.assertEqual((sensor_2.damage_description, str(sensor_2.replacement_cost)), ('Cracked housing', '4.00'))
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'returned')
+        self.assertEqual(BorrowRequestHistory.objects.get(request=first, action='returned').notes, 'Lab 3')
+
+        # The rest of the second request: closed as damaged; records already back are refused
+        data = self.post([(board_2, 'good', ''), (board_1, 'good', '')]).json()
+        self.assertEqual([item['ok'] for item in data['results']], [True, False])
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'damaged')
+
+    def test_bulk_return_skips_lines_already_returned(self):
+        borrow_request = self.make_requests(1)[0]
+        sensor, board = borrow_request.records.order_by('pk')
+        self.post([(sensor, 'damaged', 'Cracked housing')])
+
+        run_bulk_action('mark_returned', [borrow_request.pk], User.objects.get(username='admin'))
+
+        self.sensor.refresh_from_db()
+        self.board.refresh_from_db()
+        self.assertEqual((self.sensor.available_quantity, self.sensor.total_quantity), (50, 99))
+        self.assertEqual(self.board.available_quantity, 52)
+        self.assertEqual(
+            sorted(InventoryTransaction.objects.exclude(transaction_type='add')
+                   .values_list('transaction_type', 'quantity')),
+            [('damaged', -1), ('return', 2)],
+        )
+        board.refresh_from_db()
+        self.assertEqual(board.condition_returned, 'good')
+
+    def test_query_count_does_not_grow(self):
+        def queries(count):
+            records = BorrowRecord.objects.filter(request__in=self.make_requests(count))
+            with CaptureQueriesContext(connection) as captured:
+                data = self.post([(record, 'good', '') for record in records]).json()
+            self.assertEqual(len(data['closed_requests']), count)
+            return len(captured)
+
+        self.assertEqual(queries(2), queries(20))
+
+    def test_damage_needs_a_description(self):
+        record = self.make_requests(1)[0].records.first()
+        self.assertEqual(self.post([(record, 'missing', '')]).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertFalse(InventoryTransaction.objects.exclude(transaction_type='add').exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdempotencyTests(TestCase):
+    """Repeated POSTs with the same token replay the first result"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Sensor', part_number='SNS-1',
+            category=category, total_quantity=5, available_quantity=5,
+        )
+        self.student = User.objects.create_user('student', password='x')
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.token = idempotency.new_token()
+
+    def submit(self):
+        self.client.force_login(self.student)
+        return self.client.post(reverse('borrowing:create_request'), {
+            'purpose': 'Project', 'expected_return_date': str(date.today() + timedelta(days=7)),
+            'part_name_0': 'Sensor', 'part_id_0': self.part.pk, 'quantity_0': 2,
+            'idempotency_key': str(self.token),
+        }, follow=True)
+
+    def approve(self, borrow_request):
+        self.client.force_login(self.admin)
+        return self.client.post(
+            reverse('borrowing:approve_request', args=[borrow_request.pk]),
+            {'idempotency_key': str(self.token)}, follow=True,
+        )
+
+    def messages(self, response):
+        return [str(message) for message in response.context['messages']]
+
+    def test_submission_runs_once(self):
+        first = self.submit()
+        second = self.submit()
+        borrow_request = BorrowRequest.objects.get()
+        self.assertEqual(borrow_request.uuid, self.token)
+        self.assertEqual(self.messages(first), self.messages(second))
+        self.assertEqual(StockHold.objects.get().quantity, 2)
+        self.assertEqual(StudentBorrowStats.objects.filter(pk=self.student.pk).values_list('pending', 'total').get(), (1, 1))
+
+    def test_approval_runs_once(self):
+        self.submit()
+        borrow_request = BorrowRequest.objects.get()
+        first = self.approve(borrow_request)
+        with CaptureQueriesContext(connection) as captured:
+            second = self.approve(borrow_request)
+        self.assertFalse([q for q in captured if q['sql'].startswith(('UPDATE "inventory', 'INSERT'))])
+        self.assertEqual(self.messages(first), self.messages(second))
+
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.available_quantity, 3)
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='borrow').count(), 1)
+        self.assertEqual(StudentBorrowStats.objects.filter(pk=self.student.pk).values_list('pending', 'active').get(), (0, 1))
+
+    def test_concurrent_copy_is_answered_from_the_first(self):
+        self.submit()
+        real_replay = idempotency.replay
+
+        # The copy misses the stored outcome, then loses the race to claim the token
+        with mock.patch.object(idempotency, 'replay') as replay:
+            replay.side_effect = lambda *args: None if replay.call_count == 1 else real_replay(*args)
+            response = self.submit()
+        self.assertEqual(replay.call_count, 2)
+        self.assertEqual(BorrowRequest.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().borrow_request, BorrowRequest.objects.get())
+        self.assertIn('رقم الطلب', self.messages(response)[0])
+
+    def test_sweep_deletes_expired_keys_in_batches(self):
+        self.submit()
+        old = [
+            IdempotencyKey.objects.create(user=self.student, scope=f'approve_request:{i}', key=self.token)
+            for i in range(5)
+        ]
+        IdempotencyKey.objects.filter(pk__in=[key.pk for key in old]).update(
+            created_at=timezone.now() - idempotency.KEY_TTL - timedelta(minutes=1)
+        )
+
+        out = StringIO()
+        with self.assertNumQueries(5):  # 2 x (select ids, delete) + the empty batch
+            call_command('sweep_idempotency_keys', batch_size=3, stdout=out)
+        self.assertIn('Deleted 5', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('scope', flat=True)), ['create_request'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OverdueSweepTests(TestCase):
+    """mark_overdue maintains the overdue status the dashboards read"""
+
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='x')
+        today = date.today()
+        self.requests = {
+            (status, days): BorrowRequest.objects.create(
+                student=self.student, purpose=f'{status} {days}', status=status,
+                expected_return_date=today + timedelta(days=days),
+            )
+            for status, days in [('approved', -3), ('borrowed', -1), ('borrowed', 0),
+                                 ('borrowed', 5), ('returned', -10), ('submitted', -2)]
+        }
+
+    def test_marks_due_requests_in_batches(self):
+        out = StringIO()
+        call_command('mark_overdue', batch_size=1, stdout=out)
+        self.assertIn('Marked 2 request(s) overdue', out.getvalue())
+
+        marked = BorrowRequest.objects.filter(status='overdue')
+        self.assertEqual(
+            set(marked), {self.requests['approved', -3], self.requests['borrowed', -1]}
+        )
+        history = BorrowRequestHistory.objects.filter(action='marked_overdue')
+        self.assertEqual(sorted(history.values_list('request_id', flat=True)), sorted(r.pk for r in marked))
+        self.assertTrue(all(entry.performed_by_id is None for entry in history))
+
+        # Nothing left to do on the next run
+        self.assertEqual(overdue.mark_overdue(), 0)
+
+    def test_dashboard_reads_the_status(self):
+        overdue.mark_overdue()
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        response = self.client.get(reverse('borrowing:admin_dashboard'))
+        self.assertEqual(response.context['total_overdue'], 2)
+        self.assertEqual(response.context['total_active'], 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NotificationOutboxTests(TestCase):
+    """Notifications are queued with the state change and sent in batches by a worker"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        student = User.objects.create_user('student', email='student@example.com', password='x')
+        self.requests = [
+            BorrowRequest.objects.create(
+                student=student, purpose=f'Project {i}', status='borrowed',
+                expected_return_date=date.today() + timedelta(days=2 - i),
+            )
+            for i in range(4)
+        ]
+
+    def remind(self, requests):
+        return self.client.post(reverse('borrowing:bulk_action'), {
+            'action': 'send_reminder',
+            'selected_requests': ','.join(str(r.pk) for r in requests),
+        }).json()
+
+    def test_reminders_are_queued_once_a_day(self):
+        self.assertEqual(self.remind(self.requests[:3])['succeeded'], 3)
+        data = self.remind(self.requests[:3])
+        self.assertEqual((data['succeeded'], data['failed']), (0, 3))
+        self.assertEqual(data['results'][0]['message'], 'تم إرسال تذكير لهذا الطلب اليوم.')
+        self.assertEqual(Notification.objects.filter(kind='reminder', status='pending').count(), 3)
+        self.assertEqual(BorrowRequestHistory.objects.filter(action='reminder_sent').count(), 3)
+        self.assertEqual(len(mail.outbox), 0)
+
+        opened = []
+        real_get_connection = mail.get_connection
+        with mock.patch.object(mail, 'get_connection', side_effect=lambda: opened.append(1) or real_get_connection()):
+            out = StringIO()
+            call_command('send_notifications', batch_size=2, stdout=out)
+        self.assertIn('Sent 3 of 3', out.getvalue())
+        self.assertEqual(len(opened), 2)  # One connection per batch
+        self.assertEqual(mail.outbox[0].to, ['student@example.com'])
+        self.assertEqual(BorrowRequest.objects.filter(reminder_sent=True).count(), 3)
+
+    def test_students_without_email_are_reported(self):
+        no_email = BorrowRequest.objects.create(
+            student=User.objects.create_user('no-email', password='x'), purpose='Project', status='borrowed',
+            expected_return_date=date.today(),
+        )
+        data = self.remind([self.requests[0], no_email])
+        self.assertEqual([item['ok'] for item in data['results']], [True, False])
+        self.assertEqual(data['results'][1]['message'], 'لا يوجد بريد إلكتروني للطالب.')
+        self.assertFalse(BorrowRequestHistory.objects.filter(request=no_email).exists())
+
+    def test_failed_sends_back_off(self):
+        self.remind(self.requests[:1])
+        with mock.patch.object(mail.EmailMessage, 'send', side_effect=OSError('SMTP down')):
+            self.assertEqual(notifications.drain(), (0, 1))
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts, notification.last_error),
+                         ('pending', 1, 'SMTP down'))
+        self.assertGreater(notification.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # Not due yet; once it is, it goes out
+        self.assertEqual(notifications.drain(), (0, 0))
+        Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(notifications.drain(), (1, 1))
+
+        # Given up on after MAX_ATTEMPTS
+        Notification.objects.update(status='pending', attempts=notifications.MAX_ATTEMPTS - 1,
+                                    next_attempt_at=timezone.now())
+        with mock.patch.object(mail.EmailMessage, 'send', side_effect=OSError('SMTP down')):
+            notifications.drain()
+        self.assertEqual(Notification.objects.get().status, 'failed')
+
+    def test_overdue_sweep_queues_notices(self):
+        overdue.mark_overdue()
+        self.assertEqual(Notification.objects.filter(kind='overdue').count(), 1)
+        notifications.drain()
+        self.assertEqual(
+            list(BorrowRequest.objects.filter(overdue_notified=True)), [self.requests[3]]
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StudentBorrowStatsTests(TestCase):
+    """Per-student counters follow every status transition and can be rebuilt"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.student = User.objects.create_user('student', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        today = date.today()
+        self.requests = [
+            BorrowRequest.objects.create(
+                student=student, purpose=f'Project {i}', status=status,
+                expected_return_date=today + timedelta(days=days),
+            )
+            for i, (student, status, days) in enumerate([
+                (self.student, 'submitted', 7), (self.student, 'submitted', -2), (self.student, 'approved', 7),
+                (self.student, 'returned', -30), (self.other, 'submitted', 7),
+            ])
+        ]
+        stats.rebuild()
+
+    def counters(self, student):
+        row = StudentBorrowStats.objects.get(pk=student.pk)
+        return row.pending, row.active, row.overdue, row.total
+
+    def assertMatchesRebuild(self):
+        maintained = {row.pk: self.counters(row.student) for row in StudentBorrowStats.objects.all()}
+        stats.rebuild()
+        self.assertEqual(maintained, {row.pk: self.counters(row.student) for row in StudentBorrowStats.objects.all()})
+
+    def test_rebuild_counts_requests(self):
+        self.assertEqual(self.counters(self.student), (2, 1, 0, 4))
+        self.assertEqual(self.counters(self.other), (1, 0, 0, 1))
+        self.assertEqual(StudentBorrowStats.objects.get(pk=self.student.pk).last_request_at,
+                         self.requests[3].created_at)
+
+    def test_transitions_update_counters(self):
+        first, second, approved, returned, others = self.requests
+        run_bulk_action('approve', [second.pk, others.pk], self.admin)
+        self.assertEqual(self.counters(self.student), (1, 2, 0, 4))
+        run_bulk_action('reject', [first.pk], self.admin)
+        run_bulk_action('mark_borrowed', [second.pk], self.admin)
+        overdue.mark_overdue()
+        self.assertEqual(self.counters(self.student), (0, 2, 1, 4))
+        run_bulk_action('mark_returned', [second.pk], self.admin)
+        self.assertEqual(self.counters(self.student), (0, 1, 0, 4))
+        self.assertEqual(self.counters(self.other), (0, 1, 0, 1))
+        self.assertMatchesRebuild()
+
+    def test_dashboard_reads_one_row(self):
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('borrowing:dashboard'))
+        self.assertEqual(
+            (response.context['pending_requests'], response.context['active_borrows'],
+             response.context['total_requests']), (2, 1, 4)
+        )
+
+        # A student without requests has no row yet
+        self.client.force_login(User.objects.create_user('new', password='x'))
+        self.assertEqual(self.client.get(reverse('borrowing:dashboard')).context['total_requests'], 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        StudentBorrowStats.objects.filter(pk=self.student.pk).update(pending=40, total=0)
+        self.requests[4].delete()
+        out = StringIO()
+        call_command('rebuild_borrow_stats', stdout=out)
+        self.assertIn('Rebuilt counters of 1 student(s)', out.getvalue())
+        self.assertEqual(self.counters(self.student), (2, 1, 0, 4))
+        self.assertFalse(StudentBorrowStats.objects.filter(pk=self.other.pk).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardFragmentTests(TestCase):
+    """Dashboard fragments are cached per student and for all staff until a request changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.student = User.objects.create_user('student', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.requests = {
+                student: BorrowRequest.objects.create(
+                    student=student, purpose=f'Project of {student.username}',
+                    expected_return_date=date.today() + timedelta(days=7),
+                )
+                for student in (self.student, self.other)
+            }
+
+    def get(self, name):
+        return self.client.get(reverse(f'borrowing:{name}'))
+
+    def test_student_fragment_is_reused_until_their_requests_change(self):
+        self.client.force_login(self.student)
+        self.assertContains(self.get('dashboard'), 'Project of student')
+        with self.assertNumQueries(2):  # Session and user only
+            self.assertContains(self.get('dashboard'), 'Project of student')
+
+        # Another student's request leaves this fragment alone
+        with self.captureOnCommitCallbacks(execute=True):
+            run_bulk_action('approve', [self.requests[self.other].pk], self.admin)
+        with self.assertNumQueries(2):
+            self.get('dashboard')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BorrowRecord.objects.create(request=self.requests[self.student], part_name='LED', quantity=1)
+        response = self.get('dashboard')
+        self.assertEqual(response.context['recent_requests'][0]['total_parts'], 1)
+
+    def test_staff_share_one_fragment(self):
+        self.client.force_login(self.admin)
+        self.get('admin_dashboard')
+        self.client.force_login(User.objects.create_user('admin2', password='x', is_staff=True))
+        with self.assertNumQueries(2):
+            self.assertContains(self.get('admin_dashboard'), 'Project of other')
+
+        # Set-based status changes bust it through stats.transition()
+        with self.captureOnCommitCallbacks(execute=True):
+            run_bulk_action('reject', [self.requests[self.other].pk], self.admin)
+        response = self.get('admin_dashboard')
+        self.assertEqual(response.context['total_pending'], 1)
+        self.assertContains(response, 'مرفوضة')
+
+    def test_versions_survive_eviction(self):
+        # Even within the same millisecond of the clock
+        cache.clear()
+        with mock.patch.object(fragments.time, 'time', return_value=2e9):
+            version = fragments.fragment_version([fragments.STAFF_TAG])
+            cache.clear()
+            fragments.invalidate([fragments.STAFF_TAG])
+            self.assertNotEqual(fragments.fragment_version([fragments.STAFF_TAG]), version)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestSummaryQueryTests(TestCase):
+    """Request lists render in a fixed number of queries, whatever their length"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.student = User.objects.create_user('student', password='x', first_name='Sara')
+        self.statuses = ['submitted', 'approved', 'borrowed', 'overdue']
+
+    def make_requests(self, count):
+        # Committing them invalidates the cached dashboard fragments
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_requests(count)
+
+    def create_requests(self, count):
+        for i in range(count):
+            borrow_request = BorrowRequest.objects.create(
+                student=self.student, purpose=f'Project {i}', status=self.statuses[i % 4],
+                approved_by=self.admin if i % 4 else None,
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            for name in ('LED', 'Resistor'):
+                BorrowRecord.objects.create(request=borrow_request, part_name=name, quantity=1)
+
+    def assertQueries(self, user, url, expected):
+        self.client.force_login(user)
+        for count in (2, 12):
+            self.make_requests(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+        return response
+
+    def test_admin_dashboard(self):
+        response = self.assertQueries(self.admin, reverse('borrowing:admin_dashboard'), 4)
+        self.assertEqual(response.context['all_requests'][0]['total_parts'], 2)
+
+    def test_admin_dashboard_lists_match_querysets(self):
+        from .views import get_admin_dashboard_data, get_admin_request_querysets
+
+        self.make_requests(30)
+        BorrowRequest.objects.filter(status='submitted').update(status='returned')
+        with self.assertNumQueries(2):
+            data = get_admin_dashboard_data()
+        querysets = get_admin_request_querysets()
+        for name, key in [('pending_requests', 'pending'), ('active_borrows', 'active'),
+                          ('overdue_requests', 'overdue'), ('all_requests', 'all')]:
+            self.assertEqual([row['id'] for row in data[name]], list(querysets[key].values_list('pk', flat=True)[:10]))
+        self.assertEqual((data['total_pending'], data['total_active'], data['total_overdue']), (0, 22, 7))
+
+    def test_request_list(self):
+        response = self.assertQueries(self.student, reverse('borrowing:request_list'), 4)
+        self.assertEqual(response.context['requests'][0]['user_name'], 'Sara')
+
+    def test_student_dashboard(self):
+        self.assertQueries(self.student, reverse('borrowing:dashboard'), 5)
+
+    def test_debug_requests(self):
+        response = self.assertQueries(self.admin, reverse('borrowing:debug_requests'), 4)
+        data = response.json()
+        self.assertEqual((data['storage_type'], data['total_requests']), ('database', 14))
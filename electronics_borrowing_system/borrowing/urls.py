@@ -14,9 +14,14 @@ urlpatterns = [
     path('admin/', views.admin_dashboard, name='admin_dashboard'),
     path('admin/approve/<int:pk>/', views.approve_request, name='approve_request'),
     path('admin/reject/<int:pk>/', views.reject_request, name='reject_request'),
+    path('admin/bulk/', views.bulk_action, name='bulk_action'),
+    path('admin/return/', views.return_items, name='return_items'),
 
     # AJAX endpoints for parts search
+    path('parts/', views.parts_catalog, name='parts_catalog'),
     path('parts/autocomplete/', views.parts_autocomplete, name='parts_autocomplete'),
+    path('parts/search/', views.inventory_search, name='inventory_search'),
+    path('parts/validate/', views.validate_parts_availability, name='validate_parts_availability'),
     path('parts/<int:part_id>/details/', views.get_part_details, name='part_details'),
 
     # Debug and utility
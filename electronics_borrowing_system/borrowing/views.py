@@ -4,25 +4,40 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.utils.translation import gettext as _
-from django.db import transaction
+from django.utils.translation import gettext as _, get_language
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
 from django.db.models import Q, Count, Sum
+from collections import defaultdict
 from datetime import datetime, date, timedelta
 import json
 import logging
 
+from core.pagination import InvalidCursor, count_rows, keyset_page
+
 logger = logging.getLogger(__name__)
 
 # Temporary storage for compatibility
 TEMP_REQUESTS_STORAGE = []
 
+# Requests shown per request_list page
+REQUESTS_PAGE_SIZE = 20
+
+# Keyset orderings; each ends in id so it is a total order
+REQUEST_LIST_ORDERING = ['-created_at', '-id']
+INVENTORY_SEARCH_ORDERING = ['category__name_ar', 'name_ar', 'id']
+
 # Check if models are available at module level
 try:
     from .models import BorrowRequest, BorrowRecord
+    from .bulk import run_bulk_action
+    from .forms import BulkActionForm, ReturnItemsForm
+    from .returns import MAX_RETURN_RECORDS, process_returns
+    from . import fragments, idempotency, stats
 
     MODELS_AVAILABLE = True
     print("✅ Borrowing models loaded successfully")
@@ -33,6 +48,12 @@ except ImportError:
 # Import your actual inventory models
 try:
     from inventory.models import ElectronicPart, Category, InventoryTransaction
+    from inventory.search import (
+        exact_key_filter, exact_key_match, facet_counts, normalize_part_number, normalize_text,
+        part_number_similarity, rank_by_relevance, ranked_search, search_parts, similar_parts,
+        AUTO_LINK_THRESHOLD, NAME_FIELDS, SCORE_EXACT,
+    )
+    from inventory import autocomplete, catalog, holds, stock
 
     INVENTORY_AVAILABLE = True
     print("✅ Inventory models loaded successfully")
@@ -41,86 +62,133 @@ except ImportError:
     print("⚠️ Inventory models not available")
 
 
+def find_inventory_part(part_name):
+    """Resolve a typed part name or part number to one active inventory part
+
+    Name/part number matches come first; otherwise the closest part number,
+    if its trigram similarity reaches AUTO_LINK_THRESHOLD, so counter typos
+    like 'US-HC-SRO4' still resolve.  Weaker matches are left unlinked
+    (validate_parts_availability offers them as suggestions).
+    """
+    active_parts = ElectronicPart.objects.filter(is_active=True)
+    part = ranked_search(active_parts, part_name, fields=NAME_FIELDS).first()
+    if part is None:
+        nearest = similar_parts(active_parts, part_name, limit=1, threshold=AUTO_LINK_THRESHOLD)
+        part = nearest[0] if nearest else None
+    return part
+
+
+def is_confident_match(entry, part_name):
+    """Whether an autocomplete hit may be linked without asking
+
+    Only an exact name/part number, or a part number within
+    AUTO_LINK_THRESHOLD of what was typed, as in find_inventory_part();
+    prefix and infix hits like 'res' for a resistor are left to it.
+    """
+    return (
+        entry.score(normalize_text(part_name), normalize_part_number(part_name)) >= SCORE_EXACT
+        or part_number_similarity(entry.part_number_key, part_name) >= AUTO_LINK_THRESHOLD
+    )
+
+
+def find_inventory_parts(lines):
+    """Resolve (part_id, part_name) lines to inventory parts in a batch
+
+    Posted ids and exact names/part numbers come from one IN query; names
+    left over are matched in the in-process autocomplete index and, if the
+    match is confident (is_confident_match), fetched with one more IN query.  Only names neither resolves go through
+    find_inventory_part() one by one.  Returns a part (or None) per line.
+    """
+    active_parts = ElectronicPart.objects.filter(is_active=True)
+    part_ids = {part_id for part_id, part_name in lines if part_id}
+    names = [part_name for part_id, part_name in lines if part_name]
+
+    found = list(active_parts.filter(Q(pk__in=part_ids) | exact_key_filter(names)))
+    by_id = {part.pk: part for part in found}
+
+    resolved = []
+    for part_id, part_name in lines:
+        part = by_id.get(part_id)
+        if part is None and part_name:
+            # Exact part number/name hits, borrowable ones first
+            matches = [candidate for candidate in found if exact_key_match(candidate, part_name)]
+            matches.sort(key=lambda p: (not p.is_available_for_borrowing, p.name_ar, p.pk))
+            part = matches[0] if matches else None
+        resolved.append(part)
+
+    # Names without an exact hit: best autocomplete match if it is a
+    # confident one, fetched together
+    hits = {}
+    for position, (part_id, part_name) in enumerate(lines):
+        if resolved[position] is None and part_name:
+            matches = autocomplete.index.search(part_name, limit=1, borrowable_only=False)
+            if matches and is_confident_match(matches[0], part_name):
+                hits[position] = matches[0].id
+    if hits:
+        fetched = active_parts.in_bulk(set(hits.values()))
+        for position, part_id in hits.items():
+            resolved[position] = fetched.get(part_id)
+
+    # Left over (typos, parts the index hasn't picked up yet): one at a time
+    for position, (part_id, part_name) in enumerate(lines):
+        if resolved[position] is None and part_name:
+            resolved[position] = find_inventory_part(part_name)
+
+    return resolved
+
+
 def get_available_parts():
     """Get available parts from your inventory system"""
     if not INVENTORY_AVAILABLE:
         return []
 
     try:
-        # Get parts that are available for borrowing using your model's method
-        available_parts = ElectronicPart.objects.filter(
-            is_active=True
-        ).select_related('category').order_by('category__name_ar', 'name_ar')
-
-        # Filter only parts that are actually available for borrowing
-        borrowable_parts = [part for part in available_parts if part.is_available_for_borrowing]
-
-        return borrowable_parts
+        # Availability is filtered in SQL by ElectronicPart.objects.borrowable()
+        return ElectronicPart.objects.borrowable().select_related('category').order_by(
+            'category__name_ar', 'name_ar'
+        )
     except Exception as e:
         print(f"Error fetching inventory parts: {e}")
         return []
 
 
-def get_popular_parts():
-    """Get most popular/frequently borrowed parts"""
+def get_available_parts_count():
+    """Number of borrowable parts, counted in the database"""
     if not INVENTORY_AVAILABLE:
-        return []
+        return 0
 
     try:
-        # Get parts with highest available quantity (you can modify this logic)
-        popular_parts = ElectronicPart.objects.filter(
-            is_active=True,
-            status='available',
-            available_quantity__gt=0
-        ).order_by('-available_quantity')[:10]
-
-        return popular_parts
+        return ElectronicPart.objects.borrowable().count()
     except Exception as e:
-        print(f"Error fetching popular parts: {e}")
-        return []
+        print(f"Error counting inventory parts: {e}")
+        return 0
 
 
-def get_categories_with_parts():
-    """Get categories with their available parts"""
-    if not INVENTORY_AVAILABLE:
-        return {}
+def with_request_summary(queryset):
+    """Requests with what convert_request_to_dict() needs, in one query
 
-    try:
-        categories = {}
-
-        # Get all active categories with parts
-        active_categories = Category.objects.filter(
-            is_active=True,
-            parts__is_active=True,
-            parts__status='available',
-            parts__available_quantity__gt=0
-        ).distinct().prefetch_related('parts')
-
-        for category in active_categories:
-            # Get available parts for this category
-            available_parts = [
-                part for part in category.parts.all()
-                if part.is_available_for_borrowing
-            ]
-
-            if available_parts:
-                categories[category.name] = available_parts
-
-        return categories
-    except Exception as e:
-        print(f"Error fetching categories: {e}")
-        return {}
+    The student and approver are joined and the lines counted in SQL, so
+    rendering a list costs one query whatever its length.
+    """
+    return queryset.select_related('student', 'approved_by').annotate(records_count=Count('records'))
 
 
 def convert_request_to_dict(request_obj):
-    """Convert model instance to dict format for template compatibility"""
+    """Convert model instance to dict format for template compatibility
+
+    Pass instances from with_request_summary(); others cost two extra
+    queries (student and line count) each.
+    """
     if not request_obj:
         return {}
 
+    student = request_obj.student
+    approved_by = request_obj.approved_by
+    records_count = getattr(request_obj, 'records_count', None)
     return {
         'id': request_obj.id,
-        'user_id': request_obj.student.id,
-        'user_name': request_obj.student.get_full_name() or request_obj.student.username,
+        'user_id': request_obj.student_id,
+        'user_name': student.get_full_name() or student.username,
         'purpose': request_obj.purpose,
         'expected_return_date': request_obj.expected_return_date.strftime(
             '%Y-%m-%d') if request_obj.expected_return_date else '',
@@ -129,8 +197,10 @@ def convert_request_to_dict(request_obj):
         'created_at': request_obj.created_at.strftime('%Y-%m-%d %H:%M') if hasattr(request_obj,
                                                                                    'created_at') else request_obj.request_date.strftime(
             '%Y-%m-%d %H:%M'),
-        'total_parts': request_obj.records.count() if hasattr(request_obj, 'records') else getattr(request_obj,
-                                                                                                   'total_parts', 0)
+        'approved_by': (approved_by.get_full_name() or approved_by.username) if approved_by else '',
+        'approved_at': request_obj.approval_date.strftime('%Y-%m-%d %H:%M') if request_obj.approval_date else '',
+        'rejection_reason': request_obj.rejection_reason,
+        'total_parts': records_count if records_count is not None else request_obj.records.count()
     }
 
 
@@ -152,16 +222,15 @@ def dashboard(request):
             print(f"Database query error: {e}")
 
     if user_requests_db is not None:
-        # Database version
+        # Database version; the data is only loaded if the fragment isn't cached
         try:
-            context = {
-                'active_borrows': user_requests_db.filter(status__in=['approved', 'borrowed']).count(),
-                'pending_requests': user_requests_db.filter(status__in=['submitted', 'pending']).count(),
-                'recent_requests': [convert_request_to_dict(req) for req in
-                                    user_requests_db.order_by('-created_at')[:5]],
-                'available_parts_count': len(get_available_parts()) if INVENTORY_AVAILABLE else 50,
-                'total_requests': user_requests_db.count(),
-            }
+            context = fragments.lazy_context(
+                lambda: get_student_dashboard_data(request.user, user_requests_db), STUDENT_DASHBOARD_FIELDS
+            )
+            context['fragment_version'] = fragments.fragment_version(
+                [fragments.student_tag(request.user.pk)], catalog.get_generation() if INVENTORY_AVAILABLE else ''
+            )
+            context['fragment_timeout'] = fragments.FRAGMENT_TIMEOUT
         except Exception as e:
             print(f"Database query error: {e}")
             user_requests_db = None
@@ -173,13 +242,34 @@ def dashboard(request):
             'active_borrows': len([req for req in user_requests if req.get('status') == 'approved']),
             'pending_requests': len([req for req in user_requests if req.get('status') == 'pending']),
             'recent_requests': user_requests[-5:],
-            'available_parts_count': len(get_available_parts()) if INVENTORY_AVAILABLE else 50,
+            'available_parts_count': get_available_parts_count() if INVENTORY_AVAILABLE else 50,
             'total_requests': len(user_requests),
+            # Never cache fragments rendered from temp storage
+            'fragment_timeout': 0,
         }
 
     return render(request, 'borrowing/dashboard.html', context)
 
 
+STUDENT_DASHBOARD_FIELDS = [
+    'active_borrows', 'pending_requests', 'recent_requests', 'available_parts_count', 'total_requests',
+]
+
+
+def get_student_dashboard_data(student, user_requests):
+    """The student dashboard's counters and recent requests"""
+    # Counters are maintained per student (borrowing.stats): one pk read
+    student_stats = stats.for_student(student)
+    return {
+        'active_borrows': student_stats.active,
+        'pending_requests': student_stats.pending,
+        'recent_requests': [convert_request_to_dict(req) for req in
+                            with_request_summary(user_requests).order_by('-created_at')[:5]],
+        'available_parts_count': get_available_parts_count() if INVENTORY_AVAILABLE else 50,
+        'total_requests': student_stats.total,
+    }
+
+
 @login_required
 def create_request(request):
     """Enhanced create request function with your inventory integration"""
@@ -195,6 +285,14 @@ def create_request(request):
         for key, value in request.POST.items():
             print(f"{key}: {value}")
 
+        # A repeated POST (double-click, retry) gets the original result
+        token = None
+        if MODELS_AVAILABLE:
+            token = idempotency.client_token(request)
+            replayed = idempotency.replay(request, 'create_request', token, '/borrowing/')
+            if replayed:
+                return replayed
+
         purpose = request.POST.get('purpose', '').strip()
         expected_return_date = request.POST.get('expected_return_date', '').strip()
         student_notes = request.POST.get('student_notes', '').strip()
@@ -210,38 +308,49 @@ def create_request(request):
         while f'part_name_{part_index}' in request.POST:
             part_name = request.POST.get(f'part_name_{part_index}', '').strip()
             if part_name:  # Only process non-empty parts
-                quantity = int(request.POST.get(f'quantity_{part_index}', 1))
-                condition = request.POST.get(f'condition_{part_index}', 'excellent')
-
-                # Try to find the part in your inventory
-                inventory_part = None
-                if INVENTORY_AVAILABLE:
-                    try:
-                        # Search by name (both Arabic and English) or part number
-                        inventory_part = ElectronicPart.objects.filter(
-                            Q(name_ar__icontains=part_name) |
-                            Q(name_en__icontains=part_name) |
-                            Q(part_number__icontains=part_name),
-                            is_active=True
-                        ).first()
-
-                        # Check availability using your model's method
-                        if inventory_part and not inventory_part.can_borrow(quantity):
-                            messages.error(request,
-                                           f'الكمية المطلوبة من {part_name} ({quantity}) أكثر من المتوفر ({inventory_part.available_quantity})')
-                            return render(request, 'borrowing/create_request.html', get_form_context())
-                    except Exception as e:
-                        print(f"Error checking inventory for {part_name}: {e}")
-
+                part_id = request.POST.get(f'part_id_{part_index}', '').strip()
                 parts_data.append({
                     'name': part_name,
-                    'quantity': quantity,
-                    'condition': condition,
-                    'inventory_part': inventory_part
+                    'quantity': int(request.POST.get(f'quantity_{part_index}', 1)),
+                    'condition': request.POST.get(f'condition_{part_index}', 'excellent'),
+                    'part_id': int(part_id) if part_id.isdigit() else None,
+                    'inventory_part': None
                 })
 
             part_index += 1
 
+        # Resolve every line against your inventory in one batch, then check
+        # the quantities (summed per part) against the fetched rows, less
+        # what other students hold
+        if INVENTORY_AVAILABLE and parts_data:
+            try:
+                inventory_parts = find_inventory_parts(
+                    [(part_data['part_id'], part_data['name']) for part_data in parts_data]
+                )
+            except Exception as e:
+                print(f"Error checking inventory for submitted parts: {e}")
+                inventory_parts = [None] * len(parts_data)
+
+            requested = defaultdict(int)
+            for part_data, inventory_part in zip(parts_data, inventory_parts):
+                part_data['inventory_part'] = inventory_part
+                if inventory_part:
+                    requested[inventory_part.pk] += part_data['quantity']
+
+            available = holds.net_available(
+                [part for part in inventory_parts if part], holder=request.user
+            )
+            for part_data in parts_data:
+                inventory_part = part_data['inventory_part']
+                # Check availability using your model's method
+                if inventory_part and not (
+                        inventory_part.is_available_for_borrowing and
+                        requested[inventory_part.pk] <= available[inventory_part.pk]
+                ):
+                    messages.error(request,
+                                   f'الكمية المطلوبة من {part_data["name"]} ({requested[inventory_part.pk]}) أكثر من المتوفر ({max(available[inventory_part.pk], 0)})')
+                    return render(request, 'borrowing/create_request.html', get_form_context())
+
         if not parts_data:
             messages.error(request, _('يرجى إضافة قطعة واحدة على الأقل.'))
             return render(request, 'borrowing/create_request.html', get_form_context())
@@ -250,36 +359,52 @@ def create_request(request):
         if MODELS_AVAILABLE:
             try:
                 with transaction.atomic():
-                    # Create the request
+                    key = idempotency.claim(request, 'create_request', token)
+
+                    # Create the request; the client token becomes its uuid
                     borrow_request = BorrowRequest.objects.create(
                         student=request.user,
                         purpose=purpose,
                         expected_return_date=expected_return_date,
                         student_notes=student_notes,
-                        status='submitted'
+                        status='submitted',
+                        **({'uuid': token} if token else {})
                     )
-
-                    # Create records for each part
-                    for part_data in parts_data:
-                        borrow_record = BorrowRecord.objects.create(
-                            request=borrow_request,
-                            part_name=part_data['name'],
-                            quantity=part_data['quantity'],
-                            condition_borrowed=part_data['condition']
+                    stats.transition([(request.user.pk, None, borrow_request.status)])
+
+                    # All records in one INSERT, built with their catalog details
+                    BorrowRecord.objects.bulk_create(build_borrow_records(borrow_request, parts_data))
+
+                    # The validation holds become holds of this request until approval
+                    if INVENTORY_AVAILABLE:
+                        holds.release_validation(request.user)
+                        holds.place(
+                            request.user,
+                            [(part_data['inventory_part'].pk, part_data['quantity'])
+                             for part_data in parts_data if part_data['inventory_part']],
+                            reference_id=str(borrow_request.pk),
+                            ttl=holds.REQUEST_HOLD_TTL
                         )
 
-                        # Link to your inventory if available
-                        if part_data['inventory_part']:
-                            inventory_part = part_data['inventory_part']
-                            borrow_record.inventory_part = inventory_part
-                            borrow_record.part_description = inventory_part.description
-                            borrow_record.part_number = inventory_part.part_number
-                            borrow_record.save()
-
-                    messages.success(request, _(f'تم إنشاء طلب الاستعارة بنجاح! رقم الطلب: {borrow_request.id}'))
-                    return redirect('/borrowing/')
+                    return idempotency.respond(
+                        request, key, 'success',
+                        _(f'تم إنشاء طلب الاستعارة بنجاح! رقم الطلب: {borrow_request.id}'),
+                        '/borrowing/', borrow_request
+                    )
 
+            except stock.InsufficientStock as e:
+                # Another student took the stock since the check above; the
+                # atomic block has rolled back, so the form can query again
+                part_name = next(p['name'] for p in parts_data
+                                 if p['inventory_part'] and p['inventory_part'].pk == e.part_id)
+                messages.error(request, f'عذراً، الكمية المطلوبة من {part_name} غير متوفرة حالياً')
+                return render(request, 'borrowing/create_request.html', get_form_context())
             except Exception as e:
+                if isinstance(e, IntegrityError):
+                    # The token was spent meanwhile by a concurrent copy of this POST
+                    replayed = idempotency.replay(request, 'create_request', token, '/borrowing/')
+                    if replayed:
+                        return replayed
                 print(f"Database error during request creation: {e}")
                 messages.error(request, _('حدث خطأ في قاعدة البيانات. جاري المحاولة بالطريقة البديلة...'))
 
@@ -305,75 +430,218 @@ def create_request(request):
     return render(request, 'borrowing/create_request.html', get_form_context())
 
 
-def get_form_context():
-    """Get context data for the form using your inventory"""
-    available_parts = get_available_parts()
-    popular_parts = get_popular_parts()
-    categories = get_categories_with_parts()
-
-    # Convert to format expected by template
-    available_parts_list = []
-    for part in available_parts:
-        available_parts_list.append({
-            'id': part.id,
-            'name': part.name,  # Uses your model's property that returns name based on language
-            'name_ar': part.name_ar,
-            'name_en': part.name_en,
-            'category': part.category.name if part.category else 'Unknown',
-            'quantity': part.available_quantity,
-            'total_quantity': part.total_quantity,
-            'description': part.description,  # Uses your model's property
-            'part_number': part.part_number,
-            'location': f"{part.location} {part.shelf_number}".strip(),
-            'condition': part.get_condition_display(),
-            'manufacturer': part.manufacturer,
-            'model': part.model,
-            'specifications': part.specifications,
-            'is_low_stock': part.is_low_stock,
-        })
+def build_borrow_records(borrow_request, parts_data):
+    """Unsaved BorrowRecords for the submitted lines, ready for bulk_create
+
+    Linked lines copy the part number, description and purchase price from
+    the inventory part.  Lines that end up with the same name and part
+    number are merged, as (request, part_name, part_number) is unique.
+    """
+    records = {}
+    for part_data in parts_data:
+        inventory_part = part_data['inventory_part']
+        part_number = inventory_part.part_number if inventory_part else ''
+        key = (part_data['name'], part_number)
+
+        if key in records:
+            records[key].quantity += part_data['quantity']
+            continue
 
-    # Convert popular parts
-    popular_parts_list = []
-    for part in popular_parts:
-        popular_parts_list.append({
+        records[key] = BorrowRecord(
+            request=borrow_request,
+            inventory_part=inventory_part,
+            part_name=part_data['name'],
+            part_number=part_number,
+            part_description=inventory_part.description if inventory_part else '',
+            unit_cost=inventory_part.purchase_price if inventory_part else None,
+            quantity=part_data['quantity'],
+            condition_borrowed=part_data['condition']
+        )
+    return list(records.values())
+
+
+# Parts shown in the "popular" strip of the create_request form
+POPULAR_PARTS_COUNT = 10
+
+# Parts rendered into the create_request page; the rest come from parts_catalog
+FORM_FIRST_SCREEN = 20
+
+# parts_catalog page size: default and maximum
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 100
+
+
+def serialize_catalog_part(part):
+    """A borrowable part as the create_request form uses it"""
+    return {
+        'id': part.id,
+        'name': part.name,  # Uses your model's property that returns name based on language
+        'name_ar': part.name_ar,
+        'name_en': part.name_en,
+        'category': part.category.name if part.category else 'Unknown',
+        'category_id': part.category_id,
+        'quantity': part.available_quantity,
+        'total_quantity': part.total_quantity,
+        'description': part.description,  # Uses your model's property
+        'part_number': part.part_number,
+        'location': f"{part.location} {part.shelf_number}".strip(),
+        'condition': part.get_condition_display(),
+        'manufacturer': part.manufacturer,
+        'model': part.model,
+        'specifications': part.specifications,
+        'is_low_stock': part.is_low_stock,
+    }
+
+
+def build_catalog_page(category_id=None, cursor=None, limit=CATALOG_PAGE_SIZE):
+    """One keyset page of the borrowable catalog, optionally for one category"""
+    parts_query = get_available_parts()
+    if category_id:
+        parts_query = parts_query.filter(category_id=category_id)
+
+    page = keyset_page(parts_query, INVENTORY_SEARCH_ORDERING, cursor, limit)
+    return {
+        'results': [serialize_catalog_part(part) for part in page.items],
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+
+
+def build_form_context():
+    """Serialize the first screen of the catalog for the create_request form
+
+    Only the first FORM_FIRST_SCREEN parts, the category list with counts and
+    the popular strip are rendered; the form loads the rest from
+    parts_catalog by category and on scroll.
+    """
+    if not INVENTORY_AVAILABLE:
+        return {
+            'available_parts': [],
+            'available_parts_next': None,
+            'categories': [],
+            'popular_parts': [],
+            'inventory_available': False,
+            'total_parts_count': 0,
+        }
+
+    first_page = build_catalog_page(limit=FORM_FIRST_SCREEN)
+
+    # Per-category counts in one GROUP BY, in the catalog's category order
+    category_rows = (
+        get_available_parts()
+        .filter(category__is_active=True)
+        .order_by('category__name_ar')
+        .values('category_id', 'category__name_ar', 'category__name_en')
+        .annotate(count=Count('id'))
+    )
+    arabic = get_language() == 'ar'
+    categories = [
+        {
+            'id': row['category_id'],
+            'name': row['category__name_ar'] if arabic else row['category__name_en'],
+            'count': row['count'],
+        }
+        for row in category_rows
+    ]
+
+    # Most stock on hand first (you can modify this logic)
+    popular_parts = get_available_parts().order_by('-available_quantity', 'id')[:POPULAR_PARTS_COUNT]
+    popular_parts_list = [
+        {
             'id': part.id,
             'name': part.name,
             'category': part.category.name if part.category else 'Unknown',
             'quantity': part.available_quantity,
             'description': part.description,
-        })
-
-    # Convert categories
-    categories_dict = {}
-    for category_name, parts in categories.items():
-        categories_dict[category_name] = []
-        for part in parts:
-            categories_dict[category_name].append({
-                'id': part.id,
-                'name': part.name,
-                'quantity': part.available_quantity,
-                'description': part.description,
-                'part_number': part.part_number,
-                'location': f"{part.location} {part.shelf_number}".strip(),
-            })
+        }
+        for part in popular_parts
+    ]
 
     return {
-        'form': {},
-        'available_parts': available_parts_list,
-        'categories': categories_dict,
+        'available_parts': first_page['results'],
+        'available_parts_next': first_page['next_cursor'],
+        'categories': categories,
         'popular_parts': popular_parts_list,
         'inventory_available': INVENTORY_AVAILABLE,
-        'total_parts_count': len(available_parts_list)
+        'total_parts_count': get_available_parts_count(),
     }
 
 
+def get_form_context():
+    """Get context data for the form using your inventory
+
+    Served from a catalog snapshot that is rebuilt only after the inventory
+    changes (see inventory.catalog).
+    """
+    if INVENTORY_AVAILABLE:
+        context = catalog.get_snapshot('create_request_form', build_form_context)
+    else:
+        context = build_form_context()
+    # The token is per render, so it stays out of the snapshot
+    return {'form': {}, **context, 'idempotency_key': idempotency.new_token() if MODELS_AVAILABLE else ''}
+
+
 # Improved parts search views for borrowing/views.py
 
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, condition
+import hashlib
 import json
 
 
+def parts_catalog_etag(request):
+    """ETag for a parts_catalog response: changes with the inventory generation"""
+    if not INVENTORY_AVAILABLE:
+        return None
+    return f'{catalog.get_generation()}-{get_language()}'
+
+
+@login_required
+@require_GET
+@condition(etag_func=parts_catalog_etag)
+def parts_catalog(request):
+    """Paginated JSON catalog of borrowable parts for the create_request form
+
+    GET params: category (id), cursor (from next_cursor) and limit.  Pages are
+    cached per inventory generation and carry an ETag, so unchanged pages are
+    answered with 304 Not Modified.
+    """
+    category_id = request.GET.get('category') or None
+    cursor = request.GET.get('cursor') or None
+
+    if not INVENTORY_AVAILABLE:
+        return JsonResponse({
+            'error': 'Inventory system not available',
+            'results': [],
+            'next_cursor': None,
+            'has_next': False,
+        })
+
+    try:
+        limit = min(max(int(request.GET.get('limit', CATALOG_PAGE_SIZE)), 1), CATALOG_MAX_PAGE_SIZE)
+        if category_id is not None:
+            category_id = int(category_id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters', 'results': []}, status=400)
+
+    # Cursors can be long; hash them to keep the cache key short
+    cursor_key = hashlib.md5(cursor.encode()).hexdigest() if cursor else ''
+    name = f'parts_catalog:{category_id or ""}:{limit}:{cursor_key}'
+
+    try:
+        page = catalog.get_snapshot(name, lambda: build_catalog_page(category_id, cursor, limit))
+    except InvalidCursor as e:
+        return JsonResponse({
+            'error': 'Invalid cursor',
+            'message': str(e),
+            'results': [],
+        }, status=400)
+
+    response = JsonResponse({**page, 'category_id': category_id})
+    # Revalidate on every use; the ETag makes that cheap
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 @require_GET
 def parts_autocomplete(request):
@@ -393,51 +661,42 @@ def parts_autocomplete(request):
 
     if INVENTORY_AVAILABLE:
         try:
-            # Search in your inventory using both Arabic and English names
-            parts = ElectronicPart.objects.filter(
-                Q(name_ar__icontains=query) |
-                Q(name_en__icontains=query) |
-                Q(part_number__icontains=query) |
-                Q(description_ar__icontains=query) |
-                Q(description_en__icontains=query),
-                is_active=True
-            ).select_related('category').order_by(
-                'category__name_ar',
-                'name_ar'
-            )[:20]  # Limit to 20 results for performance
-
-            for part in parts:
-                # Only include parts that are available for borrowing
-                if part.is_available_for_borrowing:
-                    results.append({
-                        'id': part.id,
-                        'name': part.name,  # Uses your model's property
-                        'name_ar': part.name_ar,
-                        'name_en': part.name_en,
-                        'part_number': part.part_number or '',
-                        'description': part.description or '',  # Uses your model's property
-                        'description_ar': part.description_ar or '',
-                        'description_en': part.description_en or '',
-                        'quantity': part.available_quantity,
-                        'total_quantity': part.total_quantity,
-                        'category': part.category.name if part.category else 'غير محدد',
-                        'category_id': part.category.id if part.category else None,
-                        'location': part.location or '',
-                        'shelf_number': part.shelf_number or '',
-                        'full_location': f"{part.location} {part.shelf_number}".strip(),
-                        'condition': part.condition,
-                        'condition_display': part.get_condition_display(),
-                        'status': part.status,
-                        'status_display': part.get_status_display(),
-                        'manufacturer': part.manufacturer or '',
-                        'model': part.model or '',
-                        'is_low_stock': part.is_low_stock,
-                        'minimum_stock': part.minimum_stock,
-                        'image_url': part.image.url if part.image else None,
-                        # Add specifications summary
-                        'has_specifications': bool(part.specifications),
-                        'specs_count': len(part.specifications) if part.specifications else 0,
-                    })
+            # Answered from the in-process autocomplete index, no query
+            arabic = get_language() == 'ar'
+            conditions = dict(ElectronicPart.CONDITION_CHOICES)
+            statuses = dict(ElectronicPart.STATUS_CHOICES)
+
+            for part in autocomplete.index.search(query, limit=20):
+                category_name = part.category_name_ar if arabic else part.category_name_en
+                results.append({
+                    'id': part.id,
+                    'name': part.name_ar if arabic else part.name_en,
+                    'name_ar': part.name_ar,
+                    'name_en': part.name_en,
+                    'part_number': part.part_number,
+                    'description': part.description_ar if arabic else part.description_en,
+                    'description_ar': part.description_ar,
+                    'description_en': part.description_en,
+                    'quantity': part.available_quantity,
+                    'total_quantity': part.total_quantity,
+                    'category': category_name or 'غير محدد',
+                    'category_id': part.category_id,
+                    'location': part.location or '',
+                    'shelf_number': part.shelf_number or '',
+                    'full_location': f"{part.location} {part.shelf_number}".strip(),
+                    'condition': part.condition,
+                    'condition_display': str(conditions.get(part.condition, part.condition)),
+                    'status': part.status,
+                    'status_display': str(statuses.get(part.status, part.status)),
+                    'manufacturer': part.manufacturer or '',
+                    'model': part.model or '',
+                    'is_low_stock': part.is_low_stock,
+                    'minimum_stock': part.minimum_stock,
+                    'image_url': default_storage.url(part.image) if part.image else None,
+                    # Add specifications summary
+                    'has_specifications': bool(part.specs_count),
+                    'specs_count': part.specs_count,
+                })
 
             print(f"✅ Found {len(results)} parts for query: '{query}'")
 
@@ -574,6 +833,29 @@ def get_part_details(request, part_id):
 
 
 # Enhanced search function for inventory browsing
+def filter_inventory_parts(query='', category_id=None, condition=None, available_only=True):
+    """The filtered (unordered) parts queryset behind inventory_search"""
+    parts_query = ElectronicPart.objects.filter(is_active=True)
+
+    # Apply text search
+    if query and len(query) >= 2:
+        parts_query = search_parts(parts_query, query)
+
+    # Apply category filter
+    if category_id:
+        parts_query = parts_query.filter(category_id=category_id)
+
+    # Apply condition filter
+    if condition:
+        parts_query = parts_query.filter(condition=condition)
+
+    # Apply availability filter
+    if available_only:
+        parts_query = parts_query.borrowable()
+
+    return parts_query
+
+
 @login_required
 @require_GET
 def inventory_search(request):
@@ -582,7 +864,10 @@ def inventory_search(request):
     category_id = request.GET.get('category', None)
     condition = request.GET.get('condition', None)
     available_only = request.GET.get('available_only', 'true').lower() == 'true'
-    limit = min(int(request.GET.get('limit', 50)), 100)  # Max 100 results
+    limit = min(int(request.GET.get('limit', 50)), 100)  # Max 100 results per page
+    cursor = request.GET.get('cursor') or None
+    count_mode = request.GET.get('count', 'exact')  # exact, approx or none
+    with_facets = request.GET.get('facets', 'true').lower() == 'true'
 
     if not INVENTORY_AVAILABLE:
         return JsonResponse({
@@ -592,52 +877,32 @@ def inventory_search(request):
         })
 
     try:
-        # Build the query
-        parts_query = ElectronicPart.objects.filter(is_active=True)
-
-        # Apply text search
-        if query and len(query) >= 2:
-            parts_query = parts_query.filter(
-                Q(name_ar__icontains=query) |
-                Q(name_en__icontains=query) |
-                Q(part_number__icontains=query) |
-                Q(description_ar__icontains=query) |
-                Q(description_en__icontains=query) |
-                Q(manufacturer__icontains=query) |
-                Q(model__icontains=query)
-            )
-
-        # Apply category filter
-        if category_id:
-            parts_query = parts_query.filter(category_id=category_id)
-
-        # Apply condition filter
-        if condition:
-            parts_query = parts_query.filter(condition=condition)
-
-        # Apply availability filter
-        if available_only:
-            parts_query = parts_query.filter(
-                status='available',
-                available_quantity__gt=0
-            )
+        ranked = bool(query and len(query) >= 2)
+        parts_query = filter_inventory_parts(query, category_id, condition, available_only)
+
+        # Facets and the exact total for the whole filtered set come from one
+        # GROUP BY query; without facets the total follows count_mode
+        facets = None
+        if with_facets:
+            facets = facet_counts(parts_query)
+            total_count, count_exact = facets['total'], True
+        else:
+            total_count, count_exact = count_rows(parts_query, count_mode)
 
-        # Get total count before limiting
-        total_count = parts_query.count()
+        # Best matches first for text searches, otherwise by category/name
+        ordering = INVENTORY_SEARCH_ORDERING
+        if ranked:
+            parts_query = rank_by_relevance(parts_query, query)
+            ordering = ['-relevance'] + ordering
 
-        # Apply ordering and limit
-        parts = parts_query.select_related('category').order_by(
-            'category__name_ar', 'name_ar'
-        )[:limit]
+        page = keyset_page(parts_query.select_related('category'), ordering, cursor, limit)
+        parts = page.items
 
         # Build results
         results = []
         categories_found = set()
 
         for part in parts:
-            if available_only and not part.is_available_for_borrowing:
-                continue
-
             categories_found.add(part.category.name if part.category else 'غير محدد')
 
             results.append({
@@ -658,13 +923,43 @@ def inventory_search(request):
                 'is_low_stock': part.is_low_stock,
                 'is_available_for_borrowing': part.is_available_for_borrowing,
                 'image_url': part.image.url if part.image else None,
+                'relevance': getattr(part, 'relevance', None),
             })
 
+        facets_data = None
+        if facets is not None:
+            arabic = get_language() == 'ar'
+            conditions = dict(ElectronicPart.CONDITION_CHOICES)
+            facets_data = {
+                'categories': [
+                    {
+                        'id': category['id'],
+                        'name': (category['name_ar'] if arabic else category['name_en']) or 'غير محدد',
+                        'count': category['count'],
+                    }
+                    for category in facets['categories']
+                ],
+                'conditions': [
+                    {
+                        'value': item['value'],
+                        'label': str(conditions.get(item['value'], item['value'])),
+                        'count': item['count'],
+                    }
+                    for item in facets['conditions']
+                ],
+                'manufacturers': facets['manufacturers'],
+                'availability': facets['availability'],
+            }
+
         return JsonResponse({
             'results': results,
             'total_found': len(results),
             'total_in_db': total_count,
+            'total_is_exact': count_exact,
+            'next_cursor': page.next_cursor,
+            'has_next': page.has_next,
             'categories_found': list(categories_found),
+            'facets': facets_data,
             'query': query,
             'filters': {
                 'category_id': category_id,
@@ -673,6 +968,14 @@ def inventory_search(request):
             }
         })
 
+    except InvalidCursor as e:
+        return JsonResponse({
+            'error': 'Invalid cursor',
+            'message': str(e),
+            'results': [],
+            'total': 0
+        }, status=400)
+
     except Exception as e:
         print(f"Error in inventory search: {e}")
         return JsonResponse({
@@ -686,9 +989,12 @@ def inventory_search(request):
 # Helper function to validate part availability before form submission
 @login_required
 @require_http_methods(["POST"])
-@csrf_exempt  # Only if you handle CSRF manually
 def validate_parts_availability(request):
-    """Validate that all requested parts are still available"""
+    """Validate that all requested parts are still available
+
+    Parts that pass are held for the student for holds.HOLD_TTL, so they
+    are still there when the form is submitted.
+    """
     try:
         data = json.loads(request.body)
         parts_to_check = data.get('parts', [])
@@ -702,51 +1008,80 @@ def validate_parts_availability(request):
         validation_results = []
         all_valid = True
 
-        for part_request in parts_to_check:
+        # Find every part in one batch: ids, then names, then nearest part numbers
+        found_parts = find_inventory_parts([
+            (int(part_request['part_id']) if str(part_request.get('part_id') or '').isdigit() else None,
+             part_request.get('name', ''))
+            for part_request in parts_to_check
+        ])
+
+        # Stock on the shelf less what other students hold, in one query
+        available = holds.net_available([part for part in found_parts if part], holder=request.user)
+        requested = defaultdict(int)
+        for part_request, part in zip(parts_to_check, found_parts):
+            if part:
+                requested[part.pk] += int(part_request.get('quantity', 1))
+
+        hold_lines = []
+        for part_request, part in zip(parts_to_check, found_parts):
             part_name = part_request.get('name', '')
             requested_quantity = int(part_request.get('quantity', 1))
 
-            # Find the part
-            part = None
-            if part_request.get('part_id'):
-                part = ElectronicPart.objects.filter(
-                    id=part_request['part_id'],
-                    is_active=True
-                ).first()
-            else:
-                # Search by name
-                part = ElectronicPart.objects.filter(
-                    Q(name_ar__icontains=part_name) |
-                    Q(name_en__icontains=part_name) |
-                    Q(part_number__icontains=part_name),
-                    is_active=True
-                ).first()
-
             if part:
-                can_borrow = part.can_borrow(requested_quantity)
+                can_borrow = part.is_available_for_borrowing and requested[part.pk] <= available[part.pk]
                 validation_results.append({
                     'part_name': part_name,
                     'requested_quantity': requested_quantity,
-                    'available_quantity': part.available_quantity,
+                    'available_quantity': max(available[part.pk], 0),
                     'can_borrow': can_borrow,
                     'is_available_for_borrowing': part.is_available_for_borrowing,
                     'part_id': part.id
                 })
 
-                if not can_borrow:
+                if can_borrow:
+                    hold_lines.append((part.pk, requested_quantity))
+                else:
                     all_valid = False
             else:
                 validation_results.append({
                     'part_name': part_name,
                     'requested_quantity': requested_quantity,
                     'can_borrow': False,
-                    'error': 'Part not found in inventory'
+                    'error': 'Part not found in inventory',
+                    # Ranked near misses for a "did you mean" prompt
+                    'suggestions': [
+                        {
+                            'part_id': suggestion.id,
+                            'part_number': suggestion.part_number,
+                            'name': suggestion.name,
+                            'similarity': round(suggestion.similarity, 3),
+                        }
+                        for suggestion in similar_parts(
+                            ElectronicPart.objects.filter(is_active=True),
+                            part_name,
+                            threshold=0.1
+                        )
+                    ],
                 })
                 all_valid = False
 
+        # Replaces the student's previous validation holds.  place() re-checks
+        # under lock, so a part another student just took is reported, not held
+        while True:
+            try:
+                placed = holds.place(request.user, hold_lines)
+                break
+            except stock.InsufficientStock as e:
+                hold_lines = [line for line in hold_lines if line[0] != e.part_id]
+                for result in validation_results:
+                    if result.get('part_id') == e.part_id:
+                        result['can_borrow'] = False
+                all_valid = False
+
         return JsonResponse({
             'valid': all_valid,
             'results': validation_results,
+            'held_until': placed[0].expires_at.isoformat() if placed else None,
             'inventory_available': INVENTORY_AVAILABLE
         })
 
@@ -758,6 +1093,15 @@ def validate_parts_availability(request):
         }, status=500)
 
 
+def get_request_list_summary(user_requests):
+    """Summary cards over all of the student's requests, one query"""
+    return user_requests.aggregate(
+        total_requests=Count('id'),
+        pending_count=Count('id', filter=Q(status__in=['pending', 'submitted'])),
+        approved_count=Count('id', filter=Q(status='approved')),
+    )
+
+
 @login_required
 def request_list(request):
     """Compatible request list function"""
@@ -766,33 +1110,43 @@ def request_list(request):
     if request.user.is_staff:
         return redirect('/borrowing/admin/')
 
-    # Try database first
-    user_requests_db = None
+    cursor = request.GET.get('cursor') or None
+    page = None
+    stats = None
+
+    # Try database first: one keyset page, newest first
     if MODELS_AVAILABLE:
         try:
-            user_requests_db = BorrowRequest.objects.filter(student=request.user).order_by('-created_at')
-        except Exception as e:
-            print(f"Database query error: {e}")
+            user_requests_db = BorrowRequest.objects.filter(student=request.user)
+            page = keyset_page(
+                with_request_summary(user_requests_db), REQUEST_LIST_ORDERING, cursor, REQUESTS_PAGE_SIZE
+            )
+            requests_list = [convert_request_to_dict(req) for req in page.items]
 
-    if user_requests_db is not None:
-        try:
-            requests_list = [convert_request_to_dict(req) for req in user_requests_db]
+            stats = get_request_list_summary(user_requests_db)
+        except InvalidCursor:
+            return redirect('borrowing:request_list')
         except Exception as e:
             print(f"Database query error: {e}")
-            user_requests_db = None
+            page = None
 
-    if user_requests_db is None:
+    if page is None:
         # Fall back to temp storage
         requests_list = [req for req in TEMP_REQUESTS_STORAGE if req.get('user_id') == request.user.id]
 
-    # Sort by creation date (newest first)
-    requests_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # Sort by creation date (newest first)
+        requests_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        stats = {
+            'total_requests': len(requests_list),
+            'pending_count': len([req for req in requests_list if req.get('status') in ['pending', 'submitted']]),
+            'approved_count': len([req for req in requests_list if req.get('status') == 'approved']),
+        }
 
     context = {
         'requests': requests_list,
-        'total_requests': len(requests_list),
-        'pending_count': len([req for req in requests_list if req.get('status') in ['pending', 'submitted']]),
-        'approved_count': len([req for req in requests_list if req.get('status') == 'approved']),
+        'next_cursor': page.next_cursor if page else None,
+        'is_first_page': not cursor,
+        **stats,
     }
     return render(request, 'borrowing/request_list.html', context)
 
@@ -806,10 +1160,11 @@ def request_detail(request, pk):
     # Try database first
     if MODELS_AVAILABLE:
         try:
+            requests_qs = with_request_summary(BorrowRequest.objects.all())
             if request.user.is_staff:
-                borrow_request = get_object_or_404(BorrowRequest, pk=pk)
+                borrow_request = get_object_or_404(requests_qs, pk=pk)
             else:
-                borrow_request = get_object_or_404(BorrowRequest, pk=pk, student=request.user)
+                borrow_request = get_object_or_404(requests_qs, pk=pk, student=request.user)
 
             request_data = convert_request_to_dict(borrow_request)
         except Exception as e:
@@ -837,6 +1192,72 @@ def request_detail(request, pk):
     return render(request, 'borrowing/request_detail.html', context)
 
 
+# Admin dashboard lists: context key -> statuses (None: every request)
+ADMIN_DASHBOARD_LISTS = {
+    'pending_requests': ['submitted', 'pending'],
+    'active_borrows': ['approved', 'borrowed', 'overdue'],
+    # Maintained by the mark_overdue command (borrowing.overdue)
+    'overdue_requests': ['overdue'],
+    'all_requests': None,
+}
+ADMIN_DASHBOARD_COUNTERS = ['total_pending', 'total_active', 'total_overdue']
+ADMIN_DASHBOARD_LIST_SIZE = 10
+ADMIN_DASHBOARD_ORDERING = ['-created_at', '-id']
+
+
+def get_admin_request_querysets():
+    """Request querysets shown on the admin dashboard, newest first"""
+    all_requests_qs = BorrowRequest.objects.all().order_by(*ADMIN_DASHBOARD_ORDERING)
+    lists = ADMIN_DASHBOARD_LISTS
+
+    return {
+        'all': all_requests_qs,
+        # Filter requests by status using standard QuerySet methods
+        'pending': all_requests_qs.filter(status__in=lists['pending_requests']),
+        'active': all_requests_qs.filter(status__in=lists['active_borrows']),
+        'overdue': all_requests_qs.filter(status__in=lists['overdue_requests']),
+    }
+
+
+def get_admin_dashboard_data():
+    """The admin dashboard's four lists and three counters in two queries
+
+    Each list's newest ids come from its own indexed LIMIT subquery; the
+    rows of all four are fetched together (at most 4 x LIST_SIZE) and split
+    back into lists in memory.  The counters are one conditional aggregate
+    over the open requests only, so neither query grows with the number of
+    closed requests.
+    """
+    querysets = get_admin_request_querysets()
+    top = Q()
+    for queryset in querysets.values():
+        top |= Q(pk__in=queryset.values('pk')[:ADMIN_DASHBOARD_LIST_SIZE])
+
+    rows = [
+        convert_request_to_dict(req)
+        for req in with_request_summary(BorrowRequest.objects.filter(top)).order_by(*ADMIN_DASHBOARD_ORDERING)
+    ]
+    data = {
+        name: [row for row in rows if statuses is None or row['status'] in statuses][:ADMIN_DASHBOARD_LIST_SIZE]
+        for name, statuses in ADMIN_DASHBOARD_LISTS.items()
+    }
+
+    data.update(get_admin_dashboard_counters())
+    return data
+
+
+def get_admin_dashboard_counters():
+    """total_pending/total_active/total_overdue in one aggregate over the open requests"""
+    lists = ADMIN_DASHBOARD_LISTS
+    return BorrowRequest.objects.filter(
+        status__in=lists['pending_requests'] + lists['active_borrows']
+    ).aggregate(
+        total_pending=Count('id', filter=Q(status__in=lists['pending_requests'])),
+        total_active=Count('id', filter=Q(status__in=lists['active_borrows'])),
+        total_overdue=Count('id', filter=Q(status__in=lists['overdue_requests'])),
+    )
+
+
 @staff_member_required
 def admin_dashboard(request):
     """Compatible admin dashboard with inventory stats"""
@@ -847,33 +1268,16 @@ def admin_dashboard(request):
     database_success = False
     if MODELS_AVAILABLE:
         try:
-            all_requests_qs = BorrowRequest.objects.all().order_by('-created_at')
-
-            # Filter requests by status using standard QuerySet methods
-            pending_requests = all_requests_qs.filter(status__in=['submitted', 'pending'])
-            active_borrows = all_requests_qs.filter(status__in=['approved', 'borrowed'])
-
-            # Calculate overdue requests
-            today = date.today()
-            overdue_requests = all_requests_qs.filter(
-                status__in=['approved', 'borrowed'],
-                expected_return_date__lt=today
+            # Lists in the format expected by template, and the counters;
+            # only loaded if the staff fragment isn't cached
+            context = fragments.lazy_context(
+                get_admin_dashboard_data, [*ADMIN_DASHBOARD_LISTS, *ADMIN_DASHBOARD_COUNTERS]
             )
-
-            # Convert to format expected by template
-            context = {
-                'pending_requests': [convert_request_to_dict(req) for req in pending_requests[:10]],
-                'active_borrows': [convert_request_to_dict(req) for req in active_borrows[:10]],
-                'overdue_requests': [convert_request_to_dict(req) for req in overdue_requests[:10]],
-                'total_pending': pending_requests.count(),
-                'total_active': active_borrows.count(),
-                'total_overdue': overdue_requests.count(),
-                'all_requests': [convert_request_to_dict(req) for req in all_requests_qs[:10]],
-            }
+            context['fragment_version'] = fragments.fragment_version([fragments.STAFF_TAG])
+            context['fragment_timeout'] = fragments.FRAGMENT_TIMEOUT
 
             database_success = True
-            print(
-                f"✅ Database queries successful: {context['total_pending']} pending, {context['total_active']} active")
+            print(f"✅ Admin dashboard fragment version: {context['fragment_version']}")
 
         except Exception as e:
             print(f"❌ Database error in admin_dashboard: {e}")
@@ -898,10 +1302,13 @@ def admin_dashboard(request):
             'total_active': len(active_borrows),
             'total_overdue': len(overdue_requests),
             'all_requests': TEMP_REQUESTS_STORAGE[-10:],
+            # Never cache fragments rendered from temp storage
+            'fragment_timeout': 0,
         }
 
-    print(
-        f"📊 Final context: {context['total_pending']} pending, {context['total_active']} active, {context['total_overdue']} overdue")
+    # Posted with approvals so a repeated click is answered, not re-run
+    context['idempotency_key'] = idempotency.new_token() if MODELS_AVAILABLE else ''
+
     return render(request, 'borrowing/admin_dashboard.html', context)
 
 
@@ -912,56 +1319,80 @@ def approve_request(request, pk):
 
     # Try database first
     if MODELS_AVAILABLE:
+        # A repeated POST (double-click, retry) gets the original result
+        token = idempotency.client_token(request)
+        scope = f'approve_request:{pk}'
+        replayed = idempotency.replay(request, scope, token, '/borrowing/admin/')
+        if replayed:
+            return replayed
+
         try:
             with transaction.atomic():
                 borrow_request = get_object_or_404(BorrowRequest, pk=pk)
+                key = idempotency.claim(request, scope, token)
+                now = timezone.now()
 
-                if borrow_request.status not in ['submitted', 'pending']:
-                    messages.warning(request, _('لقد تم معالجة هذا الطلب مسبقاً.'))
-                    return redirect('/borrowing/admin/')
+                # Claim the request with a conditional UPDATE: of two staff
+                # approving at once, only one moves it out of submitted/pending
+                claimed = BorrowRequest.objects.filter(pk=pk, status__in=['submitted', 'pending']).update(
+                    status='approved', approved_by=request.user, approval_date=now, updated_at=now
+                )
+                if not claimed:
+                    return idempotency.respond(
+                        request, key, 'warning', _('لقد تم معالجة هذا الطلب مسبقاً.'),
+                        '/borrowing/admin/', borrow_request
+                    )
+                stats.transition([(borrow_request.student_id, borrow_request.status, 'approved')])
 
-                # Check inventory availability and update quantities
+                # Reserve stock for every line at once (conditional UPDATEs in
+                # part id order, see inventory.stock); all or nothing
                 if INVENTORY_AVAILABLE:
-                    for record in borrow_request.records.all():
-                        if record.inventory_part:
-                            inventory_part = record.inventory_part
-
-                            # Check if we can still borrow this quantity
-                            if not inventory_part.can_borrow(record.quantity):
-                                messages.error(request,
-                                               f'عذراً، الكمية المطلوبة من {record.part_name} غير متوفرة حالياً')
-                                return redirect('/borrowing/admin/')
-
-                            # Actually borrow the parts (updates inventory)
-                            success = inventory_part.borrow(record.quantity)
-                            if not success:
-                                messages.error(request,
-                                               f'فشل في حجز {record.part_name} من المخزون')
-                                return redirect('/borrowing/admin/')
-
-                            # Create inventory transaction record
-                            InventoryTransaction.objects.create(
-                                part=inventory_part,
-                                transaction_type='borrow',
-                                quantity=-record.quantity,  # Negative because it's borrowed
-                                previous_quantity=inventory_part.available_quantity + record.quantity,
-                                new_quantity=inventory_part.available_quantity,
-                                performed_by=request.user,
-                                reason=f'Approved borrow request #{borrow_request.id}',
-                                reference_id=str(borrow_request.id)
-                            )
-
-                # Approve the request
-                borrow_request.status = 'approved'
-                borrow_request.approved_by = request.user
-                borrow_request.approval_date = timezone.now()
-                borrow_request.save()
-
-                messages.success(request, _(f'تم الموافقة على الطلب #{pk} بنجاح! تم تحديث المخزون.'))
+                    records = [record for record in borrow_request.records.all() if record.inventory_part_id]
+                    try:
+                        quantities = stock.reserve(
+                            ((record.inventory_part_id, record.quantity) for record in records),
+                            reference_ids=[str(borrow_request.pk)]
+                        )
+                    except stock.InsufficientStock as e:
+                        part_name = next(r.part_name for r in records if r.inventory_part_id == e.part_id)
+                        transaction.set_rollback(True)
+                        messages.error(request,
+                                       f'عذراً، الكمية المطلوبة من {part_name} غير متوفرة حالياً')
+                        return redirect('/borrowing/admin/')
+
+                    # Create inventory transaction records, one per line
+                    on_shelf = {part_id: previous for part_id, (previous, new) in quantities.items()}
+                    inventory_transactions = []
+                    for record in sorted(records, key=lambda r: (r.inventory_part_id, r.pk)):
+                        previous_quantity = on_shelf[record.inventory_part_id]
+                        on_shelf[record.inventory_part_id] = previous_quantity - record.quantity
+                        inventory_transactions.append(InventoryTransaction(
+                            part_id=record.inventory_part_id,
+                            transaction_type='borrow',
+                            quantity=-record.quantity,  # Negative because it's borrowed
+                            previous_quantity=previous_quantity,
+                            new_quantity=previous_quantity - record.quantity,
+                            performed_by=request.user,
+                            reason=f'Approved borrow request #{borrow_request.id}',
+                            reference_id=str(borrow_request.id)
+                        ))
+                    InventoryTransaction.objects.bulk_create(inventory_transactions)
+
+                    # The request's holds are now real stock decrements
+                    holds.release([borrow_request.pk])
+
                 logger.info(f"Request {pk} approved by {request.user.username}")
-                return redirect('/borrowing/admin/')
+                return idempotency.respond(
+                    request, key, 'success', _(f'تم الموافقة على الطلب #{pk} بنجاح! تم تحديث المخزون.'),
+                    '/borrowing/admin/', borrow_request
+                )
 
         except Exception as e:
+            if isinstance(e, IntegrityError):
+                # The token was spent meanwhile by a concurrent copy of this POST
+                replayed = idempotency.replay(request, scope, token, '/borrowing/admin/')
+                if replayed:
+                    return replayed
             print(f"Database error during approval: {e}")
             messages.error(request, _('حدث خطأ في قاعدة البيانات. جاري المحاولة بالطريقة البديلة...'))
 
@@ -993,14 +1424,19 @@ def reject_request(request, pk):
             with transaction.atomic():
                 borrow_request = get_object_or_404(BorrowRequest, pk=pk)
 
-                if borrow_request.status not in ['submitted', 'pending']:
+                # Reject with a conditional UPDATE, like approve_request: only
+                # one of two concurrent decisions moves it out of submitted/pending
+                claimed = BorrowRequest.objects.filter(pk=pk, status__in=['submitted', 'pending']).update(
+                    status='rejected', rejection_reason=rejection_reason, updated_at=timezone.now()
+                )
+                if not claimed:
                     messages.warning(request, _('لقد تم معالجة هذا الطلب مسبقاً.'))
                     return redirect('/borrowing/admin/')
+                stats.transition([(borrow_request.student_id, borrow_request.status, 'rejected')])
 
-                # Reject the request
-                borrow_request.status = 'rejected'
-                borrow_request.rejection_reason = rejection_reason
-                borrow_request.save()
+                # Give the held stock back to everyone else
+                if INVENTORY_AVAILABLE:
+                    holds.release([borrow_request.pk])
 
                 messages.success(request, _(f'تم رفض الطلب #{pk}.'))
                 logger.info(f"Request {pk} rejected by {request.user.username}: {rejection_reason}")
@@ -1026,6 +1462,86 @@ def reject_request(request, pk):
     return redirect('/borrowing/admin/')
 
 
+@staff_member_required
+@require_http_methods(["POST"])
+def bulk_action(request):
+    """Apply a BulkActionForm action to many requests in one transaction
+
+    Responds with a per-request report; see borrowing.bulk.
+    """
+    if not (MODELS_AVAILABLE and INVENTORY_AVAILABLE):
+        return JsonResponse({'error': 'Bulk actions need the database models'}, status=503)
+
+    form = BulkActionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Invalid bulk action', 'errors': form.errors}, status=400)
+
+    action = form.cleaned_data['action']
+    try:
+        results = run_bulk_action(
+            action, form.cleaned_data['selected_requests'], request.user, form.cleaned_data['notes']
+        )
+    except stock.StockChanged as e:
+        logger.warning(f"Bulk {action} by {request.user.username} hit a stock change: {e}")
+        return JsonResponse({
+            'error': 'Stock changed',
+            'message': 'تغير المخزون أثناء المعالجة، يرجى المحاولة مرة أخرى.',
+        }, status=409)
+
+    succeeded = sum(1 for item in results if item['ok'])
+    logger.info(f"Bulk {action} by {request.user.username}: {succeeded}/{len(results)} succeeded")
+    return JsonResponse({
+        'action': action,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results,
+    })
+
+
+@staff_member_required
+@require_http_methods(["POST"])
+def return_items(request):
+    """Take back many records, across many requests, in one transaction
+
+    Expects condition_<record id> (and damage_<record id>) for every record
+    handed back; responds with a per-record report.  See borrowing.returns.
+    """
+    if not (MODELS_AVAILABLE and INVENTORY_AVAILABLE):
+        return JsonResponse({'error': 'Returns need the database models'}, status=503)
+
+    record_ids = [
+        int(key[len('condition_'):]) for key in request.POST
+        if key.startswith('condition_') and key[len('condition_'):].isdigit()
+    ]
+    if len(record_ids) > MAX_RETURN_RECORDS:
+        return JsonResponse({
+            'error': 'Too many records',
+            'message': f'لا يمكن إرجاع أكثر من {MAX_RETURN_RECORDS} عنصر في العملية الواحدة.',
+        }, status=400)
+
+    records = BorrowRecord.objects.filter(pk__in=record_ids).only('id', 'part_name').order_by('pk')
+    form = ReturnItemsForm(request.POST, records=records)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Invalid return', 'errors': form.errors}, status=400)
+
+    # In the order posted; ids not found are still reported
+    found = form.returned_lines()
+    lines = {record_id: found.get(record_id, ('', '')) for record_id in record_ids}
+
+    results, closed = process_returns(lines, request.user, form.cleaned_data['condition_notes'])
+    succeeded = sum(1 for item in results if item['ok'])
+    logger.info(f"Return by {request.user.username}: {succeeded}/{len(results)} records, "
+                f"{len(closed)} request(s) closed")
+    return JsonResponse({
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'closed_requests': closed,
+        'results': results,
+    })
+
+
 @login_required
 def debug_requests(request):
     """Debug view to see all stored requests"""
@@ -1036,7 +1552,7 @@ def debug_requests(request):
     # Try database first
     if MODELS_AVAILABLE:
         try:
-            all_requests = BorrowRequest.objects.all()
+            all_requests = with_request_summary(BorrowRequest.objects.all())
             requests_data = [convert_request_to_dict(req) for req in all_requests]
 
             return JsonResponse({
@@ -1045,8 +1561,8 @@ def debug_requests(request):
                 'requests': requests_data,
                 'models_available': True,
                 'inventory_available': INVENTORY_AVAILABLE,
-                'inventory_parts_count': len(get_available_parts()) if INVENTORY_AVAILABLE else 0
-            }, indent=2)
+                'inventory_parts_count': get_available_parts_count()
+            }, json_dumps_params={'indent': 2})
         except Exception as e:
             print(f"Database error in debug_requests: {e}")
 
@@ -1057,8 +1573,8 @@ def debug_requests(request):
         'requests': TEMP_REQUESTS_STORAGE,
         'models_available': MODELS_AVAILABLE,
         'inventory_available': INVENTORY_AVAILABLE,
-        'inventory_parts_count': len(get_available_parts()) if INVENTORY_AVAILABLE else 0
-    }, indent=2)
+        'inventory_parts_count': get_available_parts_count()
+    }, json_dumps_params={'indent': 2})
 
 
 @staff_member_required
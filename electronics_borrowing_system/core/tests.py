@@ -1,3 +1,46 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from borrowing.models import BorrowRequest
+from .pagination import InvalidCursor, approximate_count, keyset_page
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk a (created_at, id) ordering without gaps or repeats"""
+
+    def setUp(self):
+        student = User.objects.create_user('student', password='x')
+        for i in range(7):
+            BorrowRequest.objects.create(
+                student=student, purpose=f'Project {i}',
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+        # Several rows sharing a timestamp exercise the id tie-breaker
+        BorrowRequest.objects.filter(purpose__in=['Project 2', 'Project 3', 'Project 4']).update(
+            created_at=timezone.now()
+        )
+        self.queryset = BorrowRequest.objects.filter(student=student)
+        self.ordering = ['-created_at', '-id']
+
+    def test_walk_all_pages(self):
+        expected = list(self.queryset.order_by(*self.ordering).values_list('id', flat=True))
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = keyset_page(self.queryset, self.ordering, cursor, page_size=3)
+            seen += [request.id for request in page.items]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_bad_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_page(self.queryset, self.ordering, 'not-a-cursor')
 
-# Create your tests here.
+    def test_approximate_count(self):
+        self.assertEqual(approximate_count(self.queryset, cap=10), (7, True))
+        self.assertEqual(approximate_count(self.queryset, cap=5), (5, False))
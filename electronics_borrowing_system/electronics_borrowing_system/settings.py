@@ -140,3 +140,30 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
+
+# Email: notifications are queued and sent by the send_notifications command
+# (borrowing.notifications).  Development writes them to files; configure
+# the SMTP backend in production.
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'electronics-lab@localhost'
+
+# Cache: catalog snapshots (inventory.catalog) and dashboard fragments
+# (borrowing.fragments) are invalidated by bumping counters held in the
+# cache (the catalog generation and the fragment tag versions), so every
+# worker process must share it and incr() must be atomic.  The file cache
+# below is for development with a single process only: its incr() is a
+# read-then-write, so with several workers concurrent bumps are lost and
+# stale snapshots and fragments keep being served.  Deploy with Redis or
+# Memcached (Django's database and local-memory caches don't qualify
+# either); `manage.py check --deploy` warns otherwise (inventory.checks).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            # One fragment per student plus catalog snapshots
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
@@ -0,0 +1,15 @@
+# Settings for the test suite:
+#
+#     python manage.py test --settings=electronics_borrowing_system.test_settings
+#
+# (DJANGO_SETTINGS_MODULE for pytest-django).  The test classes also
+# override CACHES themselves, so under the development settings they never
+# touch the development cache either.
+
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
@@ -0,0 +1,353 @@
+# ============================================================================
+# inventory/autocomplete.py
+# ============================================================================
+#
+# In-process autocomplete index over part names and part numbers.
+#
+# Each worker builds the index lazily on first use from one query, then keeps
+# it current from the ElectronicPart/Category signal handlers in
+# inventory/models.py.  Saves made by other workers are picked up by a cheap
+# updated_at delta query at most every REFRESH_INTERVAL seconds, and the
+# whole index is rebuilt every REBUILD_INTERVAL seconds to drop rows deleted
+# elsewhere.  Everything in between is answered from memory.
+#
+# The prefix trie is stored flattened: a sorted array of distinct tokens,
+# where a prefix lookup is a bisect followed by a forward scan.  That walks
+# the same nodes in the same order as a dict-of-dicts trie without paying
+# for a Python dict per node, which runs to hundreds of MB at 100k parts.
+
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import islice
+
+from django.utils import timezone
+
+from .search import (
+    AVAILABILITY_BOOST, BORROWABLE_CONDITIONS, SCORE_EXACT, SCORE_PREFIX,
+    SCORE_SUBSTRING, SCORE_WORD, TERM_SPLIT_RE, normalize_part_number,
+    normalize_text, split_terms,
+)
+
+# Seconds between updated_at delta refreshes and full rebuilds
+REFRESH_INTERVAL = 30
+REBUILD_INTERVAL = 15 * 60
+
+# Upper bound on prefix candidates examined per query
+MAX_CANDIDATES = 2000
+
+# Matches collected and scored before the top ``limit`` are taken
+RANKING_POOL = 200
+
+ENTRY_FIELDS = [
+    'id', 'name_ar', 'name_en', 'part_number', 'description_ar', 'description_en',
+    'category_id', 'category__name_ar', 'category__name_en',
+    'available_quantity', 'total_quantity', 'minimum_stock', 'condition', 'status',
+    'location', 'shelf_number', 'manufacturer', 'model', 'image', 'specifications',
+    'is_active', 'updated_at',
+    'name_ar_normalized', 'name_en_normalized', 'part_number_normalized',
+]
+
+
+class IndexedPart:
+    """Lightweight snapshot of an ElectronicPart held by the index"""
+
+    __slots__ = ENTRY_FIELDS[:6] + [
+        'category_id', 'category_name_ar', 'category_name_en',
+        'available_quantity', 'total_quantity', 'minimum_stock', 'condition', 'status',
+        'location', 'shelf_number', 'manufacturer', 'model', 'image', 'specs_count',
+        'tokens', 'text', 'part_number_key', 'name_keys',
+    ]
+
+    def __init__(self, row):
+        for field in ENTRY_FIELDS[:6]:
+            setattr(self, field, row[field] or '')
+        self.category_id = row['category_id']
+        self.category_name_ar = row['category__name_ar'] or ''
+        self.category_name_en = row['category__name_en'] or ''
+        for field in ('available_quantity', 'total_quantity', 'minimum_stock',
+                      'condition', 'status', 'location', 'shelf_number',
+                      'manufacturer', 'model', 'image'):
+            setattr(self, field, row[field])
+        self.specs_count = len(row['specifications'] or {})
+
+        # The normalized key columns are maintained on save, so reuse them
+        self.part_number_key = row['part_number_normalized']
+        self.name_keys = (row['name_ar_normalized'], row['name_en_normalized'])
+        self.text = (
+            f"{row['name_ar_normalized']} {row['name_en_normalized']} "
+            f"{normalize_text(self.part_number)} {self.part_number_key}"
+        )
+        self.tokens = frozenset(TERM_SPLIT_RE.split(self.text)) - {''}
+
+    @property
+    def is_available_for_borrowing(self):
+        """Mirror of ElectronicPart.is_available_for_borrowing for active parts"""
+        return (
+                self.status == 'available' and
+                self.available_quantity > 0 and
+                self.condition in BORROWABLE_CONDITIONS
+        )
+
+    @property
+    def is_low_stock(self):
+        return self.available_quantity <= self.minimum_stock
+
+    def score(self, text_key, number_key):
+        """Same tiers as search.relevance_expression"""
+        if (number_key and self.part_number_key == number_key) or text_key in self.name_keys:
+            tier = SCORE_EXACT
+        elif (number_key and self.part_number_key.startswith(number_key)) or any(
+                name.startswith(text_key) for name in self.name_keys):
+            tier = SCORE_PREFIX
+        elif any(f' {text_key}' in name for name in self.name_keys):
+            tier = SCORE_WORD
+        else:
+            tier = SCORE_SUBSTRING
+        return tier + (AVAILABILITY_BOOST if self.is_available_for_borrowing else 0)
+
+
+def part_row(part):
+    """Build an index row from a saved ElectronicPart instance"""
+    row = {field: getattr(part, field, None) for field in ENTRY_FIELDS if '__' not in field}
+    row['image'] = part.image.name if part.image else ''
+    category = part.category
+    row['category__name_ar'] = category.name_ar if category else ''
+    row['category__name_en'] = category.name_en if category else ''
+    return row
+
+
+def trigrams(text):
+    """Distinct character trigrams of a normalized string"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class AutocompleteIndex:
+    """Prefix (sorted token array) + trigram index of active parts"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.entries = {}
+        self.tokens = []
+        self.postings = {}
+        self.trigram_postings = defaultdict(self._new_posting)
+        self.watermark = None
+        self.refreshed_at = 0.0
+        self.built_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Building and maintenance
+    # ------------------------------------------------------------------
+
+    def queryset(self):
+        from .models import ElectronicPart
+
+        # No ordering: the default name_ar ordering would sort the whole table
+        return ElectronicPart.objects.filter(is_active=True).order_by().values(*ENTRY_FIELDS)
+
+    def build(self):
+        """(Re)build the whole index from one query"""
+        with self.lock:
+            self.entries = {}
+            self.tokens = []
+            self.postings = {}
+            self.trigram_postings = defaultdict(self._new_posting)
+            self.watermark = None
+
+            for row in self.queryset().iterator(chunk_size=5000):
+                self._add(IndexedPart(row), sort_tokens=False)
+                self._advance_watermark(row['updated_at'])
+
+            self.tokens.sort()
+            self.built = True
+            self.built_at = self.refreshed_at = time.monotonic()
+
+    def ensure_current(self):
+        """Build on first use; pick up other workers' saves periodically"""
+        now = time.monotonic()
+        if not self.built or now - self.built_at > REBUILD_INTERVAL:
+            self.build()
+        elif now - self.refreshed_at > REFRESH_INTERVAL:
+            self.refresh()
+
+    def refresh(self):
+        """Apply rows changed since the last seen updated_at"""
+        with self.lock:
+            for row in self.changed_queryset():
+                self._upsert_row(row)
+            self.refreshed_at = time.monotonic()
+
+    def changed_queryset(self):
+        """Rows (active or not) saved since the last seen updated_at"""
+        from .models import ElectronicPart
+
+        changed = ElectronicPart.objects.order_by()
+        if self.watermark is not None:
+            changed = changed.filter(updated_at__gt=self.watermark)
+        return changed.values(*ENTRY_FIELDS)
+
+    def part_saved(self, part):
+        """post_save hook: update a single part if the index is built"""
+        if self.built:
+            self._upsert_row(part_row(part))
+
+    def parts_changed(self, part_ids):
+        """Reload parts changed with queryset.update(), which sends no post_save"""
+        from .models import ElectronicPart
+
+        if not self.built:
+            return
+        rows = ElectronicPart.objects.order_by().filter(pk__in=part_ids).values(*ENTRY_FIELDS)
+        for row in rows:
+            self._upsert_row(row)
+
+    def part_deleted(self, part_id):
+        """post_delete hook"""
+        if self.built:
+            with self.lock:
+                self._remove(part_id)
+
+    def category_saved(self, category):
+        """Category rename: refresh the denormalized names on its parts"""
+        if not self.built:
+            return
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.category_id == category.pk:
+                    entry.category_name_ar = category.name_ar
+                    entry.category_name_en = category.name_en
+
+    def invalidate(self):
+        """Force a rebuild on next use"""
+        self.built = False
+
+    @staticmethod
+    def _new_posting():
+        return array('q')
+
+    def _advance_watermark(self, updated_at):
+        if updated_at and (self.watermark is None or updated_at > self.watermark):
+            self.watermark = updated_at
+
+    def _upsert_row(self, row):
+        with self.lock:
+            self._remove(row['id'])
+            if row['is_active']:
+                self._add(IndexedPart(row))
+            self._advance_watermark(row.get('updated_at') or timezone.now())
+
+    def _add(self, entry, sort_tokens=True):
+        self.entries[entry.id] = entry
+        for token in entry.tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = ids = set()
+                if sort_tokens:
+                    insort(self.tokens, token)
+                else:
+                    self.tokens.append(token)
+            ids.add(entry.id)
+        trigram_postings = self.trigram_postings
+        for gram in trigrams(entry.text):
+            trigram_postings[gram].append(entry.id)
+
+    def _remove(self, part_id):
+        entry = self.entries.pop(part_id, None)
+        if entry is None:
+            return
+        for token in entry.tokens:
+            ids = self.postings[token]
+            ids.discard(part_id)
+            if not ids:
+                del self.postings[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+        for gram in trigrams(entry.text):
+            posting = self.trigram_postings[gram]
+            posting.remove(part_id)
+            if not posting:
+                del self.trigram_postings[gram]
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def _prefix_ids(self, prefix):
+        """Ids whose tokens start with prefix, in token order"""
+        position = bisect_left(self.tokens, prefix)
+        while position < len(self.tokens) and self.tokens[position].startswith(prefix):
+            yield from sorted(self.postings[self.tokens[position]])
+            position += 1
+
+    def _infix_ids(self, text):
+        """Ids whose normalized text contains text (needs 3+ characters)"""
+        grams = trigrams(text)
+        if not grams:
+            return []
+        postings = [self.trigram_postings.get(gram) for gram in grams]
+        if not all(postings):
+            return []
+        rarest = min(postings, key=len)
+        return [part_id for part_id in rarest if text in self.entries[part_id].text]
+
+    def search(self, query, limit=20, borrowable_only=True):
+        """Top matches for query ranked exact > prefix > word > substring"""
+        self.ensure_current()
+        terms = split_terms(query)
+        if not terms:
+            return []
+
+        text = normalize_text(query)
+        number_key = normalize_part_number(query)
+        pool = max(limit, RANKING_POOL)
+
+        with self.lock:
+            matches = []
+            seen = set()
+
+            def accept(part_id, check_terms=True):
+                if part_id in seen:
+                    return
+                seen.add(part_id)
+                entry = self.entries[part_id]
+                if borrowable_only and not entry.is_available_for_borrowing:
+                    return
+                if check_terms and len(terms) > 1 and not all(
+                        any(token.startswith(term) for token in entry.tokens) for term in terms):
+                    return
+                matches.append(entry)
+
+            # Part numbers starting with the whole query go in first, so an
+            # exact or prefix part number hit is never crowded out of the pool
+            if number_key and len(terms) > 1:
+                for part_id in islice(self._prefix_ids(number_key), pool):
+                    accept(part_id, check_terms=False)
+
+            lead = max(terms, key=len)
+            examined = 0
+            for part_id in self._prefix_ids(lead):
+                if len(matches) >= pool or examined >= MAX_CANDIDATES:
+                    break
+                accept(part_id)
+                examined += 1
+
+            if len(matches) < pool and len(text) >= 3:
+                for part_id in sorted(self._infix_ids(text)):
+                    accept(part_id, check_terms=False)
+                    if len(matches) >= pool:
+                        break
+
+            # Stable on the scan order above for equal scores
+            ranked = heapq.nlargest(
+                limit,
+                enumerate(matches),
+                key=lambda item: (item[1].score(text, number_key), -item[0]),
+            )
+            return [entry for _, entry in ranked]
+
+
+# One index per worker process
+index = AutocompleteIndex()
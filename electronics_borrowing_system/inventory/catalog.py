@@ -0,0 +1,75 @@
+# ============================================================================
+# inventory/catalog.py
+# ============================================================================
+#
+# Versioned snapshots of the borrowable catalog.
+#
+# Every change to the inventory bumps a generation counter held in the
+# cache.  Snapshots are cached under the generation they were built from,
+# so a bump makes every old snapshot unreachable without having to know
+# their keys; they simply expire.  The counter is bumped by the
+# ElectronicPart/Category save and delete handlers in inventory/models.py
+# (which also covers ElectronicPart.borrow/return_parts, as both save).
+# Code that changes stock with queryset.update() must call
+# bump_generation() itself.
+#
+# The counter lives in the cache, so all workers must share it (see CACHES
+# in settings); with a per-process LocMemCache each worker would only see
+# its own bumps.
+
+import time
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+GENERATION_KEY = 'inventory:generation'
+SNAPSHOT_TIMEOUT = 60 * 60
+
+
+# Highest generation this process has seen
+_last_seen = 0
+
+
+def _initial_generation():
+    # Start from the clock rather than 1, so a counter that was evicted
+    # never comes back at a value that old snapshots are still cached under
+    return max(int(time.time() * 1000), _last_seen + 1)
+
+
+def _seen(generation):
+    global _last_seen
+    _last_seen = max(_last_seen, generation)
+    return generation
+
+
+def get_generation():
+    """Current inventory generation"""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _initial_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return _seen(generation)
+
+
+def bump_generation():
+    """Invalidate every catalog snapshot; call after any inventory change"""
+    try:
+        return _seen(cache.incr(GENERATION_KEY))
+    except ValueError:
+        # Not set (or evicted): start above anything seen before
+        cache.add(GENERATION_KEY, _initial_generation(), timeout=None)
+        return _seen(cache.get(GENERATION_KEY))
+
+
+def snapshot_key(name, language=None):
+    return f'inventory:catalog:{name}:{language or get_language()}:{get_generation()}'
+
+
+def get_snapshot(name, build, language=None):
+    """Cached result of build() for the current generation and language"""
+    key = snapshot_key(name, language)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build()
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
@@ -0,0 +1,34 @@
+# ============================================================================
+# inventory/checks.py
+# ============================================================================
+#
+# Deployment checks.
+#
+# The catalog generation (inventory.catalog) and the dashboard fragment tag
+# versions (borrowing.fragments) are counters bumped with cache.incr().  Only
+# a cache shared by every worker with an atomic incr() keeps those bumps;
+# Django's file, database and local-memory caches read and then write.
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose incr() is a read-then-write, or that aren't shared
+NON_ATOMIC_CACHE_BACKENDS = [
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
+
+@register(Tags.caches, deploy=True)
+def check_counter_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in NON_ATOMIC_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) has no atomic incr() shared by all workers.',
+        hint='Catalog and dashboard invalidation bumps can be lost with several '
+             'workers; use Redis or Memcached (see CACHES in settings).',
+        id='inventory.W001',
+    )]
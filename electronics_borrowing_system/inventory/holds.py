@@ -0,0 +1,157 @@
+# ============================================================================
+# inventory/holds.py
+# ============================================================================
+#
+# Time-limited stock holds.
+#
+# Validating availability places a short hold (HOLD_TTL) per part and
+# quantity for the student; submitting the request turns those into holds
+# referencing the request (REQUEST_HOLD_TTL).  Everyone else then sees
+#
+#     available_quantity - active holds
+#
+# so stock a student was just told about doesn't vanish before staff get to
+# the request.  Approval converts the request's holds into the real stock
+# decrement (inventory.stock honours other holders' holds, then the holds
+# are released); rejection releases them; expired holds stop counting at
+# once and are deleted later by the sweep_stock_holds command.
+#
+# Every lookup is "WHERE part_id IN (...) AND expires_at > now", served by
+# the (part, expires_at) index, so checks cost O(parts requested).
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Hold placed by validate_parts_availability
+HOLD_TTL = timedelta(minutes=15)
+
+# Hold of a submitted request waiting for approval
+REQUEST_HOLD_TTL = timedelta(days=3)
+
+# Expired holds deleted per sweeper statement
+SWEEP_BATCH_SIZE = 1000
+
+
+def active_holds(now=None):
+    from .models import StockHold
+
+    return StockHold.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def others_holds(holder=None, reference_ids=()):
+    """Active holds, minus the holder's validation holds and the given references"""
+    holds = active_holds()
+    if holder is not None:
+        holds = holds.exclude(holder=holder, reference_id='')
+    if reference_ids:
+        holds = holds.exclude(reference_id__in=list(reference_ids))
+    return holds
+
+
+def held_rows(part_ids, holder=None, reference_ids=()):
+    """The indexed GROUP BY behind held_quantities()"""
+    return (
+        others_holds(holder, reference_ids)
+        .filter(part_id__in=part_ids)
+        .order_by()
+        .values('part_id')
+        .annotate(held=Sum('quantity'))
+    )
+
+
+def held_quantities(part_ids, holder=None, reference_ids=()):
+    """{part_id: units held by others}"""
+    return {row['part_id']: row['held'] for row in held_rows(part_ids, holder, reference_ids)}
+
+
+def held_expression(holder=None, reference_ids=()):
+    """Per-row SQL expression of held_quantities(), for ElectronicPart querysets"""
+    held = (
+        others_holds(holder, reference_ids)
+        .filter(part_id=OuterRef('pk'))
+        .order_by()
+        .values('part_id')
+        .annotate(held=Sum('quantity'))
+        .values('held')
+    )
+    return Coalesce(Subquery(held, output_field=IntegerField()), Value(0))
+
+
+def net_available(parts, holder=None, reference_ids=()):
+    """{part_id: available_quantity - units held by others} for fetched parts"""
+    held = held_quantities([part.pk for part in parts], holder, reference_ids)
+    return {part.pk: part.available_quantity - held.get(part.pk, 0) for part in parts}
+
+
+def place(holder, lines, reference_id='', ttl=HOLD_TTL):
+    """Replace the holder's holds for reference_id with holds for (part_id, quantity) lines
+
+    The parts are locked and re-checked against others' holds before the
+    holds go in, so two holders can't both be promised the last units;
+    raises stock.InsufficientStock, placing nothing, if a part falls short.
+    """
+    from .models import StockHold
+    from .stock import InsufficientStock, locked_quantities
+
+    wanted = defaultdict(int)
+    for part_id, quantity in lines:
+        if quantity > 0:
+            wanted[part_id] += quantity
+
+    with transaction.atomic():
+        on_shelf = locked_quantities(list(wanted), borrowable_only=False)
+        held = held_quantities(list(wanted), holder, [reference_id] if reference_id else ())
+        for part_id, quantity in sorted(wanted.items()):
+            if quantity > on_shelf.get(part_id, 0) - held.get(part_id, 0):
+                raise InsufficientStock(part_id, quantity)
+
+        StockHold.objects.filter(holder=holder, reference_id=reference_id).delete()
+        expires_at = timezone.now() + ttl
+        return StockHold.objects.bulk_create([
+            StockHold(part_id=part_id, holder=holder, quantity=quantity,
+                      reference_id=reference_id, expires_at=expires_at)
+            for part_id, quantity in wanted.items()
+        ])
+
+
+def release(reference_ids):
+    """Drop the holds of approved (converted) or rejected requests"""
+    from .models import StockHold
+
+    return StockHold.objects.filter(reference_id__in=[str(r) for r in reference_ids]).delete()[0]
+
+
+def release_validation(holder):
+    """Drop the holder's validation holds, e.g. once the request is submitted"""
+    from .models import StockHold
+
+    return StockHold.objects.filter(holder=holder, reference_id='').delete()[0]
+
+
+def expired(now=None):
+    """Ids of expired holds, oldest first (the sweeper's batches)"""
+    from .models import StockHold
+
+    return (
+        StockHold.objects.filter(expires_at__lte=now or timezone.now())
+        .order_by('expires_at')
+        .values_list('pk', flat=True)
+    )
+
+
+def sweep(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """Delete expired holds in batches; returns how many were deleted"""
+    from .models import StockHold
+
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        batch = list(expired(now)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += StockHold.objects.filter(pk__in=batch).delete()[0]
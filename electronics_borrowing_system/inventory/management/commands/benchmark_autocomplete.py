@@ -0,0 +1,87 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.autocomplete import AutocompleteIndex
+from inventory.models import ElectronicPart
+from inventory.search import search_parts
+from inventory.seed import seed_catalog
+
+QUERIES = [
+    'ar', 'ard', 'arduino', 'us-hc', 'sr04', 'lcd-16', 'led', 'servo motor',
+    'حس', 'حساس', 'اردوينو', 'مقاومات', 'سيرفو', 'ras', '2n22', '004321',
+]
+
+
+def orm_autocomplete(query, limit=20):
+    """The parts_autocomplete query path before the in-process index"""
+    parts = search_parts(
+        ElectronicPart.objects.filter(is_active=True),
+        query
+    ).select_related('category').order_by('category__name_ar', 'name_ar')[:limit]
+    return [part for part in parts if part.is_available_for_borrowing]
+
+
+def timed(func, query, repeat):
+    """Per-call wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+class Command(BaseCommand):
+    help = 'Compare the autocomplete ORM path with the in-process index on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parts', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--memory', action='store_true',
+                            help='Also measure index memory with tracemalloc (slow)')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        # Everything happens in a transaction that is rolled back at the end
+        with transaction.atomic():
+            started = time.perf_counter()
+            seed_catalog(parts=options['parts'])
+            self.stdout.write(f"Seeded {options['parts']} parts in {time.perf_counter() - started:.1f}s")
+
+            index = AutocompleteIndex()
+            started = time.perf_counter()
+            index.build()
+            self.stdout.write(
+                f'Index build: {time.perf_counter() - started:.2f}s, {len(index.entries)} parts, '
+                f'{len(index.tokens)} tokens, {len(index.trigram_postings)} trigrams'
+            )
+
+            if options['memory']:
+                tracemalloc.start()
+                AutocompleteIndex().build()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(f'Index memory: peak {peak / 1024 / 1024:.0f} MB while building')
+
+            self.stdout.write(f"\n{'query':<14}{'orm ms':>10}{'index ms':>10}{'speedup':>10}{'hits':>6}")
+            orm_total = index_total = 0.0
+            for query in QUERIES:
+                orm_ms = statistics.median(timed(orm_autocomplete, query, repeat))
+                index_ms = statistics.median(timed(index.search, query, repeat))
+                orm_total += orm_ms
+                index_total += index_ms
+                self.stdout.write(
+                    f'{query:<14}{orm_ms:>10.2f}{index_ms:>10.3f}'
+                    f'{orm_ms / max(index_ms, 1e-6):>9.0f}x{len(index.search(query)):>6}'
+                )
+            self.stdout.write(
+                f"{'median sum':<14}{orm_total:>10.2f}{index_total:>10.3f}"
+                f'{orm_total / max(index_total, 1e-6):>9.0f}x'
+            )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory import holds
+
+
+class Command(BaseCommand):
+    help = 'Delete expired stock holds in batches (run from cron, or with --interval as a loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=holds.SWEEP_BATCH_SIZE)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep sweeping every INTERVAL seconds instead of exiting')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = holds.sweep(batch_size=options['batch_size'])
+            self.stdout.write(f'Deleted {deleted} expired stock hold(s)')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# Frozen copies of inventory.search constants so later changes there don't
+# rewrite history
+FTS_TABLE = 'inventory_electronicpart_fts'
+PARTS_TABLE = 'inventory_electronicpart'
+INDEXED_FIELDS = [
+    'name_ar',
+    'name_en',
+    'part_number',
+    'description_ar',
+    'description_en',
+    'manufacturer',
+    'model',
+]
+FIELD_WEIGHTS = {
+    'name_ar': 'A',
+    'name_en': 'A',
+    'part_number': 'A',
+    'manufacturer': 'B',
+    'model': 'B',
+    'description_ar': 'C',
+    'description_en': 'C',
+}
+
+
+def create_search_index(apps, schema_editor):
+    """Create the full-text index for the current backend and fill it"""
+    vendor = schema_editor.connection.vendor
+    columns = ', '.join(INDEXED_FIELDS)
+
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5({columns}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {columns}) SELECT id, {columns} FROM {PARTS_TABLE}'
+            )
+        elif vendor == 'postgresql':
+            vector = ' || '.join(
+                f"setweight(to_tsvector('simple', coalesce({field}, '')), '{FIELD_WEIGHTS[field]}')"
+                for field in INDEXED_FIELDS
+            )
+            cursor.execute(f'ALTER TABLE {PARTS_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS inventory_part_search_gin '
+                f'ON {PARTS_TABLE} USING GIN (search_vector)'
+            )
+            cursor.execute(f'UPDATE {PARTS_TABLE} SET search_vector = {vector}')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS inventory_part_search_gin')
+            cursor.execute(f'ALTER TABLE {PARTS_TABLE} DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_remove_category_description_ar_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,143 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:24
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Frozen copies of inventory.search as of this migration, so later changes
+# there don't rewrite history
+ARABIC_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ى': 'ي',
+    'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+    '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+})
+WHITESPACE_RE = re.compile(r'\s+')
+TERM_SPLIT_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    value = ARABIC_DIACRITICS_RE.sub('', value).translate(ARABIC_LETTER_MAP)
+    value = ''.join(
+        char for char in unicodedata.normalize('NFKD', value)
+        if not unicodedata.combining(char)
+    )
+    return WHITESPACE_RE.sub(' ', value.casefold()).strip()
+
+
+def normalize_part_number(value):
+    return TERM_SPLIT_RE.sub('', normalize_text(value))
+
+
+FTS_TABLE = 'inventory_electronicpart_fts'
+INDEXED_FIELDS = [
+    'name_ar',
+    'name_en',
+    'part_number',
+    'description_ar',
+    'description_en',
+    'manufacturer',
+    'model',
+]
+FIELD_WEIGHTS = {
+    'name_ar': 'A',
+    'name_en': 'A',
+    'part_number': 'A',
+    'manufacturer': 'B',
+    'model': 'B',
+    'description_ar': 'C',
+    'description_en': 'C',
+}
+
+
+def fill_search_keys(apps, schema_editor):
+    """Backfill normalized keys and re-index parts with normalized text"""
+    Category = apps.get_model('inventory', 'Category')
+    ElectronicPart = apps.get_model('inventory', 'ElectronicPart')
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.name_ar_normalized = normalize_text(category.name_ar)
+        category.name_en_normalized = normalize_text(category.name_en)
+    Category.objects.bulk_update(categories, ['name_ar_normalized', 'name_en_normalized'])
+
+    parts = list(ElectronicPart.objects.all())
+    for part in parts:
+        part.name_ar_normalized = normalize_text(part.name_ar)
+        part.name_en_normalized = normalize_text(part.name_en)
+        part.part_number_normalized = normalize_part_number(part.part_number)
+    ElectronicPart.objects.bulk_update(
+        parts, ['name_ar_normalized', 'name_en_normalized', 'part_number_normalized']
+    )
+
+    documents = [
+        [normalize_text(getattr(part, field)) for field in INDEXED_FIELDS] + [part.pk]
+        for part in parts
+    ]
+    columns = ', '.join(INDEXED_FIELDS)
+    placeholders = ', '.join(['%s'] * len(INDEXED_FIELDS))
+
+    with schema_editor.connection.cursor() as cursor:
+        if schema_editor.connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} ({columns}, rowid) VALUES ({placeholders}, %s)',
+                documents
+            )
+        elif schema_editor.connection.vendor == 'postgresql':
+            vector = ' || '.join(
+                f"setweight(to_tsvector('simple', %s), '{FIELD_WEIGHTS[field]}')"
+                for field in INDEXED_FIELDS
+            )
+            cursor.executemany(
+                f'UPDATE inventory_electronicpart SET search_vector = {vector} WHERE id = %s',
+                documents
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_electronicpart_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='name_ar_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='name_en_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='electronicpart',
+            name='name_ar_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='electronicpart',
+            name='name_en_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='electronicpart',
+            name='part_number_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
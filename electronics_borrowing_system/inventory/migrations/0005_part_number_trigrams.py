@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def part_number_trigrams(key):
+    """Frozen copy of inventory.search.part_number_trigrams, over the normalized key"""
+    if not key:
+        return set()
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def fill_part_number_trigrams(apps, schema_editor):
+    """Build the side table for existing parts (PostgreSQL uses pg_trgm instead)"""
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    ElectronicPart = apps.get_model('inventory', 'ElectronicPart')
+    PartNumberTrigram = apps.get_model('inventory', 'PartNumberTrigram')
+
+    rows = []
+    # part_number_normalized was filled by 0004
+    for part_id, part_number in ElectronicPart.objects.values_list('id', 'part_number_normalized'):
+        grams = part_number_trigrams(part_number)
+        rows.extend(
+            PartNumberTrigram(part_id=part_id, trigram=gram, gram_count=len(grams))
+            for gram in grams
+        )
+    PartNumberTrigram.objects.bulk_create(rows, batch_size=5000)
+
+
+def create_pg_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS inventory_part_number_trgm '
+            'ON inventory_electronicpart USING GIN (part_number_normalized gin_trgm_ops)'
+        )
+
+
+def drop_pg_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP INDEX IF EXISTS inventory_part_number_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_search_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartNumberTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('gram_count', models.PositiveSmallIntegerField()),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='part_number_trigrams', to='inventory.electronicpart')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'part', 'gram_count'], name='inventory_p_trigram_0bc831_idx')],
+            },
+        ),
+        migrations.RunPython(fill_part_number_trigrams, migrations.RunPython.noop),
+        migrations.RunPython(create_pg_trgm_index, drop_pg_trgm_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_part_number_trigrams'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='electronicpart',
+            index=models.Index(fields=['status', 'is_active', 'condition', 'available_quantity'], name='inventory_part_borrowable_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_borrowable_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='electronicpart',
+            index=models.Index(fields=['updated_at'], name='inventory_part_updated_idx'),
+        ),
+    ]
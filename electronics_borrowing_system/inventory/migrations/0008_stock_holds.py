@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_audit_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('reference_id', models.CharField(blank=True, max_length=100, verbose_name='Reference ID')),
+                ('expires_at', models.DateTimeField(verbose_name='Expires At')),
+                ('holder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to=settings.AUTH_USER_MODEL, verbose_name='Held By')),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='inventory.electronicpart', verbose_name='Part')),
+            ],
+            options={
+                'verbose_name': 'Stock Hold',
+                'verbose_name_plural': 'Stock Holds',
+                'indexes': [models.Index(fields=['part', 'expires_at'], name='inventory_hold_part_idx'), models.Index(fields=['reference_id'], name='inventory_hold_reference_idx'), models.Index(fields=['holder', 'reference_id'], name='inventory_hold_holder_idx'), models.Index(fields=['expires_at'], name='inventory_hold_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_stock_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electronicpart',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Version'),
+        ),
+    ]
@@ -2,12 +2,14 @@
 # inventory/models.py (Create this new app)
 # ============================================================================
 
-from django.db import models
+from django.db import models, router
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .search import BORROWABLE_CONDITIONS, PART_KEY_FIELDS, borrowable_q
+
 
 class TimestampedModel(models.Model):
     """Abstract base model with timestamp fields"""
@@ -26,6 +28,10 @@ class Category(TimestampedModel):
     icon = models.CharField(_('Icon Class'), max_length=50, default='fas fa-microchip')
     is_active = models.BooleanField(_('Is Active'), default=True)
 
+    # Normalized search keys (see inventory.search.normalize_text), set on save
+    name_ar_normalized = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    name_en_normalized = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+
     class Meta:
         verbose_name = _('Category')
         verbose_name_plural = _('Categories')
@@ -43,6 +49,22 @@ class Category(TimestampedModel):
         return self.name_en
 
 
+class ElectronicPartQuerySet(models.QuerySet):
+    """Availability filters evaluated in SQL"""
+
+    def borrowable(self):
+        """Parts that can be lent out now (is_available_for_borrowing)"""
+        return self.filter(borrowable_q())
+
+    def can_borrow_qty(self, quantity):
+        """Borrowable parts with at least quantity units on the shelf"""
+        return self.borrowable().filter(available_quantity__gte=quantity)
+
+    def low_stock(self):
+        """Active parts at or below their minimum stock (is_low_stock)"""
+        return self.filter(is_active=True, available_quantity__lte=models.F('minimum_stock'))
+
+
 class ElectronicPart(TimestampedModel):
     """Electronic parts inventory"""
 
@@ -129,14 +151,84 @@ class ElectronicPart(TimestampedModel):
     notes = models.TextField(_('Notes'), blank=True)
     is_active = models.BooleanField(_('Is Active'), default=True)
 
+    # Normalized search keys (see inventory.search.normalize_text), set on save
+    name_ar_normalized = models.CharField(max_length=200, blank=True, editable=False, db_index=True)
+    name_en_normalized = models.CharField(max_length=200, blank=True, editable=False, db_index=True)
+    part_number_normalized = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+
+    # Optimistic concurrency counter (see inventory.versioning)
+    version = models.PositiveIntegerField(_('Version'), default=0, editable=False)
+
+    objects = ElectronicPartQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Electronic Part')
         verbose_name_plural = _('Electronic Parts')
         ordering = ['name_ar']
+        indexes = [
+            # borrowable()/can_borrow_qty(): equality columns first, then
+            # the IN list, then the quantity range (see borrowable_q)
+            models.Index(
+                fields=['status', 'is_active', 'condition', 'available_quantity'],
+                name='inventory_part_borrowable_idx',
+            ),
+            # Autocomplete delta refresh (updated_at > watermark)
+            models.Index(fields=['updated_at'], name='inventory_part_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name_ar} ({self.part_number})"
 
+    def save(self, *args, **kwargs):
+        """Compare-and-swap on version for existing rows; StaleWrite if it moved
+
+        Existing rows are written with one conditional UPDATE through the
+        manager, sending the usual save signals around it.  With
+        update_fields only those columns (plus version, updated_at and the
+        search keys derived from them) are written; unknown names raise
+        ValueError, as in Model.save().
+        """
+        from django.db.models.signals import post_save, pre_save
+        from .versioning import StaleWrite, bump
+
+        if self._state.adding or self.pk is None or kwargs.get('force_insert'):
+            return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if not update_fields:
+                return
+            fields = {field.attname: field.name for field in self._meta.concrete_fields if not field.primary_key}
+            unknown = set(update_fields) - fields.keys() - set(fields.values())
+            if unknown:
+                raise ValueError(
+                    'The following fields do not exist in this model, are m2m fields, or are '
+                    'non-concrete fields: %s' % ', '.join(sorted(unknown))
+                )
+            update_fields = {fields.get(name, name) for name in update_fields}
+            # The pre_save handler re-derives the search keys of changed names
+            update_fields |= {key for source, key in PART_KEY_FIELDS.items() if source in update_fields}
+            update_fields = frozenset({*update_fields, 'updated_at'})
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+
+        pre_save.send(sender=type(self), instance=self, raw=False, using=using, update_fields=update_fields)
+        values = {
+            field.attname: field.pre_save(self, False)
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.name != 'version' and (
+                update_fields is None or field.name in update_fields
+            )
+        }
+        updated = type(self).objects.using(using).filter(pk=self.pk, version=self.version).update(
+            version=bump(), **values
+        )
+        if not updated:
+            raise StaleWrite(self.pk, self.version)
+
+        self.version += 1
+        self._state.db = using
+        post_save.send(sender=type(self), instance=self, created=False, update_fields=update_fields,
+                       raw=False, using=using)
+
     @property
     def name(self):
         """Return name based on current language"""
@@ -164,7 +256,7 @@ class ElectronicPart(TimestampedModel):
         return (
                 self.status == 'available' and
                 self.available_quantity > 0 and
-                self.condition in ['excellent', 'good'] and
+                self.condition in BORROWABLE_CONDITIONS and
                 self.is_active
         )
 
@@ -176,28 +268,41 @@ class ElectronicPart(TimestampedModel):
         )
 
     def borrow(self, quantity=1):
-        """Borrow parts (reduce available quantity)"""
-        if self.can_borrow(quantity):
-            self.available_quantity -= quantity
-            if self.available_quantity == 0:
-                self.status = 'borrowed'
-            self.save()
-            return True
-        return False
+        """Borrow parts (reduce available quantity)
+
+        Done as a conditional UPDATE (inventory.stock.reserve), so concurrent
+        borrows can't oversell; False if the stock is no longer there.
+        """
+        from .stock import InsufficientStock, reserve
+
+        try:
+            reserve([(self.pk, quantity)])
+        except InsufficientStock:
+            return False
+        self.refresh_from_db(fields=['available_quantity', 'status', 'updated_at', 'version'])
+        return True
 
     def return_parts(self, quantity=1, condition='excellent'):
-        """Return borrowed parts"""
-        self.available_quantity += quantity
-        if self.available_quantity <= self.total_quantity:
-            self.status = 'available'
+        """Return borrowed parts
+
+        Saves only the stock columns, re-applied to fresh values if the row
+        changed meanwhile (inventory.versioning.save_with_retry).
+        """
+        from .versioning import save_with_retry
 
-        # Update condition if parts are damaged
-        if condition in ['damaged', 'out_of_order']:
-            self.condition = condition
-            if condition == 'out_of_order':
-                self.status = 'maintenance'
+        def give_back(part):
+            part.available_quantity += quantity
+            if part.available_quantity <= part.total_quantity:
+                part.status = 'available'
 
-        self.save()
+            # Update condition if parts are damaged
+            if condition in ['damaged', 'out_of_order']:
+                part.condition = condition
+                if condition == 'out_of_order':
+                    part.status = 'maintenance'
+            return ['available_quantity', 'status', 'condition']
+
+        save_with_retry(self, give_back)
 
 
 class InventoryTransaction(TimestampedModel):
@@ -269,9 +374,74 @@ class PartSpecification(models.Model):
         return f"{self.name}: {self.value}{unit_str}"
 
 
+class PartNumberTrigram(models.Model):
+    """Precomputed part number trigrams for typo-tolerant lookup on SQLite
+
+    PostgreSQL uses pg_trgm on part_number_normalized instead, so this table
+    stays empty there.
+    """
+    part = models.ForeignKey(
+        ElectronicPart,
+        on_delete=models.CASCADE,
+        related_name='part_number_trigrams'
+    )
+    trigram = models.CharField(max_length=3)
+    # Number of distinct trigrams of the part number, for the similarity ratio
+    gram_count = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            # Covering index for the similarity aggregate
+            models.Index(fields=['trigram', 'part', 'gram_count']),
+        ]
+
+    def __str__(self):
+        return f"{self.part_id}: {self.trigram}"
+
+
+class StockHold(TimestampedModel):
+    """Stock set aside for a student until it is approved, released or expires
+
+    Validation holds have an empty reference_id; holds of a submitted
+    request carry the request id.  See inventory.holds.
+    """
+    part = models.ForeignKey(
+        ElectronicPart,
+        on_delete=models.CASCADE,
+        related_name='holds',
+        verbose_name=_('Part')
+    )
+    holder = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stock_holds',
+        verbose_name=_('Held By')
+    )
+    quantity = models.PositiveIntegerField(_('Quantity'))
+    reference_id = models.CharField(_('Reference ID'), max_length=100, blank=True)  # Link to borrow request
+    expires_at = models.DateTimeField(_('Expires At'))
+
+    class Meta:
+        verbose_name = _('Stock Hold')
+        verbose_name_plural = _('Stock Holds')
+        indexes = [
+            # Active holds per part: WHERE part_id IN (...) AND expires_at > now
+            models.Index(fields=['part', 'expires_at'], name='inventory_hold_part_idx'),
+            models.Index(fields=['reference_id'], name='inventory_hold_reference_idx'),
+            models.Index(fields=['holder', 'reference_id'], name='inventory_hold_holder_idx'),
+            # The sweeper's expired range scan
+            models.Index(fields=['expires_at'], name='inventory_hold_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.part_id} x{self.quantity} ({self.holder_id}, {self.expires_at:%Y-%m-%d %H:%M})"
+
+
 # Signal handlers for automatic inventory tracking
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
+from . import autocomplete, catalog, search
 
 
 @receiver(post_save, sender=ElectronicPart)
@@ -288,3 +458,47 @@ def log_inventory_change(sender, instance, created, **kwargs):
             performed_by=instance.added_by,
             reason='Initial inventory addition'
         )
+
+
+@receiver(pre_save, sender=Category)
+def set_category_search_keys(sender, instance, **kwargs):
+    """Refresh the normalized name keys used for prefix search"""
+    search.set_category_keys(instance)
+
+
+@receiver(pre_save, sender=ElectronicPart)
+def set_part_search_keys(sender, instance, **kwargs):
+    """Refresh the normalized name/part number keys used for prefix search"""
+    search.set_part_keys(instance)
+
+
+@receiver(post_save, sender=ElectronicPart)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """Keep the search, part number trigram and autocomplete indexes in sync"""
+    # Partial saves that don't touch searchable text skip the index writes
+    if update_fields is None or set(update_fields) & set(search.INDEXED_FIELDS):
+        search.index_part(instance)
+    if update_fields is None or 'part_number' in update_fields:
+        search.index_part_number(instance)
+    transaction.on_commit(lambda: autocomplete.index.part_saved(instance))
+
+
+@receiver(post_delete, sender=ElectronicPart)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Drop deleted parts from the full-text search and autocomplete indexes"""
+    part_id = instance.pk
+    search.remove_part(part_id)
+    transaction.on_commit(lambda: autocomplete.index.part_deleted(part_id))
+
+
+@receiver(post_save, sender=Category)
+def update_autocomplete_categories(sender, instance, **kwargs):
+    """Category names are denormalized into the autocomplete index"""
+    transaction.on_commit(lambda: autocomplete.index.category_saved(instance))
+
+
+@receiver([post_save, post_delete], sender=ElectronicPart)
+@receiver([post_save, post_delete], sender=Category)
+def bump_catalog_generation(sender, **kwargs):
+    """Any part/category change (stock included) invalidates catalog snapshots"""
+    transaction.on_commit(catalog.bump_generation)
@@ -0,0 +1,543 @@
+# ============================================================================
+# inventory/search.py
+# ============================================================================
+#
+# Full-text search index for ElectronicPart.
+#
+# SQLite: an FTS5 virtual table (inventory_electronicpart_fts) whose rowid is
+# the part id.  PostgreSQL: a tsvector column on the parts table with a GIN
+# index.  Both are created by migration 0003 and kept in sync by the
+# post_save/post_delete handlers in inventory/models.py.  Any other backend
+# falls back to the old icontains chain.
+#
+# Typo-tolerant part number lookup (similar_parts) uses pg_trgm on
+# PostgreSQL and the PartNumberTrigram side table everywhere else.
+#
+# Everything that goes into the index, and every query, is passed through
+# normalize_text() first so Arabic spelling variants match each other.
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection, connections, transaction
+from django.db.models import BooleanField, Case, Count, F, FloatField, IntegerField, Max, Q, Value, When
+from django.db.models.expressions import ExpressionWrapper, RawSQL
+
+FTS_TABLE = 'inventory_electronicpart_fts'
+PARTS_TABLE = 'inventory_electronicpart'
+
+# Columns that go into the index, in index column order
+INDEXED_FIELDS = [
+    'name_ar',
+    'name_en',
+    'part_number',
+    'description_ar',
+    'description_en',
+    'manufacturer',
+    'model',
+]
+
+# PostgreSQL tsvector weights; also lets a query be limited to some columns
+FIELD_WEIGHTS = {
+    'name_ar': 'A',
+    'name_en': 'A',
+    'part_number': 'A',
+    'manufacturer': 'B',
+    'model': 'B',
+    'description_ar': 'C',
+    'description_en': 'C',
+}
+
+# Name-like columns used when resolving a typed part name to one part
+NAME_FIELDS = ['name_ar', 'name_en', 'part_number']
+
+# Minimum trigram similarity for a part number to count as a near match;
+# the same default as pg_trgm.similarity_threshold
+TRIGRAM_THRESHOLD = 0.3
+
+# Similarity at which a typed part number is linked to a part without asking
+# (about one wrong character in an 8 character part number); weaker matches
+# are only offered as suggestions
+AUTO_LINK_THRESHOLD = 0.5
+
+# Relevance tiers; the availability boost only reorders within a tier
+SCORE_EXACT = 100
+SCORE_PREFIX = 75
+SCORE_WORD = 50
+SCORE_SUBSTRING = 25
+AVAILABILITY_BOOST = 10
+
+# Conditions a part can be lent out in (ElectronicPart.is_available_for_borrowing)
+BORROWABLE_CONDITIONS = ('excellent', 'good')
+
+# Normalized, prefix-indexed key columns on ElectronicPart and Category
+PART_KEY_FIELDS = {
+    'name_ar': 'name_ar_normalized',
+    'name_en': 'name_en_normalized',
+    'part_number': 'part_number_normalized',
+}
+CATEGORY_KEY_FIELDS = [
+    'category__name_ar_normalized',
+    'category__name_en_normalized',
+]
+
+# Tashkeel (fathatan .. sukun, extended marks), superscript alef and tatweel
+ARABIC_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+
+ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ى': 'ي',
+    'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+    # Arabic-Indic and extended Arabic-Indic digits
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+    '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+})
+
+# Combining diacritical marks left behind by NFKD (Latin accents etc.)
+COMBINING_MARKS_RE = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Anything that is not a letter, digit or underscore splits a search term,
+# which matches how the unicode61 tokenizer splits "US-HC-SR04"
+TERM_SPLIT_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def borrowable_q(prefix=''):
+    """SQL form of ElectronicPart.is_available_for_borrowing
+
+    prefix reaches parts through a relation, e.g. borrowable_q('parts__').
+    Keep in step with the inventory_part_borrowable_idx column order.
+    """
+    return Q(**{
+        f'{prefix}status': 'available',
+        f'{prefix}available_quantity__gt': 0,
+        f'{prefix}condition__in': BORROWABLE_CONDITIONS,
+        f'{prefix}is_active': True,
+    })
+
+
+def get_backend(conn=None):
+    """Return the index flavour for the current database: sqlite, postgresql or None"""
+    vendor = (conn or connection).vendor
+    if vendor in ('sqlite', 'postgresql'):
+        return vendor
+    return None
+
+
+def normalize_text(value):
+    """Lowercase, strip diacritics and fold Arabic letter variants"""
+    if not value:
+        return ''
+    value = ARABIC_DIACRITICS_RE.sub('', value).translate(ARABIC_LETTER_MAP)
+    if not value.isascii():
+        # Latin accents: decompose and drop the combining marks
+        value = COMBINING_MARKS_RE.sub('', unicodedata.normalize('NFKD', value))
+    return WHITESPACE_RE.sub(' ', value.casefold()).strip()
+
+
+def normalize_part_number(value):
+    """Normalized part number with separators removed, e.g. 'US-HC-SR04' -> 'ushcsr04'"""
+    return TERM_SPLIT_RE.sub('', normalize_text(value))
+
+
+def set_part_keys(part):
+    """Fill the normalized key columns of an ElectronicPart (pre_save, bulk_create)"""
+    part.name_ar_normalized = normalize_text(part.name_ar)
+    part.name_en_normalized = normalize_text(part.name_en)
+    part.part_number_normalized = normalize_part_number(part.part_number)
+
+
+def set_category_keys(category):
+    """Fill the normalized key columns of a Category"""
+    category.name_ar_normalized = normalize_text(category.name_ar)
+    category.name_en_normalized = normalize_text(category.name_en)
+
+
+def split_terms(query):
+    """Split a free-text query into normalized index terms"""
+    return [term for term in TERM_SPLIT_RE.split(normalize_text(query)) if term]
+
+
+def exact_key_filter(queries):
+    """Q for parts whose name or part number equals any of queries, normalized"""
+    text_keys = {normalize_text(query) for query in queries} - {''}
+    number_keys = {normalize_part_number(query) for query in queries} - {''}
+    return (
+        Q(**{f"{PART_KEY_FIELDS['part_number']}__in": number_keys})
+        | Q(**{f"{PART_KEY_FIELDS['name_ar']}__in": text_keys})
+        | Q(**{f"{PART_KEY_FIELDS['name_en']}__in": text_keys})
+    )
+
+
+def exact_key_match(part, query):
+    """In-memory counterpart of exact_key_filter for one fetched part"""
+    number_key = normalize_part_number(query)
+    text_key = normalize_text(query)
+    return bool(
+        (number_key and part.part_number_normalized == number_key)
+        or (text_key and text_key in (part.name_ar_normalized, part.name_en_normalized))
+    )
+
+
+def prefix_filter(field, prefix):
+    """Index-friendly prefix match on a normalized key column"""
+    if connection.vendor == 'sqlite':
+        # SQLite only uses an index for LIKE under NOCASE; a range scan always works
+        upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper_bound})
+    return Q(**{f'{field}__startswith': prefix})
+
+
+def key_filter(query, fields=None):
+    """Prefix match of the normalized query against the search key columns"""
+    text_key = normalize_text(query)
+    number_key = normalize_part_number(query)
+    condition = Q()
+
+    for field, key_field in PART_KEY_FIELDS.items():
+        if fields and field not in fields:
+            continue
+        key = number_key if field == 'part_number' else text_key
+        if key:
+            condition |= prefix_filter(key_field, key)
+
+    if not fields and text_key:
+        for key_field in CATEGORY_KEY_FIELDS:
+            condition |= prefix_filter(key_field, text_key)
+
+    return condition
+
+
+def build_match_query(query, backend, fields=None):
+    """Build a prefix-match expression for FTS5 MATCH or to_tsquery"""
+    terms = split_terms(query)
+    if not terms:
+        return ''
+
+    if backend == 'sqlite':
+        # "term"* is a quoted prefix query, so user input can't inject FTS syntax
+        match = ' '.join(f'"{term}"*' for term in terms)
+        if fields:
+            match = f"{{{' '.join(fields)}}} : ({match})"
+        return match
+
+    # to_tsquery prefix syntax; terms only contain word characters
+    weights = ''.join(sorted({FIELD_WEIGHTS[field] for field in fields})) if fields else ''
+    return ' & '.join(f'{term}:*{weights}' for term in terms)
+
+
+def fallback_filter(query, fields=None):
+    """icontains chain used when no full-text index is available"""
+    condition = Q()
+    for field in fields or INDEXED_FIELDS:
+        condition |= Q(**{f'{field}__icontains': query})
+    return condition
+
+
+def search_filter(query, fields=None):
+    """Return a Q object restricting ElectronicPart rows to index hits for query"""
+    backend = get_backend()
+    match = build_match_query(query, backend, fields)
+    keys = key_filter(query, fields)
+
+    if backend is None:
+        return fallback_filter(query, fields) | keys
+    if not match:
+        return keys or Q(pk__in=[])
+
+    if backend == 'sqlite':
+        hits = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+    else:
+        hits = RawSQL(
+            f"SELECT id FROM {PARTS_TABLE} WHERE search_vector @@ to_tsquery('simple', %s)",
+            (match,)
+        )
+    return Q(pk__in=hits) | keys
+
+
+def search_parts(queryset, query, fields=None):
+    """Filter a part queryset down to full-text matches for query"""
+    return queryset.filter(search_filter(query, fields))
+
+
+def relevance_expression(query):
+    """SQL score: exact part number/name > prefix > word > substring, +availability"""
+    text_key = normalize_text(query)
+    number_key = normalize_part_number(query)
+    name_fields = [PART_KEY_FIELDS['name_ar'], PART_KEY_FIELDS['name_en']]
+    number_field = PART_KEY_FIELDS['part_number']
+
+    exact = Q(**{number_field: number_key}) if number_key else Q(pk__in=[])
+    prefix = Q(**{f'{number_field}__startswith': number_key}) if number_key else Q(pk__in=[])
+    word = Q(pk__in=[])
+    for field in name_fields:
+        if text_key:
+            exact |= Q(**{field: text_key})
+            prefix |= Q(**{f'{field}__startswith': text_key})
+            word |= Q(**{f'{field}__contains': f' {text_key}'})
+
+    tier = Case(
+        When(exact, then=Value(SCORE_EXACT)),
+        When(prefix, then=Value(SCORE_PREFIX)),
+        When(word, then=Value(SCORE_WORD)),
+        default=Value(SCORE_SUBSTRING),
+        output_field=IntegerField(),
+    )
+    boost = Case(
+        When(borrowable_q(), then=Value(AVAILABILITY_BOOST)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return tier + boost
+
+
+def rank_by_relevance(queryset, query):
+    """Annotate ``relevance`` for query and order best first"""
+    return queryset.annotate(
+        relevance=relevance_expression(query)
+    ).order_by('-relevance', 'category__name_ar', 'name_ar', 'pk')
+
+
+def ranked_search(queryset, query, fields=None):
+    """Full-text matches annotated with ``relevance`` and ordered best first"""
+    return rank_by_relevance(search_parts(queryset, query, fields), query)
+
+
+def facet_rows(queryset):
+    """The single GROUP BY query behind facet_counts()"""
+    return queryset.order_by().annotate(
+        borrowable=Case(
+            When(borrowable_q(), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+    ).values(
+        'category_id', 'category__name_ar', 'category__name_en',
+        'condition', 'manufacturer', 'borrowable',
+    ).annotate(count=Count('pk'))
+
+
+def facet_counts(queryset):
+    """Category/condition/manufacturer/availability counts in one GROUP BY
+
+    Returns the facets together with the total, so callers don't need a
+    separate count() query for the same filtered set.
+    """
+    rows = facet_rows(queryset)
+
+    categories = {}
+    conditions = defaultdict(int)
+    manufacturers = defaultdict(int)
+    availability = {'borrowable': 0, 'unavailable': 0}
+    total = 0
+
+    for row in rows:
+        count = row['count']
+        total += count
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'],
+            'name_ar': row['category__name_ar'] or '',
+            'name_en': row['category__name_en'] or '',
+            'count': 0,
+        })
+        category['count'] += count
+        conditions[row['condition']] += count
+        manufacturers[row['manufacturer'] or ''] += count
+        availability['borrowable' if row['borrowable'] else 'unavailable'] += count
+
+    def by_count(counts):
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    return {
+        'total': total,
+        'categories': sorted(categories.values(), key=lambda c: (-c['count'], c['name_ar'])),
+        'conditions': [{'value': value, 'count': count} for value, count in by_count(conditions)],
+        'manufacturers': [{'value': value, 'count': count} for value, count in by_count(manufacturers)],
+        'availability': availability,
+    }
+
+
+def get_document(part):
+    """Normalized values stored in the index for a part, in INDEXED_FIELDS order"""
+    return [normalize_text(getattr(part, field, '')) for field in INDEXED_FIELDS]
+
+
+def weighted_vector_sql(values_sql):
+    """SQL for a weighted tsvector from one SQL expression per indexed field"""
+    return ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({value}, '')), '{FIELD_WEIGHTS[field]}')"
+        for field, value in zip(INDEXED_FIELDS, values_sql)
+    )
+
+
+def index_part(part):
+    """Insert or refresh a single part in the search index"""
+    backend = get_backend()
+    if backend is None:
+        return
+
+    document = get_document(part)
+    with connection.cursor() as cursor:
+        if backend == 'sqlite':
+            columns = ', '.join(INDEXED_FIELDS)
+            placeholders = ', '.join(['%s'] * len(INDEXED_FIELDS))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [part.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})',
+                [part.pk] + document
+            )
+        else:
+            vector = weighted_vector_sql(['%s'] * len(INDEXED_FIELDS))
+            cursor.execute(
+                f'UPDATE {PARTS_TABLE} SET search_vector = {vector} WHERE id = %s',
+                document + [part.pk]
+            )
+
+
+def remove_part(part_id):
+    """Drop a part from the search index"""
+    if get_backend() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [part_id])
+    # PostgreSQL keeps the vector on the parts row itself, so it goes with it
+
+
+def rebuild_index(conn=None):
+    """Re-index every part from scratch"""
+    conn = conn or connection
+    backend = get_backend(conn)
+    if backend is None:
+        return
+
+    columns = ', '.join(INDEXED_FIELDS)
+    with conn.cursor() as cursor:
+        cursor.execute(f'SELECT id, {columns} FROM {PARTS_TABLE}')
+        rows = [
+            [normalize_text(value) for value in row[1:]] + [row[0]]
+            for row in cursor.fetchall()
+        ]
+
+        if backend == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(INDEXED_FIELDS))
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} ({columns}, rowid) VALUES ({placeholders}, %s)',
+                rows
+            )
+        else:
+            vector = weighted_vector_sql(['%s'] * len(INDEXED_FIELDS))
+            cursor.executemany(f'UPDATE {PARTS_TABLE} SET search_vector = {vector} WHERE id = %s', rows)
+
+
+def part_number_trigrams(value):
+    """pg_trgm-style trigrams of a normalized part number (padded '  key ')"""
+    key = normalize_part_number(value)
+    if not key:
+        return set()
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def part_number_similarity(a, b):
+    """pg_trgm similarity() of two part numbers, computed in Python"""
+    grams_a, grams_b = part_number_trigrams(a), part_number_trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def index_part_number(part):
+    """Refresh the trigram side table rows of one part (not needed on PostgreSQL)"""
+    from .models import PartNumberTrigram
+
+    if get_backend() == 'postgresql':
+        return
+    grams = part_number_trigrams(part.part_number)
+    PartNumberTrigram.objects.filter(part_id=part.pk).delete()
+    PartNumberTrigram.objects.bulk_create([
+        PartNumberTrigram(part_id=part.pk, trigram=gram, gram_count=len(grams))
+        for gram in grams
+    ])
+
+
+def rebuild_part_number_index():
+    """Rebuild the whole trigram side table (after bulk_create and the like)"""
+    from .models import ElectronicPart, PartNumberTrigram
+
+    if get_backend() == 'postgresql':
+        return
+    PartNumberTrigram.objects.all().delete()
+    rows = []
+    for part_id, part_number in ElectronicPart.objects.values_list('id', 'part_number').iterator():
+        grams = part_number_trigrams(part_number)
+        rows.extend(
+            PartNumberTrigram(part_id=part_id, trigram=gram, gram_count=len(grams))
+            for gram in grams
+        )
+    PartNumberTrigram.objects.bulk_create(rows, batch_size=5000)
+
+
+def similar_parts(queryset, query, limit=5, threshold=TRIGRAM_THRESHOLD):
+    """Parts from queryset whose part number is closest to query, best first
+
+    Each returned part carries a ``similarity`` attribute in [0, 1].
+    """
+    from .models import PartNumberTrigram
+
+    key = normalize_part_number(query)
+    if not key:
+        return []
+
+    if get_backend() == 'postgresql':
+        # "%" is the pg_trgm similarity operator; it can use the GIN trigram
+        # index but compares against pg_trgm.similarity_threshold, so set that
+        # to threshold for this transaction
+        with transaction.atomic(using=queryset.db):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(threshold)])
+            hits = RawSQL(f'SELECT id FROM {PARTS_TABLE} WHERE part_number_normalized %% %s', (key,))
+            return list(
+                queryset.filter(pk__in=hits)
+                .annotate(similarity=RawSQL('similarity(part_number_normalized, %s)', (key,)))
+                .filter(similarity__gte=threshold)
+                .order_by('-similarity', 'part_number')[:limit]
+            )
+
+    grams = part_number_trigrams(query)
+    # similarity <= shared / len(grams), so fewer shared grams can never pass
+    min_shared = max(1, math.ceil(threshold * len(grams)))
+    ranked = list(
+        PartNumberTrigram.objects
+        .filter(trigram__in=grams)
+        .values('part_id')
+        .annotate(shared=Count('*'), total=Max('gram_count'))
+        .filter(shared__gte=min_shared)
+        .annotate(similarity=ExpressionWrapper(
+            F('shared') * 1.0 / (len(grams) + F('total') - F('shared')),
+            output_field=FloatField()
+        ))
+        .filter(similarity__gte=threshold)
+        .order_by('-similarity', 'part_id')
+        # Over-fetch so rows filtered out by queryset don't starve the result
+        .values_list('part_id', 'similarity')[:limit * 4]
+    )
+
+    parts = queryset.in_bulk([part_id for part_id, _ in ranked])
+    results = []
+    for part_id, similarity in ranked:
+        part = parts.get(part_id)
+        if part is None:
+            continue
+        part.similarity = similarity
+        results.append(part)
+    return results[:limit]
@@ -0,0 +1,85 @@
+# ============================================================================
+# inventory/seed.py
+# ============================================================================
+#
+# Synthetic catalog used by the benchmark/audit management commands.  Always
+# call it inside a transaction that gets rolled back.
+
+import random
+
+from .models import Category, ElectronicPart
+from . import search
+
+CATEGORY_NAMES = [
+    ('الدوائر المتكاملة', 'Integrated Circuits'),
+    ('المقاومات', 'Resistors'),
+    ('المكثفات', 'Capacitors'),
+    ('المتحكمات', 'Microcontrollers'),
+    ('الحساسات', 'Sensors'),
+    ('الشاشات', 'Displays'),
+    ('المحركات', 'Motors'),
+    ('مزودات الطاقة', 'Power Supplies'),
+    ('الموصلات', 'Connectors'),
+    ('أدوات القياس', 'Measurement Tools'),
+]
+
+PART_NAMES = [
+    ('أردوينو أونو', 'Arduino Uno', 'ARD-UNO'),
+    ('لوحة التجارب', 'Breadboard', 'BB'),
+    ('حساس الموجات فوق الصوتية', 'Ultrasonic Sensor', 'US-HC-SR04'),
+    ('مجموعة مقاومات', 'Resistor Kit', 'RES-KIT'),
+    ('شاشة عرض إل سي دي', 'LCD Display', 'LCD-16x2-HD44780'),
+    ('مكثف كهروكيميائي', 'Electrolytic Capacitor', 'CAP-EL'),
+    ('محرك سيرفو', 'Servo Motor', 'SRV-SG90'),
+    ('حساس الحرارة', 'Temperature Sensor', 'TMP-DS18B20'),
+    ('ترانزستور', 'Transistor', 'TR-2N2222'),
+    ('مرحل كهربائي', 'Relay Module', 'RLY-5V'),
+    ('راسبيري باي', 'Raspberry Pi', 'RPI-4B'),
+    ('مصباح ثنائي باعث للضوء', 'LED', 'LED-5MM'),
+]
+
+CONDITIONS = ['excellent', 'excellent', 'good', 'fair', 'damaged']
+STATUSES = ['available', 'available', 'available', 'borrowed', 'maintenance']
+
+
+def seed_catalog(parts=100000, seed=1, batch_size=5000):
+    """Bulk-create a synthetic catalog and index it; returns the categories"""
+    rng = random.Random(seed)
+
+    categories = []
+    for name_ar, name_en in CATEGORY_NAMES:
+        category = Category(name_ar=name_ar, name_en=name_en)
+        search.set_category_keys(category)
+        categories.append(category)
+    categories = Category.objects.bulk_create(categories)
+
+    batch = []
+    for i in range(parts):
+        name_ar, name_en, prefix = rng.choice(PART_NAMES)
+        total = rng.randint(1, 50)
+        part = ElectronicPart(
+            name_ar=f'{name_ar} {i}',
+            name_en=f'{name_en} {i}',
+            part_number=f'{prefix}-{i:06d}',
+            description_en=f'{name_en} for student projects',
+            category=rng.choice(categories),
+            manufacturer=rng.choice(['Generic', 'Arduino', 'Texas Instruments', 'Adafruit']),
+            total_quantity=total,
+            available_quantity=rng.randint(0, total),
+            minimum_stock=rng.randint(1, 5),
+            condition=rng.choice(CONDITIONS),
+            status=rng.choice(STATUSES),
+            is_active=rng.random() > 0.05,
+        )
+        search.set_part_keys(part)
+        batch.append(part)
+        if len(batch) >= batch_size:
+            ElectronicPart.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ElectronicPart.objects.bulk_create(batch)
+
+    # bulk_create skips the signal handlers that maintain the indexes
+    search.rebuild_index()
+    search.rebuild_part_number_index()
+    return categories
@@ -0,0 +1,215 @@
+# ============================================================================
+# inventory/stock.py
+# ============================================================================
+#
+# Oversell-proof stock reservation.
+#
+# Reading a part, checking can_borrow() and saving the whole row back lets
+# two approvals running at once both pass the check and drive stock
+# negative, or lets one overwrite the other's decrement.  reserve() takes
+# stock with one conditional UPDATE per part instead (ElectronicPart.borrow()
+# goes through it too):
+#
+#     UPDATE inventory_electronicpart
+#        SET available_quantity = available_quantity - n, ...
+#      WHERE id = %s AND available_quantity >= n AND <borrowable>
+#
+# and treats "0 rows updated" as not enough stock.  The check and the
+# decrement are one statement, so the database serializes them.  Units other
+# students hold (inventory.holds) count as taken: the condition is really
+# available_quantity >= n + held by others.
+#
+# Parts are always updated in id order, so two multi-line reservations take
+# their row locks in the same order and can't deadlock.  On backends with
+# SELECT ... FOR UPDATE (PostgreSQL) the rows are locked up front, in that
+# order, before any of them is changed.
+#
+# Batch operations (bulk approvals and returns) allocate against
+# locked_quantities() and then move every part in a single UPDATE with
+# bulk_reserve()/bulk_release(); the same stock condition guards that
+# UPDATE, so a concurrent change makes it raise StockChanged instead of
+# overselling.  Units that come back damaged or not at all leave the
+# inventory with bulk_write_off(), which lowers total_quantity instead.
+#
+# queryset.update() bypasses the save signals: these functions bump the
+# catalog generation and refresh the autocomplete index themselves, on commit.
+# Those hooks are robust: the stock change has committed by then, so a
+# failing cache or index refresh is logged rather than raised to the caller.
+# They also bump the row version, so an ElectronicPart instance loaded
+# before them can't be saved back over the new stock (inventory.versioning).
+
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import autocomplete, catalog, holds, versioning
+
+
+class InsufficientStock(Exception):
+    """A part could not supply the requested quantity"""
+
+    def __init__(self, part_id, quantity):
+        self.part_id = part_id
+        self.quantity = quantity
+        super().__init__(f'Part {part_id}: {quantity} unit(s) not available')
+
+
+class StockChanged(Exception):
+    """Stock moved between locked_quantities() and a bulk update; retry the batch"""
+
+
+def stock_changed(part_ids):
+    """After a queryset.update() of stock: invalidate snapshots and refresh autocomplete"""
+    part_ids = list(part_ids)
+    transaction.on_commit(catalog.bump_generation, robust=True)
+    transaction.on_commit(lambda: autocomplete.index.parts_changed(part_ids), robust=True)
+
+
+def reserve(lines, reference_ids=()):
+    """Take stock for (part_id, quantity) lines, all or nothing
+
+    Lines for the same part are added up.  Holds for reference_ids (the
+    request being approved) are not counted against it; every other active
+    hold is.  Returns {part_id: (previous_quantity, new_quantity)}; raises
+    InsufficientStock (with nothing reserved) if any part can't supply its
+    quantity.
+    """
+    from .models import ElectronicPart
+
+    wanted = defaultdict(int)
+    for part_id, quantity in lines:
+        wanted[part_id] += quantity
+    part_ids = sorted(wanted)
+    if not part_ids:
+        return {}
+
+    db = router.db_for_write(ElectronicPart)
+    parts = ElectronicPart.objects.using(db)
+
+    with transaction.atomic(using=db):
+        if connections[db].features.has_select_for_update:
+            # Lock every row first, lowest id first
+            list(parts.select_for_update().filter(pk__in=part_ids).order_by('pk').values_list('pk', flat=True))
+
+        now = timezone.now()
+        held = holds.held_expression(reference_ids=reference_ids)
+        for part_id in part_ids:
+            quantity = wanted[part_id]
+            updated = parts.can_borrow_qty(quantity).filter(
+                pk=part_id, available_quantity__gte=held + quantity
+            ).update(
+                available_quantity=F('available_quantity') - quantity,
+                # The last unit out marks the part borrowed
+                status=Case(When(available_quantity=quantity, then=Value('borrowed')), default=F('status')),
+                updated_at=now,
+                version=versioning.bump(),
+            )
+            if not updated:
+                raise InsufficientStock(part_id, quantity)
+
+        remaining = dict(parts.filter(pk__in=part_ids).values_list('pk', 'available_quantity'))
+        stock_changed(part_ids)
+
+    return {
+        part_id: (remaining[part_id] + wanted[part_id], remaining[part_id])
+        for part_id in part_ids
+    }
+
+
+def locked_quantities(part_ids, borrowable_only=True):
+    """{part_id: available_quantity} of the (borrowable) parts among part_ids
+
+    Locks the rows (in id order) where the backend supports it; must be
+    called inside transaction.atomic().
+    """
+    from .models import ElectronicPart
+
+    parts = ElectronicPart.objects.borrowable() if borrowable_only else ElectronicPart.objects.all()
+    parts = parts.filter(pk__in=part_ids).order_by('pk')
+    if connections[parts.db].features.has_select_for_update:
+        parts = parts.select_for_update()
+    return dict(parts.values_list('pk', 'available_quantity'))
+
+
+def bulk_reserve(wanted, reference_ids=()):
+    """Take {part_id: quantity} in one UPDATE; StockChanged if any part fell short
+
+    As in reserve(), active holds other than reference_ids' count as taken.
+    """
+    from .models import ElectronicPart
+
+    wanted = {part_id: quantity for part_id, quantity in wanted.items() if quantity}
+    if not wanted:
+        return
+
+    held = holds.held_expression(reference_ids=reference_ids)
+    enough = reduce(or_, (
+        Q(pk=part_id, available_quantity__gte=held + quantity) for part_id, quantity in wanted.items()
+    ))
+    taken = Case(
+        *[When(pk=part_id, then=Value(quantity)) for part_id, quantity in wanted.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+    # The last unit out marks the part borrowed
+    sold_out = [When(pk=part_id, available_quantity=quantity, then=Value('borrowed'))
+                for part_id, quantity in wanted.items()]
+
+    updated = ElectronicPart.objects.borrowable().filter(enough).update(
+        available_quantity=F('available_quantity') - taken,
+        status=Case(*sold_out, default=F('status')),
+        updated_at=timezone.now(),
+        version=versioning.bump(),
+    )
+    if updated != len(wanted):
+        raise StockChanged(f'{len(wanted) - updated} part(s) no longer have the stock')
+    stock_changed(wanted)
+
+
+def bulk_release(returned):
+    """Put {part_id: quantity} back on the shelf in one UPDATE"""
+    from .models import ElectronicPart
+
+    returned = {part_id: quantity for part_id, quantity in returned.items() if quantity}
+    if not returned:
+        return
+
+    given_back = Case(
+        *[When(pk=part_id, then=Value(quantity)) for part_id, quantity in returned.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+    ElectronicPart.objects.filter(pk__in=returned).update(
+        available_quantity=F('available_quantity') + given_back,
+        status=Case(When(status='borrowed', then=Value('available')), default=F('status')),
+        updated_at=timezone.now(),
+        version=versioning.bump(),
+    )
+    stock_changed(returned)
+
+
+def bulk_write_off(lost):
+    """Take {part_id: quantity} of damaged or missing units off total_quantity in one UPDATE
+
+    The units were already off the shelf, so available_quantity stays; the
+    total never drops below it.
+    """
+    from .models import ElectronicPart
+
+    lost = {part_id: quantity for part_id, quantity in lost.items() if quantity}
+    if not lost:
+        return
+
+    written_off = Case(
+        *[When(pk=part_id, then=Value(quantity)) for part_id, quantity in lost.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+    ElectronicPart.objects.filter(pk__in=lost).update(
+        total_quantity=Greatest(F('total_quantity') - written_off, F('available_quantity')),
+        updated_at=timezone.now(),
+        version=versioning.bump(),
+    )
+    stock_changed(lost)
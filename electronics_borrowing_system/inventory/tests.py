@@ -1,3 +1,515 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone, translation
+
+from . import autocomplete, catalog, holds, stock, versioning
+from .models import Category, ElectronicPart, PartNumberTrigram, StockHold
+from .search import (
+    facet_counts, normalize_part_number, normalize_text, rank_by_relevance, ranked_search, search_parts,
+    similar_parts,
+)
+
+
+# The tests clear the cache; never the development one
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchIndexTests(TestCase):
+    """Full-text index is kept in sync with ElectronicPart"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس الموجات فوق الصوتية',
+            name_en='Ultrasonic Sensor HC-SR04',
+            part_number='US-HC-SR04',
+            description_en='Distance measurement sensor using ultrasonic waves',
+            category=self.category,
+            total_quantity=15,
+            available_quantity=12,
+        )
+
+    def search(self, query, **kwargs):
+        return list(search_parts(ElectronicPart.objects.all(), query, **kwargs))
+
+    def test_prefix_match_on_names_and_part_number(self):
+        self.assertEqual(self.search('ultra'), [self.part])
+        self.assertEqual(self.search('sr04'), [self.part])
+        self.assertEqual(self.search('الموجات'), [self.part])
+
+    def test_field_restriction(self):
+        self.assertEqual(self.search('distance'), [self.part])
+        self.assertEqual(self.search('distance', fields=['name_en', 'part_number']), [])
+
+    def test_index_follows_save_and_delete(self):
+        self.part.name_en = 'Rangefinder'
+        self.part.save()
+        self.assertEqual(self.search('ultrasonic', fields=['name_en']), [])
+        self.assertEqual(self.search('rangefinder'), [self.part])
+
+        self.part.delete()
+        self.assertEqual(self.search('rangefinder'), [])
+
+    def test_arabic_spelling_variants_match(self):
+        part = ElectronicPart.objects.create(
+            name_ar='إضاءة مُؤشِّرة',
+            name_en='Indicator LED',
+            part_number='LED-5MM-RED',
+            category=self.category,
+        )
+        self.assertEqual(part.name_ar_normalized, 'اضاءه موشره')
+        self.assertEqual(self.search('اضاءه'), [part])
+        self.assertEqual(self.search('مؤشرة'), [part])
+
+    def test_part_number_and_category_keys(self):
+        self.assertEqual(self.part.part_number_normalized, 'ushcsr04')
+        self.assertEqual(self.search('ushcsr'), [self.part])
+        self.assertEqual(self.search('الحساسات'), [self.part])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PartNumberSimilarityTests(TestCase):
+    """Typo-tolerant part number lookup"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.sonar = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Ultrasonic Sensor', part_number='US-HC-SR04', category=category,
+        )
+        self.lcd = ElectronicPart.objects.create(
+            name_ar='شاشة', name_en='LCD Display', part_number='LCD-16x2-HD44780', category=category,
+        )
+
+    def test_nearest_part_numbers_are_ranked(self):
+        matches = similar_parts(ElectronicPart.objects.all(), 'US-HC-SRO4')
+        self.assertEqual(matches, [self.sonar])
+        self.assertGreaterEqual(matches[0].similarity, 0.5)
+
+        matches = similar_parts(ElectronicPart.objects.all(), 'lcd16x2hd4478')
+        self.assertEqual(matches[0], self.lcd)
+
+    def test_side_table_follows_part_number_changes(self):
+        self.sonar.part_number = 'HC-SR501'
+        self.sonar.save()
+        self.assertEqual(similar_parts(ElectronicPart.objects.all(), 'US-HC-SRO4'), [])
+        self.assertEqual(similar_parts(ElectronicPart.objects.all(), 'HC-SR50l'), [self.sonar])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RelevanceRankingTests(TestCase):
+    """Exact part number > prefix > word > substring, availability breaks ties"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='المحركات', name_en='Motors')
+
+        def part(part_number, name_en, **kwargs):
+            fields = dict(total_quantity=5, available_quantity=5, condition='good', status='available')
+            fields.update(kwargs)
+            return ElectronicPart.objects.create(
+                name_ar='محرك', name_en=name_en, part_number=part_number, category=category, **fields
+            )
+
+        self.word = part('TP-1', 'Tower Pro SG90')
+        self.substring = part('BRK-1', 'Servo Bracket', description_en='Fits sg90 servos')
+        self.damaged_prefix = part('SG90-180', 'Servo 180', condition='damaged')
+        self.prefix = part('SG90-360', 'Servo 360')
+        self.exact = part('SG-90', 'Micro Servo')
+
+    def test_sql_ranking(self):
+        parts = list(ranked_search(ElectronicPart.objects.all(), 'sg90'))
+        self.assertEqual(
+            parts, [self.exact, self.prefix, self.damaged_prefix, self.word, self.substring]
+        )
+        self.assertEqual([p.relevance for p in parts], [110, 85, 75, 60, 35])
+
+    def test_index_ranking_matches_sql(self):
+        index = autocomplete.AutocompleteIndex()
+        index.build()
+        self.assertEqual(
+            [entry.id for entry in index.search('sg90', borrowable_only=False)],
+            [self.exact.id, self.prefix.id, self.damaged_prefix.id, self.word.id],
+        )
+        self.assertEqual([entry.id for entry in index.search('sg90', limit=1)], [self.exact.id])
+
+    def test_index_scores_match_sql(self):
+        index = autocomplete.AutocompleteIndex()
+        index.build()
+        for query in ('360 servo', 'servo 360', 'sg90', 'micro'):
+            sql = dict(rank_by_relevance(ElectronicPart.objects.all(), query).values_list('pk', 'relevance'))
+            for entry in index.search(query, borrowable_only=False):
+                self.assertEqual(
+                    entry.score(normalize_text(query), normalize_part_number(query)), sql[entry.id], query
+                )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BorrowableQuerySetTests(TestCase):
+    """borrowable()/can_borrow_qty() agree with the instance properties"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='المقاومات', name_en='Resistors')
+        variants = [
+            dict(),
+            dict(condition='fair'),
+            dict(status='maintenance'),
+            dict(available_quantity=0),
+            dict(is_active=False),
+            dict(condition='good', available_quantity=2),
+        ]
+        for i, overrides in enumerate(variants):
+            fields = dict(total_quantity=5, available_quantity=5, condition='excellent', status='available')
+            fields.update(overrides)
+            ElectronicPart.objects.create(
+                name_ar=f'مقاومة {i}', name_en=f'Resistor {i}', part_number=f'RES-{i}',
+                category=category, **fields
+            )
+
+    def test_matches_python_rules(self):
+        parts = list(ElectronicPart.objects.all())
+        self.assertEqual(
+            set(ElectronicPart.objects.borrowable()),
+            {part for part in parts if part.is_available_for_borrowing},
+        )
+        self.assertEqual(
+            set(ElectronicPart.objects.can_borrow_qty(3)),
+            {part for part in parts if part.can_borrow(3)},
+        )
+        self.assertEqual(ElectronicPart.objects.borrowable().count(), 2)
+        self.assertEqual(ElectronicPart.objects.can_borrow_qty(3).count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FacetCountsTests(TestCase):
+    """All facets and the total come from one grouped query"""
+
+    def setUp(self):
+        sensors = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        motors = Category.objects.create(name_ar='المحركات', name_en='Motors')
+        for part_number, category, condition, manufacturer, available in [
+            ('US-1', sensors, 'excellent', 'Adafruit', 3),
+            ('US-2', sensors, 'damaged', 'Adafruit', 3),
+            ('US-3', sensors, 'good', 'Generic', 0),
+            ('SRV-1', motors, 'good', 'Generic', 2),
+        ]:
+            ElectronicPart.objects.create(
+                name_ar='قطعة', name_en='Part', part_number=part_number, category=category,
+                condition=condition, manufacturer=manufacturer,
+                total_quantity=3, available_quantity=available,
+            )
+        self.sensors = sensors
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            facets = facet_counts(ElectronicPart.objects.all())
+
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(
+            [(c['name_en'], c['count']) for c in facets['categories']], [('Sensors', 3), ('Motors', 1)]
+        )
+        self.assertEqual(
+            facets['conditions'],
+            [{'value': 'good', 'count': 2}, {'value': 'damaged', 'count': 1},
+             {'value': 'excellent', 'count': 1}],
+        )
+        self.assertEqual(
+            facets['manufacturers'],
+            [{'value': 'Adafruit', 'count': 2}, {'value': 'Generic', 'count': 2}],
+        )
+        self.assertEqual(facets['availability'], {'borrowable': 2, 'unavailable': 2})
+
+    def test_follows_filters(self):
+        queryset = search_parts(ElectronicPart.objects.filter(category=self.sensors), 'us')
+        facets = facet_counts(ranked_search(queryset, 'us'))
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(facets['availability'], {'borrowable': 1, 'unavailable': 2})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AutocompleteIndexTests(TestCase):
+    """In-process autocomplete index answers from memory and follows signals"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name_ar='الشاشات', name_en='Displays')
+        self.lcd = ElectronicPart.objects.create(
+            name_ar='شاشة عرض', name_en='LCD Display 16x2', part_number='LCD-16x2-HD44780',
+            category=self.category, total_quantity=8, available_quantity=5,
+        )
+        self.index = autocomplete.AutocompleteIndex()
+        self.index.build()
+        patcher = mock.patch.object(autocomplete, 'index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ids(self, query):
+        return [entry.id for entry in self.index.search(query)]
+
+    def test_prefix_and_substring_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids('lcd'), [self.lcd.id])
+            self.assertEqual(self.ids('شاشه'), [self.lcd.id])
+            self.assertEqual(self.ids('hd447'), [self.lcd.id])
+            self.assertEqual(self.ids('16x2hd'), [self.lcd.id])
+
+    def test_incremental_updates_from_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lcd.condition = 'damaged'
+            self.lcd.save()
+            oled = ElectronicPart.objects.create(
+                name_ar='شاشة أوليد', name_en='OLED Display', part_number='OLED-128x64',
+                category=self.category,
+            )
+        self.assertEqual(self.ids('display'), [oled.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            oled.delete()
+        self.assertEqual(self.ids('oled'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogSnapshotTests(TestCase):
+    """Snapshots are reused until an inventory change bumps the generation"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Sensor', part_number='SNS-1', category=self.category,
+            total_quantity=4, available_quantity=4,
+        )
+
+    def snapshot(self):
+        return catalog.get_snapshot('names', lambda: list(ElectronicPart.objects.values_list('name_en', flat=True)))
+
+    def test_reused_until_inventory_changes(self):
+        self.assertEqual(self.snapshot(), ['Sensor'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.snapshot(), ['Sensor'])
+
+        generation = catalog.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.part.borrow(1)
+        self.assertGreater(catalog.get_generation(), generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.part.name_en = 'Distance Sensor'
+            self.part.save()
+        self.assertEqual(self.snapshot(), ['Distance Sensor'])
+
+    def test_keyed_by_language(self):
+        with translation.override('ar'):
+            arabic = catalog.snapshot_key('form')
+        with translation.override('en'):
+            english = catalog.snapshot_key('form')
+        self.assertNotEqual(arabic, english)
+
+    def test_generation_survives_eviction(self):
+        generation = catalog.get_generation()
+        cache.delete(catalog.GENERATION_KEY)
+        self.assertGreater(catalog.bump_generation(), generation)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockReservationTests(TransactionTestCase):
+    """Concurrent reservations never take more than is on the shelf"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.parts = [
+            ElectronicPart.objects.create(
+                name_ar=f'حساس {i}', name_en=f'Sensor {i}', part_number=f'SNS-{i}',
+                category=category, total_quantity=10, available_quantity=10,
+            )
+            for i in range(2)
+        ]
+        # Reservations refresh the index on commit; that must not fail them
+        index = autocomplete.AutocompleteIndex()
+        index.build()
+        patcher = mock.patch.object(autocomplete, 'index', index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_threads(self, jobs):
+        """Run each list of lines through stock.reserve in its own thread"""
+        outcomes = []
+        barrier = threading.Barrier(len(jobs))
+
+        def worker(lines):
+            barrier.wait()
+            try:
+                for attempt in range(200):
+                    try:
+                        stock.reserve(lines)
+                        outcomes.append('reserved')
+                        return
+                    except stock.InsufficientStock:
+                        outcomes.append('refused')
+                        return
+                    except OperationalError:
+                        # SQLite lets one writer in at a time; try again
+                        continue
+                outcomes.append('locked out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(lines,)) for lines in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_no_oversell(self):
+        part = self.parts[0]
+        outcomes = self.run_threads([[(part.pk, 1)]] * 25)
+
+        part.refresh_from_db()
+        self.assertEqual(outcomes.count('reserved'), 10)
+        self.assertEqual(outcomes.count('refused'), 15)
+        self.assertEqual(part.available_quantity, 0)
+        self.assertEqual(part.status, 'borrowed')
+
+    def test_multi_line_all_or_nothing(self):
+        first, second = self.parts
+        # Lines arrive in both orders; reserve() always locks in part id order
+        jobs = [[(first.pk, 1), (second.pk, 2)], [(second.pk, 2), (first.pk, 1)]] * 6
+        outcomes = self.run_threads(jobs)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(outcomes.count('reserved'), 5)
+        self.assertEqual(first.available_quantity, 5)
+        self.assertEqual(second.available_quantity, 0)
+
+    def test_reports_previous_and_new_quantities(self):
+        part = self.parts[0]
+        self.assertEqual(stock.reserve([(part.pk, 2), (part.pk, 3)]), {part.pk: (10, 5)})
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve([(part.pk, 6)])
+        part.refresh_from_db()
+        self.assertEqual(part.available_quantity, 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockHoldTests(TestCase):
+    """Active holds count as taken for everyone but their holder"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Sensor', part_number='SNS-1',
+            category=category, total_quantity=10, available_quantity=10,
+        )
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def test_net_availability(self):
+        holds.place(self.alice, [(self.part.pk, 3), (self.part.pk, 1)])
+        holds.place(self.bob, [(self.part.pk, 2)], reference_id='7')
+
+        self.assertEqual(holds.net_available([self.part], holder=self.alice), {self.part.pk: 8})
+        self.assertEqual(holds.net_available([self.part], holder=self.bob), {self.part.pk: 4})
+
+        # Validating again replaces the holder's previous hold
+        holds.place(self.alice, [(self.part.pk, 1)])
+        self.assertEqual(holds.net_available([self.part], holder=self.bob), {self.part.pk: 7})
+
+        # Expired holds stop counting straight away
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(holds.net_available([self.part]), {self.part.pk: 10})
+
+    def test_reserve_honours_other_holds(self):
+        holds.place(self.bob, [(self.part.pk, 8)], reference_id='7')
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve([(self.part.pk, 3)])
+
+        # The request owning the hold can take it
+        self.assertEqual(stock.reserve([(self.part.pk, 8)], reference_ids=['7']), {self.part.pk: (10, 2)})
+        holds.release(['7'])
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_sweep_in_batches(self):
+        holds.place(self.alice, [(self.part.pk, 1)])
+        for i in range(5):
+            holds.place(self.bob, [(self.part.pk, 1)], reference_id=str(i), ttl=timedelta(seconds=-1))
+
+        with self.assertNumQueries(5):  # 2 x (select ids, delete) + the empty batch
+            self.assertEqual(holds.sweep(batch_size=3), 5)
+        self.assertEqual(list(StockHold.objects.values_list('holder__username', flat=True)), ['alice'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VersionedSaveTests(TestCase):
+    """Saves from stale copies of a part fail instead of overwriting"""
+
+    def setUp(self):
+        category = Category.objects.create(name_ar='الحساسات', name_en='Sensors')
+        self.part = ElectronicPart.objects.create(
+            name_ar='حساس', name_en='Sensor', part_number='SNS-1', category=category,
+            total_quantity=10, available_quantity=4, specifications={'pins': 4},
+        )
+
+    def test_stale_save_is_refused(self):
+        first = ElectronicPart.objects.get(pk=self.part.pk)
+        second = ElectronicPart.objects.get(pk=self.part.pk)
+        first.location = 'Cabinet A'
+        first.save()
+
+        second.available_quantity = 9
+        with self.assertRaises(versioning.StaleWrite):
+            second.save()
+        self.assertEqual(second.version, first.version - 1)
+
+        self.part.refresh_from_db()
+        self.assertEqual((self.part.location, self.part.available_quantity), ('Cabinet A', 4))
+
+    def test_save_is_one_conditional_update_with_the_save_signals(self):
+        part = ElectronicPart.objects.get(pk=self.part.pk)
+        part.part_number = 'SNS-2'
+        with CaptureQueriesContext(connection) as captured:
+            part.save()
+        updates = [q['sql'] for q in captured if q['sql'].startswith('UPDATE "inventory_electronicpart"')]
+        self.assertEqual(len(updates), 1)
+
+        # pre_save filled the search keys, post_save refreshed the trigram index
+        self.part.refresh_from_db()
+        self.assertEqual((self.part.part_number_normalized, self.part.version), ('sns2', part.version))
+        self.assertTrue(PartNumberTrigram.objects.filter(part=self.part, trigram='ns2').exists())
+
+    def test_partial_save_writes_derived_keys_and_checks_names(self):
+        self.part.part_number = 'SNS-3'
+        self.part.save(update_fields=['part_number'])
+        self.assertEqual(
+            ElectronicPart.objects.filter(pk=self.part.pk).values_list('part_number_normalized', flat=True).get(),
+            'sns3',
+        )
+        with self.assertRaises(ValueError):
+            self.part.save(update_fields=['no_such_field'])
+
+    def test_stock_updates_bump_the_version(self):
+        stale = ElectronicPart.objects.get(pk=self.part.pk)
+        stock.reserve([(self.part.pk, 1)])
+        with self.assertRaises(versioning.StaleWrite):
+            stale.save(update_fields=['notes'])
+
+    def test_return_retries_on_fresh_values(self):
+        stale = ElectronicPart.objects.get(pk=self.part.pk)
+        stock.reserve([(self.part.pk, 3)])
+        with CaptureQueriesContext(connection) as captured:
+            stale.return_parts(2)
+
+        self.part.refresh_from_db()
+        self.assertEqual(self.part.available_quantity, 3)
+        self.assertEqual(stale.available_quantity, 3)
+
+        # Only the stock columns are written, not the specifications JSON
+        updates = [q['sql'] for q in captured if q['sql'].startswith('UPDATE "inventory_electronicpart"')]
+        self.assertEqual(len(updates), 2)
+        self.assertNotIn('specifications', updates[-1])
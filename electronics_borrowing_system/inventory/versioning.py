@@ -0,0 +1,60 @@
+# ============================================================================
+# inventory/versioning.py
+# ============================================================================
+#
+# Optimistic concurrency for ElectronicPart.
+#
+# Every part row carries a version counter.  Saving an existing part is a
+# compare-and-swap, done in ElectronicPart.save() as
+# objects.filter(pk=..., version=n).update(..., version=n + 1):
+#
+#     UPDATE inventory_electronicpart SET ..., version = version + 1
+#      WHERE id = %s AND version = n
+#
+# so a save made from a copy that someone else changed (or deleted) in the
+# meantime updates nothing and raises StaleWrite instead of silently
+# overwriting their quantities or status.  The stock UPDATEs in inventory.stock bump the
+# version too.
+#
+# save_with_retry() is the usual way to change a part: it applies a change
+# function to the instance, saves only the fields the function names
+# (update_fields, so the large specifications JSON isn't rewritten), and on
+# StaleWrite reloads the row and applies the change again.
+
+from django.db.models import F
+
+# Attempts made by save_with_retry() before giving up
+MAX_ATTEMPTS = 5
+
+
+class StaleWrite(Exception):
+    """The row changed since the instance was loaded; reload and try again"""
+
+    def __init__(self, part_id, version):
+        self.part_id = part_id
+        self.version = version
+        super().__init__(f'Part {part_id} is no longer at version {version}')
+
+
+def bump():
+    """Version expression for queryset.update() calls that change a part"""
+    return F('version') + 1
+
+
+def save_with_retry(part, change, attempts=MAX_ATTEMPTS):
+    """Apply change(part) and save the fields it returns, retrying on StaleWrite
+
+    change mutates the instance and returns the names of the fields it
+    changed; it may be called more than once, each time on freshly loaded
+    values, so it should compute from the instance rather than from values
+    read before.  Returns whatever the last call of change returned.
+    """
+    for attempt in range(attempts):
+        update_fields = change(part)
+        try:
+            part.save(update_fields=update_fields)
+            return update_fields
+        except StaleWrite:
+            if attempt == attempts - 1:
+                raise
+            part.refresh_from_db()